@@ -1,27 +1,135 @@
 #for integrating with various AI services
-#supports groq and huggingface models
+#supports groq, huggingface and local (offline) models
 
 import os
 import json
-import requests
 import time
+import queue
+import threading
+import contextlib
 import click
-from typing import List, Optional, Dict, Any
+import requests
+from typing import List, Optional, Dict, Any, Tuple, Iterator, Callable
 import logging
 
-logging.basicConfig(level=logging.INFO)
+from ai_integration.http_session import get_session, get_timeouts, close_sessions
+from ai_integration.plan_cache import PlanCache, get_plan_cache
+from ai_integration.stream_parser import IncrementalPlanParser
+from ai_integration.response_parser import parse_response
+from ai_integration.prompt_builder import (
+    Example, build_messages, build_instruct_prompt, completion_budget, estimate_tokens, messages_tokens
+)
+from ai_integration.rate_limiter import get_provider_limits, backoff_delay, parse_retry_after
+
 logger = logging.getLogger(__name__)
 
 class AIProvider:
     # BASE class for AI providers
+
+    #env vars that define a provider's configuration
+    # the registry in get_ai_provider() caches one instance per distinct set of values
+    config_vars: Tuple[str, ...] = ()
+
+    name = "base"
+    model = ""
+    temperature = 0.0
+    #the "Using ... for plan generation" banner; off for the copies that generate candidate plans
+    announce = True
     
     def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None, 
-                     feedback: Optional[str] = None) -> List[str]:
+                     feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[str]:
 
         raise NotImplementedError("Subclasses must implement this method")
 
+    def stream_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                    feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> Iterator[str]:
+
+        # yields plan steps as they become available
+        # providers without a streaming endpoint just yield the finished plan
+
+        yield from self.generate_plan(task_description, previous_attempt, feedback, examples)
+
+    def _announce(self, message: str):
+        if self.announce:
+            click.echo(message)
+
+    def _send(self, payload: Dict[str, Any], label: str, stream: bool = False):
+
+        # POSTs a request for HTTP providers through the shared rate limiter and circuit breaker
+        # 429/5xx responses and connection errors are retried with exponential backoff and jitter,
+        # honoring Retry-After; other errors fail fast
+        # for streams only opening the response is retried, once steps flow the caller owns it
+
+        limits = get_provider_limits(self.name)
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        if debug_mode:
+            logger.info(f"Sending {'streaming ' if stream else ''}request to {label} API: {json.dumps(payload, indent=2)}")
+
+        #rough token estimate for the token bucket: ~4 characters per token plus the completion budget
+        parameters = payload.get("parameters", {})
+        estimated_tokens = len(json.dumps(payload)) / 4 + payload.get("max_tokens", parameters.get("max_new_tokens", 0))
+
+        last_error = None
+        for attempt in range(self.max_retries):
+            trial = limits.breaker.before_request(label)
+            try:
+                limits.acquire(estimated_tokens)
+
+                delay = backoff_delay(attempt, self.retry_delay)
+                try:
+                    response = self.session.post(self.api_url, headers=self.headers, json=payload,
+                                                 timeout=self.timeout, stream=stream)
+                except requests.RequestException as e:
+                    limits.breaker.record_failure()
+                    last_error = e
+                    logger.error(f"Error in {label} API request (attempt {attempt+1}/{self.max_retries}): {str(e)}")
+                else:
+                    limits.update_from_headers(response.headers)
+
+                    if response.status_code == 200:
+                        limits.breaker.record_success()
+                        return response
+
+                    error_msg = f"{label} API request failed with status {response.status_code}: {response.text}"
+                    response.close()
+                    logger.error(error_msg)
+                    last_error = Exception(error_msg)
+
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    if response.status_code == 429:
+                        #everyone sharing this provider waits, not just this caller
+                        delay = max(delay, retry_after or 0.0)
+                        limits.requests.pause(delay)
+                    elif response.status_code == 503 and "currently loading" in response.text.lower():
+                        #model is still loading, wait as long as the API estimates
+                        try:
+                            estimated = float(response.json().get("estimated_time", 0))
+                        except (ValueError, AttributeError):
+                            estimated = 0.0
+                        delay = max(delay, retry_after or 0.0, estimated, self.retry_delay * 2)
+                    elif response.status_code >= 500:
+                        limits.breaker.record_failure()
+                        delay = max(delay, retry_after or 0.0)
+                    else:
+                        raise last_error
+            finally:
+                #429s, a loading model, client errors and interruptions neither close nor re-open the
+                # circuit, but a half-open trial that ended that way must not block every later call
+                if trial:
+                    limits.breaker.release_trial()
+
+            if attempt < self.max_retries - 1:
+                time.sleep(delay)
+
+        raise last_error
+
 class GroqProvider(AIProvider):
     # integration with Groq API
+
+    name = "groq"
+
+    config_vars = ("GROQ_API_KEY", "GROQ_MODEL", "GROQ_API_URL", "AI_MAX_RETRIES", "AI_RETRY_DELAY", "AI_TEMPERATURE")
     
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY")
@@ -37,103 +145,91 @@ class GroqProvider(AIProvider):
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.api_url = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+        self.session = get_session()
+        self.timeout = get_timeouts()
     
+    def _build_messages(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                        feedback: Optional[str] = None,
+                        examples: Optional[List[Example]] = None) -> List[Dict[str, str]]:
+
+        #cached system prompt + the task, with the previous attempt and feedback compacted to the prompt budget
+        return build_messages(task_description, previous_attempt, feedback, examples)
+
     def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None, 
-                     feedback: Optional[str] = None) -> List[str]:
+                     feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[str]:
         # generate an execution plan using Groq's API
         
-        click.echo("\nUsing Groq API for plan generation...")
-        #EXTRA: get platform information to include in the prompt
-        import platform
-        system_os = platform.system()
-        is_windows = system_os.lower() == "windows"
-        
-        #creating the system prompt with instructions
-        system_prompt = f"""
-        You are an AI assistant that generates execution plans for tasks on a local computer.
-        The user's operating system is: {system_os}
-        
-        Your task is to break down the user's request into a list of executable commands or steps.
-        
-        Each command should be clear, concise, and executable in a {'Command Prompt or PowerShell' if is_windows else 'terminal'} environment.
-        
-        For file creation tasks, use the special syntax [WRITE_FILE:filename]content[/WRITE_FILE].
-        
-        Platform-specific guidelines:
-        {'- Use Windows commands (dir instead of ls, type instead of cat, etc.)' if is_windows else '- Use standard Unix/Linux shell commands'}
-        {'- Use backslashes for file paths' if is_windows else '- Use forward slashes / for file paths'}
-        {'- For PowerShell-specific commands, consider Command Prompt compatibility' if is_windows else ''}
-        
-        Do not include comments in the commands themselves - only provide executable commands.
-        Do not use placeholders - provide complete, working commands.
-        
-        Format your response as a JSON array of strings, where each string is a command to execute. ALL IN A SINGLE ARRAY, no separate lines. MAKE SURE EVERYTHING IS IN ONE LINE ITSELF, INSIDE ONE ARRAY OF STRINGS, no new lines or line breaks.
-        For code blocks that need to be saved to files, use the format: 
-        `[WRITE_FILE:filename.ext]content[/WRITE_FILE]`
-        """
-        
-        #creating the user prompt
-        user_prompt = f"Task: {task_description}"
-        
-        if previous_attempt and feedback:
-            user_prompt += f"\n\nMy previous plan didn't work:\n"
-            user_prompt += "\n".join([f"- {cmd}" for cmd in previous_attempt])
-            user_prompt += f"\n\nThe issue was: {feedback}\n\nPlease provide a revised plan."
-            
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        self._announce("\nUsing Groq API for plan generation...")
+        messages = self._build_messages(task_description, previous_attempt, feedback, examples)
         
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": completion_budget(messages_tokens(messages), previous_attempt)
+        }
+
         #making the request
-        for attempt in range(self.max_retries):
-            try:
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": self.temperature,
-                    "max_tokens": 1000
-                }
-                
-                debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
-                if debug_mode:
-                    logger.info(f"Sending request to Groq API: {json.dumps(payload, indent=2)}")
-                
-                response = requests.post(self.api_url, headers=self.headers, json=payload)
-                
-                if response.status_code == 200:
-                    response_data = response.json()
-                    plan_text = response_data["choices"][0]["message"]["content"].strip()
-                    
-                    #IMP: parse the plan_text into a list of commands
-                    commands = [cmd.strip() for cmd in plan_text.split('\n') if cmd.strip()]
-                    
-                    if debug_mode:
-                        logger.info(f"Received plan from Groq API: {commands}")
-                    
-                    return commands
-                else:
-                    error_msg = f"Groq API request failed with status {response.status_code}: {response.text}"
-                    logger.error(error_msg)
-                    
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                    else:
-                        raise Exception(error_msg)
-                        
-            except Exception as e:
-                logger.error(f"Error in Groq API request (attempt {attempt+1}/{self.max_retries}): {str(e)}")
-                
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    raise
-        
-        return []  # return empty list if all attempts fail
+        response = self._send(payload, "Groq")
+        response_data = response.json()
+        plan_text = response_data["choices"][0]["message"]["content"].strip()
+
+        #IMP: parse the plan_text into a list of commands
+        parsed = parse_response(plan_text)
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        if debug_mode:
+            logger.info(f"Received plan from Groq API: {parsed.steps}")
+            if parsed.diagnostics:
+                logger.info(f"Groq response diagnostics: {parsed.diagnostics}")
+
+        return parsed.steps
+
+    def stream_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                    feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> Iterator[str]:
+        # stream the plan over server-sent events, yielding each command as soon as it is complete
+
+        self._announce("\nUsing Groq API for plan generation (streaming)...")
+        messages = self._build_messages(task_description, previous_attempt, feedback, examples)
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": completion_budget(messages_tokens(messages), previous_attempt),
+            "stream": True
+        }
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        response = self._send(payload, "Groq", stream=True)
+        parser = IncrementalPlanParser()
+
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield from parser.feed(text)
+
+        yield from parser.close()
+
+        if debug_mode and parser.diagnostics:
+            logger.info(f"Groq stream diagnostics: {parser.diagnostics}")
 
 class HuggingFaceProvider(AIProvider):
     # integration with HuggingFace Inference API
+
+    name = "huggingface"
+
+    config_vars = ("HUGGINGFACE_API_TOKEN", "HUGGINGFACE_MODEL", "AI_MAX_RETRIES", "AI_RETRY_DELAY", "AI_TEMPERATURE")
     
     def __init__(self):
         self.api_key = os.getenv("HUGGINGFACE_API_TOKEN")
@@ -150,150 +246,415 @@ class HuggingFaceProvider(AIProvider):
             "Content-Type": "application/json"
         }
         self.api_url = f"https://api-inference.huggingface.co/models/{self.model}"
+        self.session = get_session()
+        self.timeout = get_timeouts()
     
+    def _build_prompt(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                      feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> str:
+        return build_instruct_prompt(task_description, previous_attempt, feedback, examples)
+
+    @staticmethod
+    def _plan_text(response_data: Any) -> str:
+
+        # the response format depends on the model,
+        #so we handle different formats
+        if isinstance(response_data, list) and len(response_data) > 0:
+            if "generated_text" in response_data[0]:
+                return response_data[0]["generated_text"].strip()
+            return str(response_data[0])
+        elif isinstance(response_data, dict) and "generated_text" in response_data:
+            return response_data["generated_text"].strip()
+        return str(response_data).strip()
+
     def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None, 
-                     feedback: Optional[str] = None) -> List[str]:
+                     feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[str]:
         # generate an execution plan using huggingface's Inference API
         
-        click.echo("\nUsing HuggingFace API for plan generation...")
-
-        import platform
-        system_os = platform.system()
-        is_windows = system_os.lower() == "windows"
-        
-        #system prompt
-        prompt = f"""
-        You are an AI assistant that generates execution plans for tasks on a local computer.
-        The user's operating system is: {system_os}
-        
-        Your task is to break down the user's request into a list of executable commands or steps.
-        
-        Each command should be clear, concise, and executable in a {'Command Prompt or PowerShell' if is_windows else 'terminal'} environment.
-        
-        For file creation tasks, use the special syntax [WRITE_FILE:filename]content[/WRITE_FILE].
-        
-        Platform-specific guidelines:
-        {'- Use Windows commands (dir instead of ls, type instead of cat, etc.)' if is_windows else '- Use standard Unix/Linux shell commands'}
-        {'- Use backslashes for file paths' if is_windows else '- Use forward slashes / for file paths'}
-        {'- For PowerShell-specific commands, consider Command Prompt compatibility' if is_windows else ''}
-        
-        Do not include comments in the commands themselves - only provide executable commands.
-        Do not use placeholders - provide complete, working commands.
-        
-        Format your response as a JSON array of strings, where each string is a command to execute. ALL IN A SINGLE ARRAY, no separate lines. MAKE SURE EVERYTHING IS IN ONE LINE ITSELF, INSIDE ONE ARRAY OF STRINGS, no new lines or line breaks.
-        For code blocks that need to be saved to files, use the format: 
-        `[WRITE_FILE:filename.ext]content[/WRITE_FILE]`
-        """
-        
-        #add task description and feedback if available
-        prompt += f"Task: {task_description}"
-        
-        if previous_attempt and feedback:
-            prompt += f"\n\nMy previous plan didn't work:\n"
-            prompt += "\n".join([f"- {cmd}" for cmd in previous_attempt])
-            prompt += f"\n\nThe issue was: {feedback}\n\nPlease provide a revised plan."
-            
-        prompt += "[/INST]"
+        self._announce("\nUsing HuggingFace API for plan generation...")
+        prompt = self._build_prompt(task_description, previous_attempt, feedback, examples)
         
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "temperature": self.temperature,
+                "max_new_tokens": completion_budget(estimate_tokens(prompt), previous_attempt),
+                "return_full_text": False
+            }
+        }
+
         #make the request
-        for attempt in range(self.max_retries):
+        response = self._send(payload, "HuggingFace")
+        plan_text = self._plan_text(response.json())
+
+        #IMP: parsing the plan_text into a list of commands
+        # code fences, language tags, comments and explanations are dropped by the parser
+        parsed = parse_response(plan_text)
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        if debug_mode:
+            logger.info(f"Received plan from HuggingFace API: {parsed.steps}")
+            if parsed.diagnostics:
+                logger.info(f"HuggingFace response diagnostics: {parsed.diagnostics}")
+
+        return parsed.steps
+
+    def stream_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                    feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> Iterator[str]:
+        # stream tokens from a text-generation-inference backend, yielding each command as soon as it is complete
+
+        self._announce("\nUsing HuggingFace API for plan generation (streaming)...")
+        prompt = self._build_prompt(task_description, previous_attempt, feedback, examples)
+
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "temperature": self.temperature,
+                "max_new_tokens": completion_budget(estimate_tokens(prompt), previous_attempt),
+                "return_full_text": False
+            },
+            "stream": True
+        }
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        response = self._send(payload, "HuggingFace", stream=True)
+        parser = IncrementalPlanParser()
+
+        with response:
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                #models without TGI streaming answer with the full completion in one go
+                yield from parser.feed(self._plan_text(response.json()))
+                yield from parser.close()
+                return
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+
+                chunk = json.loads(line[5:].strip())
+                token = chunk.get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    yield from parser.feed(token["text"])
+
+        yield from parser.close()
+
+        if debug_mode and parser.diagnostics:
+            logger.info(f"HuggingFace stream diagnostics: {parser.diagnostics}")
+
+class LocalModelPool:
+    # parallel llama.cpp contexts over one GGUF model, so several prompts (batch mode workers, candidate
+    # plans) are decoded at the same time instead of queueing behind one context
+    # a context is not thread-safe, each is checked out by one call at a time; the weights are memory-mapped,
+    # so the contexts share them and each only adds its own KV cache
+
+    def __init__(self, contexts: List[Any]):
+        self.size = len(contexts)
+        self._free = queue.Queue()
+        for context in contexts:
+            self._free.put(context)
+
+    @contextlib.contextmanager
+    def context(self):
+        llama = self._free.get()
+        try:
+            yield llama
+        finally:
+            self._free.put(llama)
+
+#in-process models stay loaded for the life of the process, keyed by their load parameters
+_local_models: Dict[Tuple, LocalModelPool] = {}
+_local_models_lock = threading.Lock()
+
+def _load_local_model(model_path: str, threads: int, batch_threads: int, context_size: int, seed: int,
+                      parallel: int = 1) -> LocalModelPool:
+
+    #loads a GGUF model with llama-cpp-python once, as a pool of `parallel` contexts
+
+    key = (model_path, threads, batch_threads, context_size, seed, parallel)
+    with _local_models_lock:
+        if key not in _local_models:
             try:
-                payload = {
-                    "inputs": prompt,
-                    "parameters": {
-                        "temperature": self.temperature,
-                        "max_new_tokens": 1000,
-                        "return_full_text": False
-                    }
-                }
-                
-                debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
-                if debug_mode:
-                    logger.info(f"Sending request to HuggingFace API: {json.dumps(payload, indent=2)}")
-                
-                response = requests.post(self.api_url, headers=self.headers, json=payload)
-                
-                if response.status_code == 200:
-                    response_data = response.json()
-                    
-                    # the response format depends on the model,
-                    #so we handle different formats
-                    if isinstance(response_data, list) and len(response_data) > 0:
-                        if "generated_text" in response_data[0]:
-                            plan_text = response_data[0]["generated_text"].strip()
-                        else:
-                            plan_text = response_data[0]
-                    elif isinstance(response_data, dict) and "generated_text" in response_data:
-                        plan_text = response_data["generated_text"].strip()
-                    else:
-                        plan_text = str(response_data).strip()
-                    
-                    #IMP: parsing the plan_text into a list of commands
-                    # First, removing any markdown code blocks if present
-                    if "```" in plan_text:
-                        code_blocks = plan_text.split("```")
-                        for i in range(1, len(code_blocks), 2):
-                            if i < len(code_blocks):
-                                # getting content after the first line (which might be language specification)
-                                lines = code_blocks[i].strip().split("\n")
-                                if len(lines) > 1:
-                                    code_blocks[i] = "\n".join(lines[1:] if lines[0].lower() in ["bash", "sh", "shell", "cmd", "powershell"] else lines)
-                        plan_text = "".join(code_blocks)
-                    
-                    commands = [cmd.strip() for cmd in plan_text.split('\n') if cmd.strip()]
-                    
-                    # filter out lines that appear to be comments or explanations
-                    commands = [cmd for cmd in commands if not cmd.startswith('#') and not cmd.startswith('//')]
-                    
-                    if debug_mode:
-                        logger.info(f"Received plan from HuggingFace API: {commands}")
-                    
-                    return commands
-                else:
-                    error_msg = f"HuggingFace API request failed with status {response.status_code}: {response.text}"
-                    logger.error(error_msg)
-                    
-                    #if model is still loading, wait longer
-                    if response.status_code == 503 and "currently loading" in response.text.lower():
-                        time.sleep(self.retry_delay * 2)
-                    elif attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                    else:
-                        raise Exception(error_msg)
-                        
-            except Exception as e:
-                logger.error(f"Error in HuggingFace API request (attempt {attempt+1}/{self.max_retries}): {str(e)}")
-                
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    raise
-        
-        return []  # return empty list if all attempts fail
+                from llama_cpp import Llama
+            except ImportError:
+                raise ValueError("LOCAL_BACKEND=llama_cpp requires the llama-cpp-python package")
+
+            started = time.monotonic()
+            contexts = [Llama(model_path=model_path, n_threads=threads, n_threads_batch=batch_threads,
+                              n_ctx=context_size, seed=seed, use_mmap=True, verbose=False)
+                        for _ in range(parallel)]
+            logger.info(f"Loaded local model {model_path} ({parallel} context(s)) in "
+                        f"{time.monotonic() - started:.1f}s")
+            _local_models[key] = LocalModelPool(contexts)
+        return _local_models[key]
+
+class LocalProvider(AIProvider):
+    # offline plan generation, either from an OpenAI-compatible server on localhost
+    # (llama.cpp server, Ollama, vLLM ...) or from a GGUF model loaded in-process with llama-cpp-python
+    # defaults to temperature 0 with a fixed seed so plans are reproducible on CPU
+
+    name = "local"
+
+    config_vars = ("LOCAL_BACKEND", "LOCAL_API_URL", "LOCAL_MODEL", "LOCAL_MODEL_PATH", "LOCAL_THREADS",
+                   "LOCAL_BATCH_THREADS", "LOCAL_CONTEXT_SIZE", "LOCAL_PARALLEL", "LOCAL_SEED",
+                   "LOCAL_TEMPERATURE", "LOCAL_READ_TIMEOUT", "AI_MAX_RETRIES", "AI_RETRY_DELAY")
+
+    def __init__(self):
+        self.backend = os.getenv("LOCAL_BACKEND", "server").lower()
+        self.temperature = float(os.getenv("LOCAL_TEMPERATURE", "0.0"))
+        self.seed = int(os.getenv("LOCAL_SEED", "0"))
+        self.max_retries = int(os.getenv("AI_MAX_RETRIES", "3"))
+        self.retry_delay = float(os.getenv("AI_RETRY_DELAY", "2.0"))
 
+        if self.backend == "server":
+            self.model = os.getenv("LOCAL_MODEL", "local")
+            self.api_url = os.getenv("LOCAL_API_URL", "http://127.0.0.1:8080/v1/chat/completions")
+            self.headers = {"Content-Type": "application/json"}
+            self.session = get_session()
+            #CPU generation is slow, so the read timeout is separate from the remote providers'
+            connect_timeout, _ = get_timeouts()
+            self.timeout = (connect_timeout, float(os.getenv("LOCAL_READ_TIMEOUT", "300")))
+            self.context_tokens = None
+        elif self.backend == "llama_cpp":
+            model_path = os.getenv("LOCAL_MODEL_PATH")
+            if not model_path:
+                raise ValueError("LOCAL_MODEL_PATH environment variable is not set")
+            self.model = os.path.basename(model_path)
+            threads = int(os.getenv("LOCAL_THREADS", str(os.cpu_count() or 4)))
+            batch_threads = int(os.getenv("LOCAL_BATCH_THREADS", str(threads)))
+            context_size = int(os.getenv("LOCAL_CONTEXT_SIZE", "4096"))
+            parallel = max(1, int(os.getenv("LOCAL_PARALLEL", "1")))
+            self.context_tokens = context_size
+            self.llama_pool = _load_local_model(model_path, threads, batch_threads, context_size, self.seed,
+                                                parallel)
+        else:
+            raise ValueError(f"Unknown LOCAL_BACKEND '{self.backend}' (expected 'server' or 'llama_cpp')")
+
+    def _payload(self, messages, stream=False, previous_attempt=None) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "seed": self.seed,
+            "max_tokens": completion_budget(messages_tokens(messages), previous_attempt, self.context_tokens),
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _completion_chunks(self, messages, previous_attempt=None) -> Iterator[str]:
+        #text chunks of a streamed completion from whichever backend is configured
+
+        if self.backend == "llama_cpp":
+            payload = self._payload(messages, previous_attempt=previous_attempt)
+            with self.llama_pool.context() as llama:
+                for chunk in llama.create_chat_completion(
+                        messages=messages, temperature=payload["temperature"],
+                        max_tokens=payload["max_tokens"], stream=True):
+                    text = (chunk["choices"][0].get("delta") or {}).get("content")
+                    if text:
+                        yield text
+            return
+
+        response = self._send(self._payload(messages, stream=True, previous_attempt=previous_attempt), "Local",
+                              stream=True)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+    def _complete(self, messages, previous_attempt=None) -> str:
+        if self.backend == "llama_cpp":
+            payload = self._payload(messages, previous_attempt=previous_attempt)
+            with self.llama_pool.context() as llama:
+                response_data = llama.create_chat_completion(
+                    messages=messages, temperature=payload["temperature"], max_tokens=payload["max_tokens"])
+        else:
+            response_data = self._send(self._payload(messages, previous_attempt=previous_attempt), "Local").json()
+        return response_data["choices"][0]["message"]["content"]
+
+    def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                      feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[str]:
+        # generate an execution plan with the local model
+
+        self._announce(f"\nUsing local model ({self.model}) for plan generation...")
+        #same chat prompt as Groq, local servers speak the same protocol
+        messages = build_messages(task_description, previous_attempt, feedback, examples)
+        plan_text = self._complete(messages, previous_attempt)
+
+        #small local models are less consistent about the single-array format, the parser copes with both
+        parsed = parse_response(plan_text)
+
+        debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+        if debug_mode:
+            logger.info(f"Received plan from local model: {parsed.steps}")
+            if parsed.diagnostics:
+                logger.info(f"Local model response diagnostics: {parsed.diagnostics}")
+
+        return parsed.steps
+
+    def stream_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                    feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> Iterator[str]:
+        # stream the plan, yielding each command as soon as it is complete
+
+        self._announce(f"\nUsing local model ({self.model}) for plan generation (streaming)...")
+        parser = IncrementalPlanParser()
+        messages = build_messages(task_description, previous_attempt, feedback, examples)
+        for text in self._completion_chunks(messages, previous_attempt):
+            yield from parser.feed(text)
+        yield from parser.close()
+
+PROVIDER_CLASSES = {
+    "groq": GroqProvider,
+    "huggingface": HuggingFaceProvider,
+    "local": LocalProvider,
+}
+
+#one cached provider instance per configuration, reused across plans and refinement rounds
+_provider_registry: Dict[Tuple, AIProvider] = {}
+_registry_lock = threading.Lock()
 
 def get_ai_provider() -> AIProvider:
 
     # factory function to create and return the configured AI provider
+    # instances are cached per configuration so headers and the pooled session are built once
 
     provider_name = os.getenv("AI_PROVIDER", "groq").lower()
-    
-    if provider_name == "groq":
-        return GroqProvider()
-    elif provider_name == "huggingface":
-        return HuggingFaceProvider()
-    else:
-        logger.warning(f"Unknown AI provider '{provider_name}'. Defaulting to HuggingFace.")
-        return HuggingFaceProvider()
+
+    if provider_name == "router":
+        return _get_routing_provider()
+
+    provider_class = PROVIDER_CLASSES.get(provider_name)
+    if provider_class is None:
+        raise ValueError(f"Unknown AI provider '{provider_name}' (expected one of: "
+                         f"{', '.join(list(PROVIDER_CLASSES) + ['router'])})")
+
+    key = (provider_name,) + tuple(os.getenv(var) for var in provider_class.config_vars)
+
+    with _registry_lock:
+        provider = _provider_registry.get(key)
+        if provider is None:
+            provider = provider_class()
+            _provider_registry[key] = provider
+        return provider
+
+def _get_routing_provider() -> AIProvider:
+
+    #builds (once per configuration) a RoutingProvider over AI_PROVIDERS, in priority order
+    # providers that cannot be configured (e.g. a missing API key) are left out of the rotation
+
+    from ai_integration.router import RoutingProvider
+
+    names = [name.strip().lower() for name in os.getenv("AI_PROVIDERS", "groq,huggingface").split(",") if name.strip()]
+    key = ("router", os.getenv("AI_HEDGE"), os.getenv("AI_HEDGE_DELAY"))
+    for name in names:
+        provider_class = PROVIDER_CLASSES.get(name)
+        if provider_class is None:
+            raise ValueError(f"Unknown AI provider '{name}' in AI_PROVIDERS")
+        key += (name,) + tuple(os.getenv(var) for var in provider_class.config_vars)
+
+    with _registry_lock:
+        router = _provider_registry.get(key)
+        if router is None:
+            providers = []
+            for name in names:
+                try:
+                    providers.append(PROVIDER_CLASSES[name]())
+                except ValueError as e:
+                    logger.warning(f"Skipping provider '{name}' in router: {str(e)}")
+            router = RoutingProvider(providers)
+            _provider_registry[key] = router
+        return router
+
+def reset_ai_providers():
+
+    #drops cached providers and closes their pooled sessions
+
+    with _registry_lock:
+        _provider_registry.clear()
+    close_sessions()
 
 def generate_plan(task_description: str, previous_attempt: Optional[List[str]] = None, 
-                 feedback: Optional[str] = None) -> List[str]:
+                 feedback: Optional[str] = None, use_cache: bool = True,
+                 on_step: Optional[Callable[[str], None]] = None, candidates: Optional[int] = None,
+                 allow_reuse: bool = True, analyze: Optional[Callable] = None) -> List[str]:
 
     # main fn. that connects the ai_provider.generate_plan to get results
+    # identical requests are served from the on-disk plan cache unless use_cache is False
+    # when on_step is given the plan is streamed and on_step is called with each step as it arrives
+    # a fresh plan (no previous attempt) may reuse or learn from plans that worked for similar tasks,
+    # unless use_cache is False (see plan_retrieval); allow_reuse=False (plans that run without review)
+    # only learns from them
+    # with candidates > 1 (default AI_CANDIDATES) that many plans are requested concurrently and the best
+    # scoring one is used (see plan_candidates); its steps are passed to on_step once it is chosen
+    # analyze(plan) predicts a candidate's failures for scoring, bound by the caller to where the plan will run
 
     try:
         provider = get_ai_provider()
-        return provider.generate_plan(task_description, previous_attempt, feedback)
+
+        cache = get_plan_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = PlanCache.make_key(task_description, provider.name, provider.model,
+                                           provider.temperature, previous_attempt, feedback)
+            cached_plan = cache.get(cache_key)
+            if cached_plan:
+                click.echo("\nUsing cached plan (no API call made)...")
+                if on_step:
+                    for step in cached_plan:
+                        on_step(step)
+                return cached_plan
+
+        examples = None
+        if use_cache and not previous_attempt:
+            from ai_integration.plan_retrieval import find_similar_plans
+
+            reusable, examples = find_similar_plans(task_description, allow_reuse=allow_reuse)
+            if reusable:
+                similarity, similar_task, plan = reusable
+                click.echo(f"\nReusing the plan of an earlier successful run of this task (similarity "
+                           f"{similarity:.2f}, no API call made): {similar_task}")
+                if on_step:
+                    for step in plan:
+                        on_step(step)
+                return plan
+            if examples:
+                click.echo(f"\nIncluding {len(examples)} plan(s) from similar successful tasks as examples...")
+
+        from ai_integration.plan_candidates import describe_candidates, generate_candidates, get_candidate_count
+
+        if candidates is None:
+            candidates = get_candidate_count()
+
+        if candidates > 1:
+            click.echo(f"\nRequesting {candidates} candidate plans concurrently from {provider.name}...")
+            ranked = generate_candidates(provider, task_description, candidates, previous_attempt, feedback,
+                                         examples, analyze)
+            for line in describe_candidates(ranked):
+                click.echo(line)
+            plan = ranked[0].plan if ranked else []
+            if on_step:
+                for step in plan:
+                    on_step(step)
+        elif on_step:
+            plan = []
+            for step in provider.stream_plan(task_description, previous_attempt, feedback, examples):
+                plan.append(step)
+                on_step(step)
+        else:
+            plan = provider.generate_plan(task_description, previous_attempt, feedback, examples)
+
+        if cache is not None and plan:
+            cache.put(cache_key, plan)
+
+        return plan
     except Exception as e:
         logger.error(f"Error generating plan: {str(e)}")
         return []
@@ -0,0 +1,69 @@
+#pooled, keep-alive HTTP sessions shared by the AI providers
+#one session per (pool size, transport retries) config, so every plan
+# and refinement round reuses already-open TCP/TLS connections
+
+import os
+import threading
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_sessions: Dict[Tuple[int, int], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def get_timeouts() -> Tuple[float, float]:
+
+    # (connect, read) timeouts in seconds for every provider request
+    # without these a hung endpoint blocks the CLI forever
+
+    connect_timeout = float(os.getenv("AI_CONNECT_TIMEOUT", "5.0"))
+    read_timeout = float(os.getenv("AI_READ_TIMEOUT", "60.0"))
+    return connect_timeout, read_timeout
+
+def build_session(pool_size: int, transport_retries: int) -> requests.Session:
+
+    # creates a session with a keep-alive connection pool mounted for http and https
+
+    #transport retries only cover connection-level failures (DNS, refused, reset before send)
+    # HTTP status handling stays with the provider's own retry loop
+    retry = Retry(
+        total=transport_retries,
+        connect=transport_retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session() -> requests.Session:
+
+    # returns the shared pooled session for the current configuration
+
+    pool_size = int(os.getenv("AI_POOL_SIZE", "10"))
+    transport_retries = int(os.getenv("AI_TRANSPORT_RETRIES", "2"))
+    key = (pool_size, transport_retries)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = build_session(pool_size, transport_retries)
+            _sessions[key] = session
+        return session
+
+def close_sessions():
+
+    #closes all pooled sessions (used on shutdown and by reset_ai_providers)
+
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,180 @@
+#on-disk, content-addressed cache of generated plans
+#keyed on the normalized task, OS, provider, model, temperature and any refinement context
+#plans that fail or that the user rejects are discarded, so a rerun asks the provider again
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import platform
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Dict
+
+from ai_integration.prompt_builder import normalize_task
+
+class PlanCache:
+    # SQLite-backed plan cache with TTL expiry and LRU size-based eviction
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "key TEXT PRIMARY KEY, plan TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS plans_last_access ON plans(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        #commits (or rolls back) and closes; sqlite3's own context manager never closes the connection
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(task_description: str, provider_name: str, model: str, temperature: float,
+                 previous_attempt: Optional[List[str]] = None, feedback: Optional[str] = None) -> str:
+
+        # hash of everything that can change the generated plan
+
+        key_parts = [
+            normalize_task(task_description),
+            platform.system(),
+            provider_name,
+            model,
+            temperature,
+            previous_attempt or [],
+            feedback or "",
+        ]
+        raw = json.dumps(key_parts, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _bump(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, key: str) -> Optional[List[str]]:
+
+        # returns the cached plan or None, counting the hit/miss
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT plan, created_at FROM plans WHERE key = ?", (key,)).fetchone()
+
+            if row and self.ttl > 0 and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self._bump(conn, "misses")
+                return None
+
+            conn.execute("UPDATE plans SET last_access = ? WHERE key = ?", (now, key))
+            self._bump(conn, "hits")
+            return json.loads(row[0])
+
+    def put(self, key: str, plan: List[str]):
+
+        #stores a plan and evicts least recently used entries past the size limit
+
+        data = json.dumps(plan, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO plans (key, plan, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(conn)
+
+    def discard(self, plan: List[str]) -> int:
+
+        #removes every entry holding this plan (whatever task or refinement it was cached for)
+        # returns how many were removed
+
+        data = json.dumps(plan, ensure_ascii=False)
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM plans WHERE plan = ?", (data,)).rowcount
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM plans").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM plans ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+
+        conn.executemany("DELETE FROM plans WHERE key = ?", victims)
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (len(victims),)
+        )
+
+    def stats(self) -> Dict[str, int]:
+
+        # hit/miss/eviction counters plus current entry count and size
+
+        with self._lock, self._connect() as conn:
+            stats = {"hits": 0, "misses": 0, "evictions": 0}
+            stats.update(dict(conn.execute("SELECT name, value FROM counters").fetchall()))
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM plans").fetchone()
+            stats["entries"] = entries
+            stats["bytes"] = size
+            return stats
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM plans")
+            conn.execute("DELETE FROM counters")
+
+
+_cache: Optional[PlanCache] = None
+_cache_lock = threading.Lock()
+
+def get_plan_cache() -> Optional[PlanCache]:
+
+    # returns the shared plan cache, or None when caching is disabled via PLAN_CACHE_ENABLED
+
+    global _cache
+
+    if os.getenv("PLAN_CACHE_ENABLED", "True").lower() != "true":
+        return None
+
+    path = os.path.expanduser(os.getenv("PLAN_CACHE_PATH", "~/.cache/ai-task-agent/plans.db"))
+
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = PlanCache(
+                path,
+                ttl=float(os.getenv("PLAN_CACHE_TTL", "86400")),
+                max_bytes=int(os.getenv("PLAN_CACHE_MAX_BYTES", str(10 * 1024 * 1024))),
+            )
+        return _cache
+
+def discard_plan(plan: List[str]):
+    #called when a plan failed or was rejected; no-op when caching is disabled
+    cache = get_plan_cache()
+    if cache is not None and plan:
+        cache.discard(plan)
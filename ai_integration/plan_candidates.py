@@ -0,0 +1,185 @@
+#concurrent multi-candidate plan generation
+#several plans are requested at once, from variants of the configured provider (spread temperatures, and
+#for the router each of its providers), so the wall-clock cost is about that of the slowest single call.
+#every candidate is scored without running it and the best one is used; the others are shown with their
+#scores so a defect in one plan costs nothing when another candidate avoids it. the caller supplies the
+#static analysis (bound to the directory the plan will run in) and does the printing
+
+import os
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from ai_integration.plan_parser import validate_command
+from ai_integration.response_parser import parse_steps
+
+logger = logging.getLogger(__name__)
+
+#score weights; a plan starts at 1.0
+UNSAFE_PENALTY = 1.0          #per unsafe command (it cannot run unattended and needs review)
+DIAGNOSTIC_PENALTY = 0.2      #per thing the parser had to drop or repair
+DUPLICATE_PENALTY = 0.1       #per repeated step
+LENGTH_PENALTY = 0.01         #per step, so equal plans favour the shorter one
+FAILURE_PENALTY = 0.5         #times the past failure rate of each command
+CONSENSUS_BONUS = 0.3         #times the share of steps other candidates also proposed
+PREDICTED_FAILURE_PENALTY = 0.5   #per failure the static plan analyzer predicts (0.1 for its warnings)
+
+def get_candidate_count():
+    return max(1, int(os.getenv("AI_CANDIDATES", "1")))
+
+def candidate_temperatures(base: float, count: int) -> List[float]:
+
+    # AI_CANDIDATE_TEMPERATURES when set, otherwise the base temperature first and then alternately
+    # above and below it in steps of 0.3, within [0, 1.5]
+
+    configured = os.getenv("AI_CANDIDATE_TEMPERATURES")
+    if configured:
+        values = [float(value) for value in configured.split(",") if value.strip()]
+        return [values[index % len(values)] for index in range(count)]
+
+    temperatures, offset = [base], 0.3
+    while len(temperatures) < count and offset <= 1.5:
+        temperatures += [round(value, 2) for value in (base + offset, base - offset) if 0.0 <= value <= 1.5]
+        offset += 0.3
+    #past the range, the base temperature is repeated
+    temperatures += [base] * (count - len(temperatures))
+    return temperatures[:count]
+
+def candidate_providers(provider, count: int) -> List:
+
+    # count copies of the configured provider that differ in temperature (and seed, for local models)
+    # a router contributes each of its providers in turn, so candidates also come from different models
+    # copies share the pooled session, rate limiter and any loaded local model
+    # they do not print the provider banner; the caller announces the fan-out once
+
+    sources = list(getattr(provider, "providers", None) or [provider])
+    groups = [[] for _ in sources]
+    variants = []
+    for index in range(count):
+        variant = copy.copy(sources[index % len(sources)])
+        variant.announce = False
+        groups[index % len(sources)].append(variant)
+        variants.append(variant)
+
+    for group in groups:
+        if group:
+            for variant, temperature in zip(group, candidate_temperatures(group[0].temperature, len(group))):
+                variant.temperature = temperature
+    for index, variant in enumerate(variants):
+        if hasattr(variant, "seed"):
+            variant.seed += index
+    return variants
+
+@dataclass
+class Candidate:
+    # one generated plan and how it scored; error is set when the provider call failed
+
+    label: str
+    plan: List[str] = field(default_factory=list)
+    score: float = float("-inf")
+    unsafe: List[str] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+def _command_outcomes(commands):
+    try:
+        from feedback.history import get_history_store
+
+        store = get_history_store()
+        return store.command_outcomes(commands) if store is not None else {}
+    except Exception as e:
+        logger.warning(f"Command history unavailable for scoring: {str(e)}")
+        return {}
+
+def score_candidates(candidates: List[Candidate], analyze: Optional[Callable] = None):
+
+    # scores every candidate that produced a plan, in place
+    # unsafe commands, parser diagnostics, failures analyze predicts, repeated steps and length
+    # count against a plan, commands that failed in earlier runs count against it by their failure rate,
+    # and steps other candidates proposed as well count for it (independent samples agreeing on a step
+    # make it more likely to be right)
+    # analyze(plan) returns a PlanAnalysis, e.g. executor.plan_analyzer.analyze_plan bound to the cwd the
+    # plan will run in; without it predicted failures are not scored
+
+    planned = [candidate for candidate in candidates if candidate.plan]
+    parsed = {id(candidate): parse_steps(candidate.plan) for candidate in planned}
+    outcomes = _command_outcomes([command for result in parsed.values() for command in result.commands])
+
+    for candidate in planned:
+        result = parsed[id(candidate)]
+        score = 1.0
+
+        candidate.unsafe = [command for command in result.commands if not validate_command(command)]
+        score -= UNSAFE_PENALTY * len(candidate.unsafe)
+        if candidate.unsafe:
+            candidate.notes.append(f"{len(candidate.unsafe)} unsafe")
+
+        score -= DIAGNOSTIC_PENALTY * len(result.diagnostics)
+        if result.diagnostics:
+            candidate.notes.append(f"{len(result.diagnostics)} parse issue(s)")
+
+        #unsafe commands are already counted above
+        findings = [finding for finding in (analyze(candidate.plan).findings if analyze else [])
+                    if finding.kind != "unsafe"]
+        predicted = sum(1 for finding in findings if finding.severity == "error")
+        score -= PREDICTED_FAILURE_PENALTY * (predicted + 0.2 * (len(findings) - predicted))
+        if predicted:
+            candidate.notes.append(f"{predicted} predicted failure(s)")
+
+        duplicates = len(candidate.plan) - len(set(candidate.plan))
+        score -= DUPLICATE_PENALTY * duplicates + LENGTH_PENALTY * len(candidate.plan)
+
+        failing = 0.0
+        for command in result.commands:
+            runs, failures = outcomes.get(command, (0, 0))
+            if runs:
+                failing += failures / runs
+        score -= FAILURE_PENALTY * failing
+        if failing:
+            candidate.notes.append(f"failed before ({failing:.1f})")
+
+        others = [set(other.plan) for other in planned if other is not candidate]
+        if others:
+            shared = sum(1 for step in set(candidate.plan) if any(step in other for other in others))
+            score += CONSENSUS_BONUS * shared / max(1, len(set(candidate.plan)))
+
+        candidate.score = score
+
+def generate_candidates(provider, task_description: str, count: int, previous_attempt=None, feedback=None,
+                        examples=None, analyze: Optional[Callable] = None) -> List[Candidate]:
+
+    # requests count plans concurrently and returns them scored, best first
+
+    variants = candidate_providers(provider, count)
+    candidates = [Candidate(label=f"{variant.name}, t={variant.temperature:g}") for variant in variants]
+
+    def request(index):
+        try:
+            candidates[index].plan = variants[index].generate_plan(task_description, previous_attempt, feedback,
+                                                                   examples) or []
+            if not candidates[index].plan:
+                candidates[index].error = "empty plan"
+        except Exception as e:
+            candidates[index].error = str(e)
+
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="ai-candidate") as pool:
+        list(pool.map(request, range(count)))
+
+    score_candidates(candidates, analyze)
+    candidates.sort(key=lambda candidate: -candidate.score)
+    return candidates
+
+def describe_candidates(candidates: List[Candidate]) -> List[str]:
+    #one line per candidate, in rank order, showing how it scored and which one is used
+    lines = []
+    for rank, candidate in enumerate(candidates, 1):
+        if candidate.error:
+            lines.append(f"  {rank}. [{candidate.label}] failed: {candidate.error}")
+            continue
+        notes = f", {', '.join(candidate.notes)}" if candidate.notes else ""
+        chosen = "  <- selected" if rank == 1 else ""
+        lines.append(f"  {rank}. [{candidate.label}] score {candidate.score:.2f}, "
+                     f"{len(candidate.plan)} steps{notes}{chosen}")
+    return lines
@@ -0,0 +1,229 @@
+#typed plan and result model
+#Plan/Step describe what will run, StepResult/PlanResult what happened; all of them are compact
+#__slots__ dataclasses that round-trip through JSON or msgpack, so plans and results can be cached,
+#streamed, diffed and logged without re-parsing strings
+
+import sys
+import json
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+from ai_integration.response_parser import parse_steps, split_write_blocks, sanitize_filename, parse_background_step
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#dataclass(slots=True) needs Python 3.10; older interpreters get regular dataclasses
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+#step kinds
+SHELL = "shell"
+WRITE_FILE = "write_file"
+CD = "cd"
+BACKGROUND = "background"
+
+STEP_KINDS = (SHELL, WRITE_FILE, CD, BACKGROUND)
+
+@dataclass(**_SLOTS)
+class Step:
+    # one unit of a plan
+    # command: the shell command (the inner command for background steps, "cd <dir>" for cd)
+    # path: the file written, or the cd target; content: what a write_file step writes
+    # readiness: {"port": ...} / {"pattern": ...} for background steps
+
+    kind: str
+    command: str = ""
+    path: Optional[str] = None
+    content: Optional[str] = None
+    readiness: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_command(cls, command: str) -> "Step":
+        command = command.strip()
+
+        background = parse_background_step(command)
+        if background:
+            inner_command, readiness = background
+            return cls(BACKGROUND, inner_command, readiness=readiness or None)
+
+        if command.lower() == "cd" or command.lower().startswith("cd "):
+            return cls(CD, command, path=command[3:].strip().strip('"').strip("'") or None)
+
+        return cls(SHELL, command)
+
+    def to_text(self) -> str:
+        #the plan-string form executors, the plan cache and prompts use
+        if self.kind == WRITE_FILE:
+            return f"[WRITE_FILE:{self.path}]{self.content or ''}[/WRITE_FILE]"
+        if self.kind == BACKGROUND:
+            spec = "".join(f":{key}={value}" for key, value in (self.readiness or {}).items())
+            return f"[BACKGROUND{spec}]{self.command}[/BACKGROUND]"
+        return self.command
+
+@dataclass(**_SLOTS)
+class Plan:
+    # ordered steps plus the task they were generated for and any parser diagnostics
+
+    steps: List[Step] = field(default_factory=list)
+    task: Optional[str] = None
+    diagnostics: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_steps(cls, steps: List[str], task: Optional[str] = None) -> "Plan":
+
+        # builds a typed plan from plan strings (what generate_plan returns)
+        # a step mixing [WRITE_FILE] blocks and a command becomes one step per block plus the command
+
+        parsed = parse_steps(steps)
+        plan = cls(task=task, diagnostics=parsed.diagnostics)
+        for text in parsed.steps:
+            command, blocks, _ = split_write_blocks(text)
+            for filename, content in blocks:
+                plan.steps.append(Step(WRITE_FILE, path=sanitize_filename(filename), content=content))
+            if command:
+                plan.steps.append(Step.from_command(command))
+        return plan
+
+    def to_strings(self) -> List[str]:
+        return [step.to_text() for step in self.steps]
+
+    @property
+    def commands(self) -> List[str]:
+        return [step.to_text() for step in self.steps if step.kind != WRITE_FILE]
+
+    @property
+    def file_operations(self) -> Dict[str, str]:
+        return {step.path: step.content or "" for step in self.steps if step.kind == WRITE_FILE}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _to_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Plan":
+        return cls(steps=[Step(**step) for step in data.get("steps", [])],
+                   task=data.get("task"), diagnostics=list(data.get("diagnostics", [])))
+
+    def to_json(self) -> bytes:
+        return dumps_json(self.to_dict())
+
+    @classmethod
+    def from_json(cls, data) -> "Plan":
+        return cls.from_dict(loads_json(data))
+
+    def to_msgpack(self) -> bytes:
+        return dumps_msgpack(self.to_dict())
+
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> "Plan":
+        return cls.from_dict(loads_msgpack(data))
+
+@dataclass(**_SLOTS)
+class StepResult:
+    # outcome of one step
+    # output holds the retained head and tail of the step's output (or its error message);
+    # omitted_chars says how much was cut from the middle, so a truncated result is recognizable
+    # without carrying the full text around
+
+    index: int
+    kind: str
+    command: str
+    success: bool = False
+    exit_code: Optional[int] = None
+    duration: float = 0.0
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    output: str = ""
+    omitted_chars: int = 0
+    timed_out: bool = False
+    skipped: bool = False   #not run again: unchanged since the journaled previous run
+
+    @property
+    def truncated(self) -> bool:
+        return self.omitted_chars > 0
+
+    def summary(self) -> str:
+        #same text execute_plan has always reported for a step
+        if self.kind == WRITE_FILE:
+            return self.output
+        if self.skipped:
+            return f"Command: {self.command} (skipped, unchanged since the previous run)\nSuccess: {self.output}"
+        return f"Command: {self.command} ({self.duration:.2f}s)\n{'Success:' if self.success else 'Error:'} {self.output}"
+
+@dataclass(**_SLOTS)
+class PlanResult:
+    # outcome of a whole plan: file writes first, then commands in plan order
+    # error is set instead of results when the plan was rejected before anything ran
+
+    success: bool = False
+    results: List[StepResult] = field(default_factory=list)
+    duration: float = 0.0
+    error: Optional[str] = None
+
+    def summary(self) -> str:
+        if self.error:
+            return self.error
+        return "\n\n".join(result.summary() for result in self.results)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _to_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PlanResult":
+        return cls(success=data.get("success", False), duration=data.get("duration", 0.0),
+                   results=[StepResult(**result) for result in data.get("results", [])], error=data.get("error"))
+
+    def to_json(self) -> bytes:
+        return dumps_json(self.to_dict())
+
+    @classmethod
+    def from_json(cls, data) -> "PlanResult":
+        return cls.from_dict(loads_json(data))
+
+    def to_msgpack(self) -> bytes:
+        return dumps_msgpack(self.to_dict())
+
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> "PlanResult":
+        return cls.from_dict(loads_msgpack(data))
+
+def _to_dict(obj) -> Dict[str, Any]:
+
+    #compact dict form: fields still at their default are left out, nested models are converted too
+
+    data = {}
+    for model_field in fields(obj):
+        value = getattr(obj, model_field.name)
+        if value == model_field.default:
+            continue
+        if isinstance(value, list):
+            if not value:
+                continue
+            value = [_to_dict(item) if hasattr(item, "__dataclass_fields__") else item for item in value]
+        data[model_field.name] = value
+    return data
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def loads_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_msgpack(data) -> bytes:
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack serialization requires the msgpack package (pip install -e .[msgpack])")
+    return msgpack.packb(data, use_bin_type=True)
+
+def loads_msgpack(data: bytes):
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack serialization requires the msgpack package (pip install -e .[msgpack])")
+    return msgpack.unpackb(data, raw=False)
@@ -0,0 +1,190 @@
+#retrieval of plans that worked for similar tasks
+#successful runs in the run history (feedback/history.py) are indexed by their task description: words and
+#word pairs are hashed into a fixed number of features and weighted by TF-IDF, and a new task is compared by
+#cosine similarity against the tasks of the same language/framework (parse_task_context). a past task with
+#the same words reuses the stored plan without calling a provider (only when someone reviews the plan before it
+#runs); other matches are given to the model as examples. similarity alone is not enough for reuse: "average of
+#the price column" and "maximum of the price column" score above 0.9 and need different plans
+
+import os
+import re
+import math
+import zlib
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from ai_integration.task_context import parse_task_context
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+#hashed feature space; collisions only cost a little precision
+FEATURE_DIMS = 1 << 14
+
+#successful plans kept in the index, most recent first
+INDEX_LIMIT = 2000
+
+#words that say nothing about what a task is
+STOPWORDS = frozenset((
+    "a", "an", "and", "the", "to", "of", "in", "on", "for", "with", "that", "this", "it", "is", "be", "me",
+    "my", "i", "please", "can", "you", "using", "use", "make", "some", "then", "from", "into", "as", "at",
+))
+
+_WORD = re.compile(r"[a-z0-9_.+#-]+")
+
+def get_retrieval_settings():
+
+    # (enabled, reuse threshold, example threshold, number of examples)
+
+    enabled = os.getenv("PLAN_RETRIEVAL_ENABLED", "True").lower() == "true"
+    reuse = float(os.getenv("PLAN_REUSE_THRESHOLD", "0.9"))
+    example = float(os.getenv("PLAN_EXAMPLE_THRESHOLD", "0.3"))
+    count = int(os.getenv("PLAN_EXAMPLES", "2"))
+    return enabled, reuse, example, count
+
+def _tokens(task: str) -> List[str]:
+    words = [word.strip(".-") for word in _WORD.findall(task.lower())]
+    return [word for word in words if word and word not in STOPWORDS]
+
+def task_features(task: str) -> Counter:
+
+    #hashed term counts of a task: each word and each pair of neighbouring words
+
+    words = _tokens(task)
+    terms = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    return Counter(zlib.crc32(term.encode("utf-8")) % FEATURE_DIMS for term in terms)
+
+def _compatible(query: Dict, candidate: Dict) -> bool:
+    #a framework or language named by both tasks has to be the same
+    for key in ("framework", "language"):
+        if query[key] and candidate[key] and query[key] != candidate[key]:
+            return False
+    return True
+
+class PlanIndex:
+    # TF-IDF vectors over hashed task features, searched by cosine similarity
+    # stored as an inverted index (feature -> rows and weights), so memory grows with the number of terms
+    # rather than tasks x FEATURE_DIMS; the postings are NumPy arrays when NumPy is installed (same scores)
+
+    def __init__(self, entries: List[Tuple[str, List[str]]]):
+        self.entries = entries
+        self.contexts = [parse_task_context(task) for task, _ in entries]
+
+        features = [task_features(task) for task, _ in entries]
+        document_frequency = Counter()
+        for counts in features:
+            document_frequency.update(counts.keys())
+        total = len(entries)
+        self.idf = {feature: math.log((1 + total) / (1 + frequency)) + 1
+                    for feature, frequency in document_frequency.items()}
+
+        postings: Dict[int, Tuple[List[int], List[float]]] = {}
+        for row, counts in enumerate(features):
+            for feature, weight in self._vector(counts).items():
+                rows, weights = postings.setdefault(feature, ([], []))
+                rows.append(row)
+                weights.append(weight)
+        if numpy is not None:
+            postings = {feature: (numpy.array(rows, dtype=numpy.int32), numpy.array(weights, dtype=numpy.float32))
+                        for feature, (rows, weights) in postings.items()}
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _vector(self, counts: Counter) -> Dict[int, float]:
+
+        #unit-length TF-IDF vector; features never seen in the index carry no weight
+
+        vector = {feature: (1 + math.log(count)) * self.idf[feature]
+                  for feature, count in counts.items() if feature in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {feature: weight / norm for feature, weight in vector.items()} if norm else {}
+
+    def search(self, task: str, limit: int = 3, min_score: float = 0.0) -> List[Tuple[float, str, List[str]]]:
+
+        # [(similarity, task, plan)] of the most similar indexed tasks, best first
+
+        query = self._vector(task_features(task))
+        if not query or not self.entries:
+            return []
+
+        #dot products with every indexed task that shares a feature with the query
+        if numpy is not None:
+            totals = numpy.zeros(len(self.entries), dtype=numpy.float32)
+            for feature, weight in query.items():
+                rows, weights = self.postings[feature]
+                totals[rows] += weight * weights
+            candidates = [(float(totals[row]), row) for row in numpy.flatnonzero(totals)]
+        else:
+            totals = {}
+            for feature, weight in query.items():
+                for row, row_weight in zip(*self.postings[feature]):
+                    totals[row] = totals.get(row, 0.0) + weight * row_weight
+            candidates = [(score, row) for row, score in totals.items()]
+
+        context = parse_task_context(task)
+        scored = [(score, row) for score, row in candidates
+                  if score >= min_score and _compatible(context, self.contexts[row])]
+        scored.sort(key=lambda item: -item[0])
+        return [(score, *self.entries[row]) for score, row in scored[:limit]]
+
+_index: Optional[PlanIndex] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+def get_plan_index() -> Optional[PlanIndex]:
+
+    # the index over the run history's successful plans, rebuilt when new runs have been recorded
+    # None when history is disabled
+
+    global _index, _index_version
+
+    from feedback.history import get_history_store
+
+    store = get_history_store()
+    if store is None:
+        return None
+
+    with _index_lock:
+        version = (store.path, store.successful_plans_version())
+        if _index is None or version != _index_version:
+            _index = PlanIndex(store.successful_plans(INDEX_LIMIT))
+            _index_version = version
+        return _index
+
+def same_words(first: str, second: str) -> bool:
+    #the same words, ignoring order, case and stopwords; the only case a past plan is reused as it is
+    return set(_tokens(first)) == set(_tokens(second))
+
+def find_similar_plans(task: str, allow_reuse: bool = True) -> Tuple[Optional[Tuple[float, str, List[str]]],
+                                                                     List[Tuple[str, List[str]]]]:
+
+    # returns (reusable, examples) for a fresh plan request
+    # reusable is the (similarity, task, plan) of a past task with the same words and at least
+    # PLAN_REUSE_THRESHOLD similar, so its plan can run as is; callers that execute plans without review pass
+    # allow_reuse=False. examples are (task, plan) pairs worth showing to the model; both are empty when
+    # retrieval is off
+
+    enabled, reuse_threshold, example_threshold, count = get_retrieval_settings()
+    if not enabled:
+        return None, []
+
+    try:
+        index = get_plan_index()
+    except Exception as e:
+        logger.warning(f"Plan retrieval unavailable: {str(e)}")
+        return None, []
+    if index is None:
+        return None, []
+
+    matches = index.search(task, limit=max(1, count), min_score=example_threshold)
+    if allow_reuse and matches and matches[0][0] >= reuse_threshold and same_words(task, matches[0][1]):
+        return matches[0], []
+    return None, [(match_task, plan) for _, match_task, plan in matches[:count]]
@@ -0,0 +1,218 @@
+#shared prompt construction for all providers
+#the platform-specific system prompt is built once per process; refinement context (the previous plan and
+#the feedback or error output) is compacted to a token budget, and the completion budget (max_tokens) is
+#sized from what the prompt leaves of the context window. plans that worked for similar tasks can be
+#included as examples for a fresh plan
+
+import os
+import re
+import json
+import platform
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from ai_integration.stream_parser import WRITE_FILE_OPEN, WRITE_FILE_CLOSE
+
+#rough characters per token for English text and shell commands; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+#what a plan step costs at most in a refinement prompt; longer steps (file contents) keep head and tail
+STEP_CHAR_LIMIT = 400
+
+#a past (task, plan) pair shown to the model as an example
+Example = Tuple[str, List[str]]
+
+def normalize_task(task: str) -> str:
+    #collapses whitespace; equivalent task strings then share a plan cache key
+    return " ".join(task.split())
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def get_prompt_budget():
+    #tokens the previous attempt and the feedback may take together
+    return int(os.getenv("AI_PROMPT_BUDGET_TOKENS", "1500"))
+
+@lru_cache(maxsize=None)
+def get_system_prompt(system_os: Optional[str] = None) -> str:
+
+    #instructions shared by every provider, built once per operating system
+
+    system_os = system_os or platform.system()
+    is_windows = system_os.lower() == "windows"
+
+    lines = [
+        "You are an AI assistant that generates execution plans for tasks on a local computer.",
+        f"The user's operating system is: {system_os}",
+        "",
+        "Your task is to break down the user's request into a list of executable commands or steps.",
+        f"Each command should be clear, concise, and executable in a "
+        f"{'Command Prompt or PowerShell' if is_windows else 'terminal'} environment.",
+        "",
+        "Platform-specific guidelines:",
+    ]
+    if is_windows:
+        lines += ["- Use Windows commands (dir instead of ls, type instead of cat, etc.)",
+                  "- Use backslashes for file paths",
+                  "- For PowerShell-specific commands, consider Command Prompt compatibility"]
+    else:
+        lines += ["- Use standard Unix/Linux shell commands",
+                  "- Use forward slashes / for file paths"]
+    lines += [
+        "",
+        "Do not include comments in the commands themselves - only provide executable commands.",
+        "Do not use placeholders - provide complete, working commands.",
+        "",
+        "Format your response as a JSON array of strings, where each string is a command to execute. "
+        "ALL IN A SINGLE ARRAY, no separate lines. MAKE SURE EVERYTHING IS IN ONE LINE ITSELF, "
+        "INSIDE ONE ARRAY OF STRINGS, no new lines or line breaks.",
+        "For code blocks that need to be saved to files, use the format: "
+        "`[WRITE_FILE:filename.ext]content[/WRITE_FILE]`",
+        "For commands that keep running (servers, watchers), use the format: "
+        "`[BACKGROUND:port=8000]command[/BACKGROUND]` or "
+        "`[BACKGROUND:pattern=text printed when ready]command[/BACKGROUND]`",
+    ]
+    return "\n".join(lines)
+
+def _clip(text: str, limit: int) -> str:
+    #keeps the head and tail of text, marking what was cut
+    if len(text) <= limit:
+        return text
+    half = max(1, (limit - 30) // 2)
+    return f"{text[:half]} ...[{len(text) - 2 * half} chars omitted]... {text[-half:]}"
+
+def compact_steps(steps: List[str], char_budget: int) -> List[str]:
+
+    # shortens a previous plan for a refinement prompt
+    # duplicate steps are dropped, file contents are cut to head/tail (the model rewrites files anyway),
+    # and if the plan is still over budget, steps from the middle are replaced by a marker
+
+    seen, compacted = set(), []
+    for step in steps:
+        if step in seen:
+            continue
+        seen.add(step)
+        if step.startswith(WRITE_FILE_OPEN) and step.endswith(WRITE_FILE_CLOSE):
+            name_end = step.find("]")
+            content = step[name_end + 1:-len(WRITE_FILE_CLOSE)]
+            step = step[:name_end + 1] + _clip(content, STEP_CHAR_LIMIT) + WRITE_FILE_CLOSE
+        else:
+            step = _clip(step, STEP_CHAR_LIMIT)
+        compacted.append(step)
+
+    total = sum(len(step) + 3 for step in compacted)
+    if total <= char_budget or len(compacted) <= 2:
+        return compacted
+
+    #keep the first and last steps (setup and the step that usually failed), drop from the middle
+    head, tail, used = [], [], 40
+    front, back = 0, len(compacted) - 1
+    while front <= back:
+        take_front = len(head) <= len(tail)
+        step = compacted[front] if take_front else compacted[back]
+        if used + len(step) + 3 > char_budget:
+            break
+        used += len(step) + 3
+        if take_front:
+            head.append(step)
+            front += 1
+        else:
+            tail.append(step)
+            back -= 1
+    return head + [f"... ({back - front + 1} steps omitted) ..."] + list(reversed(tail))
+
+def compact_feedback(feedback: str, char_budget: int) -> str:
+
+    # shortens feedback that may carry command output
+    # repeated lines (progress bars, identical warnings) are collapsed with a count, then the text is cut
+    # to its head and tail, where the failing command and the final error usually are
+
+    lines, counts = [], {}
+    for line in feedback.splitlines():
+        key = re.sub(r"\d+", "#", line.strip())
+        if key and key in counts:
+            counts[key] += 1
+            continue
+        counts[key] = 1
+        lines.append((key, line.rstrip()))
+
+    text = "\n".join(line + (f"  (repeated {counts[key]}x)" if counts.get(key, 1) > 1 else "")
+                     for key, line in lines)
+    return _clip(text, char_budget)
+
+def format_examples(examples: List[Example], char_budget: int) -> str:
+
+    # past tasks and their plans, in the response format, sharing char_budget between them
+
+    per_example = max(200, char_budget // len(examples))
+    parts = ["Plans that worked for similar tasks (adapt them to this task, do not copy them blindly):"]
+    for example_task, example_plan in examples:
+        steps = compact_steps(example_plan, per_example - len(example_task))
+        parts.append(f"Task: {example_task}\nPlan: {json.dumps(steps, ensure_ascii=False)}")
+    return "\n\n".join(parts)
+
+def build_user_prompt(task_description: str, previous_attempt: Optional[List[str]] = None,
+                      feedback: Optional[str] = None, budget_tokens: Optional[int] = None,
+                      examples: Optional[List[Example]] = None) -> str:
+
+    # the task, plus the previous plan and what went wrong when refining, within budget_tokens
+    # examples are only used for a fresh plan; a refinement has the previous plan as context instead
+
+    if budget_tokens is None:
+        budget_tokens = get_prompt_budget()
+    char_budget = budget_tokens * CHARS_PER_TOKEN
+
+    prompt = f"Task: {task_description}"
+    if not (previous_attempt and feedback):
+        if examples:
+            prompt = f"{format_examples(examples, char_budget)}\n\n{prompt}"
+        return prompt
+
+    #feedback is short when a person wrote it; executor output gets up to half the budget,
+    # the previous plan gets the rest
+    feedback_text = compact_feedback(feedback, max(200, char_budget // 2))
+    steps = compact_steps(previous_attempt, max(200, char_budget - len(feedback_text)))
+
+    prompt += "\n\nMy previous plan didn't work:\n"
+    prompt += "\n".join(f"- {step}" for step in steps)
+    prompt += f"\n\nThe issue was: {feedback_text}\n\nPlease provide a revised plan."
+    return prompt
+
+def build_messages(task_description: str, previous_attempt: Optional[List[str]] = None,
+                   feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[Dict[str, str]]:
+    #chat-style prompt (Groq, local OpenAI-compatible servers)
+    return [
+        {"role": "system", "content": get_system_prompt()},
+        {"role": "user", "content": build_user_prompt(task_description, previous_attempt, feedback,
+                                                      examples=examples)},
+    ]
+
+def build_instruct_prompt(task_description: str, previous_attempt: Optional[List[str]] = None,
+                          feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> str:
+    #single-string prompt for instruct models (HuggingFace)
+    user_prompt = build_user_prompt(task_description, previous_attempt, feedback, examples=examples)
+    return f"{get_system_prompt()}\n\n{user_prompt}[/INST]"
+
+def completion_budget(prompt_tokens: int, previous_attempt: Optional[List[str]] = None,
+                      context_tokens: Optional[int] = None) -> int:
+
+    # max_tokens for a plan completion
+    # a refined plan is usually about as long as the previous one, so twice its size is asked for
+    # (at least AI_MIN_OUTPUT_TOKENS, at most AI_MAX_OUTPUT_TOKENS), within what the prompt leaves
+    # of the model's context window
+
+    minimum = int(os.getenv("AI_MIN_OUTPUT_TOKENS", "1000"))
+    maximum = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "4096"))
+    if context_tokens is None:
+        context_tokens = int(os.getenv("AI_CONTEXT_TOKENS", "8192"))
+
+    wanted = minimum
+    if previous_attempt:
+        wanted = max(minimum, 2 * sum(estimate_tokens(step) + 2 for step in previous_attempt))
+
+    available = context_tokens - prompt_tokens - 64
+    return max(256, min(wanted, maximum, available))
+
+def messages_tokens(messages: List[Dict[str, str]]) -> int:
+    #a few tokens of framing per message on top of the content
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
@@ -0,0 +1,240 @@
+#client-side rate limiting, backoff and circuit breaking for the AI providers
+#everything here is thread-safe, and the token bucket can also be awaited from asyncio code
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+class CircuitOpenError(Exception):
+    # raised instead of calling a provider whose circuit breaker is open
+    pass
+
+class TokenBucket:
+    # classic token bucket: `rate` tokens per second refill up to `capacity`
+    # callers reserve tokens up front (the level may go negative) and sleep for the returned wait,
+    # so concurrent callers queue fairly without holding the lock while sleeping
+    # a rate of 0 means unlimited
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+
+        # takes `amount` tokens and returns how many seconds the caller must wait before using them
+
+        with self._lock:
+            now = time.monotonic()
+            blocked = max(0.0, self._blocked_until - now)
+            if self.rate <= 0:
+                return blocked
+
+            self._refill(now)
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, blocked)
+
+    def acquire(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        #nobody gets tokens for the next `seconds` (e.g. after a 429 with Retry-After)
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def sync(self, remaining: Optional[float] = None, limit: Optional[float] = None, window: float = 60.0):
+
+        #aligns the bucket with what the server reports
+        # a per-window limit also tunes the refill rate when none was configured
+
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit and self.rate <= 0:
+                self.rate = limit / window
+                self.capacity = limit
+                self._tokens = limit
+            if remaining is not None:
+                self._tokens = min(self._tokens, remaining)
+
+class CircuitBreaker:
+    # opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds,
+    # then lets a single trial call through (half-open); a success closes it again
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self, label: str = "provider") -> bool:
+        #raises CircuitOpenError when the call may not go out; returns True when it is the half-open trial
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                raise CircuitOpenError(f"Circuit breaker for {label} is open after {self.failures} consecutive failures")
+            if state == "half-open":
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        #the trial ended without saying anything about the provider's health (rate limited, client error,
+        # interrupted); the next call becomes the trial instead
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+
+    #parses rate limit reset values such as "7.66s", "2m59.56s", "1h2m", "500ms" or "12"
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total = 0.0
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    for number, unit in parts:
+        total += float(number) * {"ms": 0.001, "h": 3600, "m": 60, "s": 1}[unit]
+    return total
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+
+    #Retry-After is either a number of seconds or an HTTP date
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base: float, cap: Optional[float] = None) -> float:
+
+    #exponential backoff with full jitter: uniform(0, min(cap, base * 2^attempt))
+
+    if cap is None:
+        cap = float(os.getenv("AI_BACKOFF_MAX", "30"))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class ProviderLimits:
+    # request and token buckets plus a circuit breaker for one provider, shared by every caller
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 failure_threshold: int, reset_timeout: float):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def acquire(self, estimated_tokens: float = 0.0) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, estimated_tokens: float = 0.0) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def update_from_headers(self, headers):
+
+        #self-tunes from x-ratelimit-* headers (Groq / OpenAI style)
+        # remaining counts cap the local buckets; an exhausted window pauses them until it resets
+
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+
+            try:
+                remaining = float(remaining) if remaining is not None else None
+                #token limits are per minute for both Groq and OpenAI, request limits may be per day
+                limit = float(limit) if (limit is not None and kind == "tokens") else None
+            except ValueError:
+                continue
+
+            bucket.sync(remaining=remaining, limit=limit)
+            if remaining is not None and remaining <= 0 and reset:
+                bucket.pause(reset)
+
+_limits: Dict[str, ProviderLimits] = {}
+_limits_lock = threading.Lock()
+
+def get_provider_limits(provider_name: str) -> ProviderLimits:
+
+    # returns the shared limits for a provider, configured from the environment on first use
+    # <PROVIDER>_RATE_LIMIT_RPM (e.g. LOCAL_RATE_LIMIT_RPM=0) overrides AI_RATE_LIMIT_RPM for one provider
+
+    with _limits_lock:
+        limits = _limits.get(provider_name)
+        if limits is None:
+            limits = ProviderLimits(
+                requests_per_minute=float(os.getenv(f"{provider_name.upper()}_RATE_LIMIT_RPM",
+                                                    os.getenv("AI_RATE_LIMIT_RPM", "30"))),
+                tokens_per_minute=float(os.getenv("AI_RATE_LIMIT_TPM", "0")),
+                failure_threshold=int(os.getenv("AI_CIRCUIT_FAILURES", "5")),
+                reset_timeout=float(os.getenv("AI_CIRCUIT_RESET", "30")),
+            )
+            _limits[provider_name] = limits
+        return limits
@@ -0,0 +1,251 @@
+#single-pass parsing of plan completions into a typed plan
+#the raw text goes through the same tokenizer the streaming path uses (IncrementalPlanParser),
+#then each step is split into its shell command and [WRITE_FILE] blocks exactly once
+
+import os
+import re
+import sys
+import json
+import time
+import random
+from typing import Dict, List, Optional, Tuple
+
+from ai_integration.stream_parser import IncrementalPlanParser, WRITE_FILE_OPEN, WRITE_FILE_CLOSE
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_corpus.json")
+
+#[BACKGROUND]cmd[/BACKGROUND], [BACKGROUND:port=8000]cmd[/BACKGROUND] or [BACKGROUND:pattern=Running on]cmd[/BACKGROUND]
+BACKGROUND_PATTERN = re.compile(r'^\[BACKGROUND(?::([^\]]*))?\](.*)\[/BACKGROUND\]$', re.DOTALL)
+
+class ParsedPlan:
+    # steps: plan steps as the model wrote them ([WRITE_FILE]/[BACKGROUND] markup kept), what
+    #        generate_plan returns and the plan cache stores
+    # commands: shell commands left once file blocks are taken out, in plan order
+    # file_operations: {sanitized filename: content}
+    # diagnostics: what the parser dropped or could not make sense of
+
+    def __init__(self, steps=None, commands=None, file_operations=None, diagnostics=None):
+        self.steps: List[str] = steps or []
+        self.commands: List[str] = commands or []
+        self.file_operations: Dict[str, str] = file_operations or {}
+        self.diagnostics: List[str] = diagnostics or []
+
+    def __repr__(self):
+        return (f"ParsedPlan(steps={len(self.steps)}, commands={len(self.commands)}, "
+                f"files={len(self.file_operations)}, diagnostics={len(self.diagnostics)})")
+
+def sanitize_filename(filename: str) -> str:
+
+    #keeps file writes inside the working directory
+    # absolute paths and paths escaping upwards are reduced to their basename
+
+    clean_filename = filename.strip().replace('\\', os.sep).replace('/', os.sep)
+    if os.path.isabs(clean_filename):
+        return os.path.basename(clean_filename)
+
+    norm_path = os.path.normpath(clean_filename)
+    if norm_path.startswith('..'):
+        return os.path.basename(norm_path)
+    return norm_path
+
+def split_write_blocks(step: str) -> Tuple[str, List[Tuple[str, str]], Optional[str]]:
+
+    #splits a step into (remaining command, [(filename, content)], diagnostic) in one left-to-right scan
+    # an unclosed block is left in the command, as the old regex did
+
+    blocks, remainder = [], []
+    position = 0
+    while True:
+        start = step.find(WRITE_FILE_OPEN, position)
+        if start == -1:
+            break
+        name_end = step.find("]", start + len(WRITE_FILE_OPEN))
+        close = step.find(WRITE_FILE_CLOSE, name_end + 1) if name_end != -1 else -1
+        if close == -1:
+            remainder.append(step[position:])
+            return " ".join(remainder).strip(), blocks, "unclosed [WRITE_FILE] block left in command"
+
+        remainder.append(step[position:start])
+        blocks.append((step[start + len(WRITE_FILE_OPEN):name_end], step[name_end + 1:close]))
+        position = close + len(WRITE_FILE_CLOSE)
+
+    remainder.append(step[position:])
+    return " ".join(piece.strip() for piece in remainder if piece.strip()), blocks, None
+
+def parse_background_step(command):
+
+    #returns (inner_command, readiness) for a [BACKGROUND] step, or None for a normal command
+    # readiness is a dict such as {"port": 8000} or {"pattern": "Running on"}
+
+    match = BACKGROUND_PATTERN.match(command.strip())
+    if not match:
+        return None
+
+    readiness = {}
+    spec = (match.group(1) or "").strip()
+    if spec:
+        key, _, value = spec.partition("=")
+        key = key.strip().lower()
+        if key == "port" and value.strip().isdigit():
+            readiness["port"] = int(value.strip())
+        elif key == "pattern" and value.strip():
+            readiness["pattern"] = value.strip()
+    return match.group(2).strip(), readiness
+
+def _classify(steps: List[str], diagnostics: List[str]) -> ParsedPlan:
+    plan = ParsedPlan(steps=steps, diagnostics=diagnostics)
+    for step in steps:
+        command, blocks, diagnostic = split_write_blocks(step)
+        if diagnostic:
+            plan.diagnostics.append(diagnostic)
+        for filename, content in blocks:
+            plan.file_operations[sanitize_filename(filename)] = content
+        if command:
+            plan.commands.append(command)
+    return plan
+
+def parse_response(text: str) -> ParsedPlan:
+
+    # parses a whole completion: JSON arrays (also split over lines or after a lead-in),
+    # fenced code blocks, numbered/bulleted lines and multi-line [WRITE_FILE] blocks
+
+    #well-formed output (one JSON array of strings, as the prompts ask for) is decoded by the C json parser
+    stripped = text.strip()
+    if stripped.startswith("[") and stripped.endswith("]"):
+        try:
+            data = json.loads(stripped)
+        except ValueError:
+            data = None
+        if isinstance(data, list) and all(isinstance(item, str) for item in data):
+            return _classify([item.strip() for item in data if item.strip()], [])
+
+    tokenizer = IncrementalPlanParser()
+    steps = tokenizer.feed(text) + tokenizer.close()
+    return _classify(steps, tokenizer.diagnostics)
+
+def parse_steps(steps: List[str]) -> ParsedPlan:
+
+    # classifies an already-split plan (from a provider, the plan cache or an RPC client)
+    # a step that is itself a JSON array, as older plans may contain, is expanded by the tokenizer
+
+    expanded, diagnostics = [], []
+    for step in steps:
+        if not isinstance(step, str):
+            continue
+        stripped = step.lstrip()
+        if stripped.startswith("[") and stripped[1:].lstrip()[:1] in ("\"", "'"):
+            tokenizer = IncrementalPlanParser()
+            expanded.extend(tokenizer.feed(stripped) + tokenizer.close())
+            diagnostics.extend(tokenizer.diagnostics)
+        elif stripped.strip():
+            expanded.append(step.strip())
+    return _classify(expanded, diagnostics)
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _legacy_parse(text):
+    #the old pipeline: newline split in the provider, then a regex + json.loads rescan per step
+    steps = [line.strip() for line in text.split('\n') if line.strip()]
+    commands, files = [], {}
+    pattern = r'\[WRITE_FILE:([^\]]+)\](.*?)\[/WRITE_FILE\]'
+    for step in steps:
+        matches = re.findall(pattern, step, re.DOTALL)
+        if matches:
+            for filename, content in matches:
+                files[sanitize_filename(filename)] = content
+            step = re.sub(pattern, '', step).strip()
+            if step:
+                commands.append(step)
+        elif step.startswith('['):
+            try:
+                parsed = json.loads(step.replace("'", '"'))
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, list):
+                commands.extend(item for item in parsed if isinstance(item, str) and item)
+            else:
+                commands.append(step)
+        else:
+            commands.append(step)
+    return commands, files
+
+def check_corpus(corpus=None):
+
+    #parses every corpus sample in one piece and in random stream chunks
+    # returns a list of failure descriptions (empty when everything matches)
+
+    corpus = corpus if corpus is not None else load_corpus()
+    failures = []
+    rng = random.Random(0)
+
+    for sample in corpus:
+        parsed = parse_response(sample["text"])
+        if parsed.commands != sample["commands"] or parsed.file_operations != sample.get("files", {}):
+            failures.append(f"{sample['name']}: got {parsed.commands} / {sorted(parsed.file_operations)}")
+            continue
+
+        #fuzz the chunk boundaries: streaming must give the same steps as one-shot parsing
+        for _ in range(20):
+            tokenizer, streamed, position = IncrementalPlanParser(), [], 0
+            while position < len(sample["text"]):
+                size = rng.randint(1, 12)
+                streamed.extend(tokenizer.feed(sample["text"][position:position + size]))
+                position += size
+            streamed.extend(tokenizer.close())
+            if streamed != parsed.steps:
+                failures.append(f"{sample['name']}: streamed steps differ: {streamed}")
+                break
+
+        #truncated completions must never raise
+        for cut in range(0, len(sample["text"]), max(1, len(sample["text"]) // 10)):
+            parse_response(sample["text"][:cut])
+
+    return failures
+
+def benchmark(rounds=200):
+
+    #corpus accuracy and throughput of the single-pass parser vs. the old split + rescan pipeline
+
+    corpus = load_corpus()
+
+    def accuracy(parse):
+        return sum(1 for sample in corpus if parse(sample["text"]) == (sample["commands"], sample.get("files", {})))
+
+    def single_pass(text):
+        parsed = parse_response(text)
+        return parsed.commands, parsed.file_operations
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for sample in corpus:
+            _legacy_parse(sample["text"])
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for sample in corpus:
+            single_pass(sample["text"])
+    single = time.perf_counter() - started
+
+    return {
+        "samples": len(corpus),
+        "legacy_correct": accuracy(_legacy_parse),
+        "single_pass_correct": accuracy(single_pass),
+        "legacy_seconds": legacy,
+        "single_pass_seconds": single,
+        "failures": check_corpus(corpus),
+    }
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    result = benchmark(rounds)
+    print(f"{result['samples']} corpus samples x {rounds} rounds")
+    print(f"  old split + rescan: {result['legacy_correct']}/{result['samples']} correct, "
+          f"{result['legacy_seconds'] * 1000:.1f} ms")
+    print(f"  single-pass parser: {result['single_pass_correct']}/{result['samples']} correct, "
+          f"{result['single_pass_seconds'] * 1000:.1f} ms")
+    for failure in result["failures"]:
+        print(f"  FAIL {failure}")
+    sys.exit(1 if result["failures"] else 0)
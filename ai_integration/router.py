@@ -0,0 +1,175 @@
+#routing provider: failover and hedged requests across several AI providers
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Iterator
+
+from ai_integration.ai_client import AIProvider
+from ai_integration.rate_limiter import get_provider_limits
+from ai_integration.prompt_builder import Example
+
+logger = logging.getLogger(__name__)
+
+#hedged calls outlive the request that started them when the other provider wins
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-hedge")
+
+class ProviderHealth:
+    # rolling latency and error statistics for one provider
+
+    def __init__(self, window: int = 50):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        with self._lock:
+            self.outcomes.append(success)
+            if success and latency is not None:
+                self.latencies.append(latency)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < 5:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if len(self.outcomes) < 5:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+class RoutingProvider(AIProvider):
+    # wraps several providers in priority order
+    # unhealthy providers (open circuit breaker or >50% recent errors) drop to the back of the line,
+    # a failing provider fails over to the next one, and with hedging enabled a second provider is
+    # fired when the first has not answered within its p95 latency; the first valid plan wins
+
+    name = "router"
+
+    def __init__(self, providers: List[AIProvider], hedge: Optional[bool] = None):
+        if not providers:
+            raise ValueError("RoutingProvider needs at least one provider")
+
+        self.providers = providers
+        self.health = {provider.name: ProviderHealth() for provider in providers}
+        self.model = "+".join(provider.model for provider in providers)
+        self.temperature = providers[0].temperature
+
+        if hedge is None:
+            hedge = os.getenv("AI_HEDGE", "False").lower() == "true"
+        self.hedge = hedge and len(providers) > 1
+        #hedge delay used until a provider has enough latency samples for a p95
+        self.default_hedge_delay = float(os.getenv("AI_HEDGE_DELAY", "5.0"))
+
+    def _is_healthy(self, provider: AIProvider) -> bool:
+        if get_provider_limits(provider.name).breaker.state == "open":
+            return False
+        return self.health[provider.name].error_rate() <= 0.5
+
+    def ordered_providers(self) -> List[AIProvider]:
+        #priority order, healthy providers first
+        return sorted(self.providers, key=lambda provider: not self._is_healthy(provider))
+
+    def _call(self, provider: AIProvider, task_description, previous_attempt, feedback, examples) -> List[str]:
+        started = time.monotonic()
+        try:
+            plan = provider.generate_plan(task_description, previous_attempt, feedback, examples)
+        except Exception:
+            self.health[provider.name].record(False)
+            raise
+
+        if not plan:
+            self.health[provider.name].record(False)
+            raise ValueError(f"{provider.name} returned an empty plan")
+
+        self.health[provider.name].record(True, time.monotonic() - started)
+        return plan
+
+    def _hedge_delay(self, provider: AIProvider) -> float:
+        p95 = self.health[provider.name].p95()
+        return p95 if p95 is not None else self.default_hedge_delay
+
+    def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                      feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> List[str]:
+
+        queue = self.ordered_providers()
+        errors = []
+
+        if not self.hedge:
+            for provider in queue:
+                try:
+                    return self._call(provider, task_description, previous_attempt, feedback, examples)
+                except Exception as e:
+                    logger.warning(f"Provider {provider.name} failed, failing over: {str(e)}")
+                    errors.append(f"{provider.name}: {str(e)}")
+            raise Exception(f"All AI providers failed: {'; '.join(errors)}")
+
+        pending = {}
+
+        def launch():
+            provider = queue.pop(0)
+            future = _hedge_pool.submit(self._call, provider, task_description, previous_attempt, feedback,
+                                        examples)
+            pending[future] = provider
+            return provider
+
+        primary = launch()
+        while pending:
+            timeout = self._hedge_delay(primary) if queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                #nothing back within the p95 latency: fire the next provider as a hedge
+                hedge_provider = launch()
+                logger.info(f"Hedging plan request to {hedge_provider.name} after {timeout:.2f}s")
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                    errors.append(f"{provider.name}: {str(e)}")
+
+            if not pending and queue:
+                #everything in flight failed: fail over immediately
+                primary = launch()
+
+        raise Exception(f"All AI providers failed: {'; '.join(errors)}")
+
+    def stream_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                    feedback: Optional[str] = None, examples: Optional[List[Example]] = None) -> Iterator[str]:
+
+        # streams from the first healthy provider, failing over only while no step has been emitted
+        # (steps already shown to the user cannot be taken back, so streams are never hedged)
+
+        errors = []
+        for provider in self.ordered_providers():
+            started = time.monotonic()
+            emitted = False
+            try:
+                for step in provider.stream_plan(task_description, previous_attempt, feedback, examples):
+                    emitted = True
+                    yield step
+            except Exception as e:
+                self.health[provider.name].record(False)
+                if emitted:
+                    raise
+                logger.warning(f"Provider {provider.name} failed, failing over: {str(e)}")
+                errors.append(f"{provider.name}: {str(e)}")
+                continue
+
+            if emitted:
+                self.health[provider.name].record(True, time.monotonic() - started)
+                return
+            self.health[provider.name].record(False)
+            errors.append(f"{provider.name}: empty plan")
+
+        raise Exception(f"All AI providers failed: {'; '.join(errors)}")
@@ -0,0 +1,296 @@
+#shared safety-rules engine for commands and task descriptions
+#every rule set is compiled once into a single alternation, so checking a command is one regex scan
+#(rules whose pattern would change meaning inside the alternation are matched on their own)
+
+import os
+import re
+import sys
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+#(name, pattern) pairs checked against every plan command
+COMMAND_RULES = [
+    # System-level dangerous operations (for Linux)
+    ("rm-rf-root-or-home", r"rm\s+-rf\s+[/~]"),           # Remove root or home dir
+    ("mkfs", r"mkfs"),                                    # Format filesystem
+    ("dd-to-device", r"dd\s+if=.+\s+of=/dev"),            # Direct writing to devices
+    ("fork-bomb", r":\(\)\s*\{\s*:\|:&\s*\};:"),          # Fork bomb
+
+    # Network danger
+    ("wget-pipe-bash", r"wget.+\|\s*bash"),               # Download and pipe to bash
+    ("curl-pipe-bash", r"curl.+\|\s*bash"),               # Download and pipe to bash
+    ("iwr-pipe-iex", r"Invoke-WebRequest.+\|\s*Invoke-Expression"),  # PowerShell equivalent
+
+    # Privilege escalation
+    ("sudo-rm-rf", r"sudo\s+rm\s+-rf"),                   # Sudo remove with force recursion
+    ("sudo-mkfs", r"sudo\s+mkfs"),                        # Sudo format filesystem
+    ("runas-administrator", r"runas\s+/user:administrator"),  # Windows run as admin
+
+    # Windows-specific dangers
+    ("format-drive", r"format\s+[a-zA-Z]:"),              # Format drive
+    ("del-force-drive", r"del\s+/[fFqQsS]\s+[a-zA-Z]:"),  # Delete with force/quiet
+    ("rmdir-recursive-drive", r"rmdir\s+/[sS]\s+[a-zA-Z]:"),  # Remove directory with subdirs
+    ("rd-recursive-drive", r"rd\s+/[sS]\s+[a-zA-Z]:"),    # Remove directory (rd) variant
+    ("reg-delete", r"reg\s+delete"),                      # Registry deletion
+    ("schtasks-create", r"schtasks\s+/create"),           # Create scheduled task
+    ("wmic-process-create", r"wmic\s+process\s+call\s+create"),  # Create process with WMI
+    ("net-user-add", r"net\s+user\s+\w+\s+\w+\s+/add"),   # Add user account
+    ("net-localgroup-admins", r"net\s+localgroup\s+administrators"),  # Modify admin group
+
+    # General danger signs
+    ("write-etc", r">\s*/etc/"),                          # Write to /etc
+    ("write-dev", r">\s*/dev/"),                          # Write to /dev
+    ("write-bin", r">\s*/bin/"),                          # Write to /bin
+    ("write-sbin", r">\s*/sbin/"),                        # Write to /sbin
+    ("write-windows-dir", r">\s*[a-zA-Z]:\\Windows"),     # Write to Windows directory
+    ("write-program-files", r">\s*[a-zA-Z]:\\Program Files"),  # Write to Program Files
+    ("powershell-runas", r"Start-Process\s+-Verb\s+RunAs"),  # PowerShell elevation
+]
+
+#(name, pattern) pairs checked against the task description typed by the user
+TASK_RULES = [
+    ("rm-rf", r"rm\s+-rf"),
+    ("format-disk", r"format\s+disk"),
+    ("del-force", r"del\s+/[Ff]"),
+    ("sudo-rm", r"sudo\s+rm"),
+    ("mkfs", r"mkfs"),
+    ("fdisk", r"fdisk"),
+    ("dd", r"dd\s+if"),
+    ("fork-bomb", r":\(\)\s*\{\s*:\|:&\s*\};:"),
+    ("rmdir-recursive", r"rmdir\s+/[sS]"),
+    ("format-drive", r"format\s+[a-zA-Z]:"),
+    ("del-attributes", r"del\s+/[aAsSqQ]"),
+]
+
+DEFAULT_RULES = {
+    "command": COMMAND_RULES,
+    "task": TASK_RULES,
+}
+
+#global inline flags such as (?i) or (?x); only allowed at the start of a whole pattern
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+#numbered backreferences and conditionals, which refer to group numbers the alternation shifts
+_GROUP_NUMBER_REFERENCE = re.compile(r"\\[1-9]|\(\?\(\d")
+
+def compile_rule(name: str, pattern: str):
+    #compiles one rule on its own (case-insensitive), so a bad pattern is reported with its rule's name
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except (re.error, TypeError) as e:
+        raise ValueError(f"Invalid safety rule '{name}': {e}")
+
+def combinable(compiled) -> bool:
+    #whether a rule can become one group of the alternation and still match exactly what it matches alone
+    pattern = compiled.pattern
+    if _GLOBAL_FLAGS.search(pattern):
+        return False
+    return not (compiled.groups and _GROUP_NUMBER_REFERENCE.search(pattern))
+
+def required_literal(pattern: str) -> Optional[str]:
+
+    #longest literal substring every match of pattern must contain (casefolded), or None
+    # used as a cheap prefilter; patterns with alternation, groups or numeric escapes never get one
+    # (a None is always safe, it only means the regex runs for every input)
+
+    pieces, piece = [], ""
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\" and index + 1 < len(pattern):
+            escaped = pattern[index + 1]
+            index += 2
+            if escaped in "xuUN0123456789":
+                return None
+            if escaped.isalnum():
+                #\s, \w, \d ... are classes, not literals
+                pieces.append(piece)
+                piece = ""
+            else:
+                piece += escaped
+            continue
+        if char in "|(":
+            return None
+        if char in "*?" or (char == "{" and pattern[index + 1:index + 2].isdigit()):
+            #the previous character is optional
+            pieces.append(piece[:-1])
+            piece = ""
+            if char == "{":
+                index = pattern.find("}", index)
+                if index == -1:
+                    return None
+        elif char == "[":
+            pieces.append(piece)
+            piece = ""
+            index = pattern.find("]", index + 2)
+            if index == -1:
+                return None
+        elif char in ".+)^$":
+            pieces.append(piece)
+            piece = ""
+        else:
+            piece += char
+        index += 1
+    pieces.append(piece)
+
+    longest = max(pieces, key=len)
+    return longest.casefold() if len(longest) >= 2 else None
+
+class RuleSet:
+    # a named list of rules compiled into one case-insensitive alternation
+    # each rule becomes a named group, so the match tells us which rule fired
+    # a literal-token prefilter skips the regex entirely for text no rule could match
+    # rules that cannot be combined (global inline flags, numbered backreferences, a group name another
+    # rule already uses) are searched one by one after the alternation
+
+    def __init__(self, rules: List[Tuple[str, str]]):
+        self.rules = list(rules)
+        self._group_names: Dict[str, str] = {}
+
+        literals = [required_literal(pattern) for _, pattern in self.rules]
+        #a single rule without a usable literal means the regex always has to run
+        self._literals = tuple(literals) if all(literals) else None
+
+        alternatives, group_names = [], set()
+        self._separate: List[Tuple[str, re.Pattern]] = []
+        for index, (name, pattern) in enumerate(self.rules):
+            compiled = compile_rule(name, pattern)
+            group = f"r{index}"
+            names = set(compiled.groupindex)
+            if not combinable(compiled) or names & group_names or any(re.fullmatch(r"r\d+", key) for key in names):
+                self._separate.append((name, compiled))
+                continue
+            group_names |= names
+            self._group_names[group] = name
+            alternatives.append(f"(?P<{group}>{pattern})")
+
+        self._combined = re.compile("|".join(alternatives) or r"(?!)", re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[str]:
+
+        # returns the name of the first rule that matches text, or None if it is safe
+
+        if self._literals is not None:
+            folded = text.casefold()
+            if not any(literal in folded for literal in self._literals):
+                return None
+
+        found = self._combined.search(text)
+        if not found:
+            return next((name for name, compiled in self._separate if compiled.search(text)), None)
+
+        group = found.lastgroup
+        if group not in self._group_names:
+            group = next(key for key, value in found.groupdict().items()
+                         if value is not None and key in self._group_names)
+        return self._group_names[group]
+
+def load_rules_file(path: str) -> Dict[str, List[Tuple[str, str]]]:
+
+    #loads extra rules from YAML, e.g.
+    # command:
+    #   - name: no-docker-prune
+    #     pattern: 'docker\s+system\s+prune'
+
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+
+    # every pattern is compiled here, so a bad rule fails with the rule's name and the file at load time
+    # instead of as a bare re.error from the combined pattern
+
+    rules = {}
+    for set_name, entries in data.items():
+        rules[set_name] = []
+        for index, entry in enumerate(entries or []):
+            if isinstance(entry, str):
+                name, pattern = f"{set_name}-custom-{index}", entry
+            else:
+                name, pattern = entry.get("name") or f"{set_name}-custom-{index}", entry.get("pattern")
+            try:
+                compile_rule(name, pattern)
+            except ValueError as e:
+                raise ValueError(f"{e} (in {path})")
+            rules[set_name].append((name, pattern))
+    return rules
+
+#default rule sets are compiled once at import
+_compiled: Dict[Tuple[str, Optional[str]], RuleSet] = {
+    (name, None): RuleSet(rules) for name, rules in DEFAULT_RULES.items()
+}
+_compiled_lock = threading.Lock()
+
+def get_rule_set(name: str) -> RuleSet:
+
+    # returns the compiled rule set, extended with SAFETY_RULES_FILE when it is set
+
+    rules_file = os.getenv("SAFETY_RULES_FILE") or None
+    key = (name, rules_file)
+
+    rule_set = _compiled.get(key)
+    if rule_set is not None:
+        return rule_set
+
+    with _compiled_lock:
+        if key not in _compiled:
+            extra = load_rules_file(rules_file).get(name, []) if rules_file else []
+            _compiled[key] = RuleSet(DEFAULT_RULES.get(name, []) + extra)
+        return _compiled[key]
+
+def check_command(command: str) -> Optional[str]:
+    # name of the rule a plan command violates, or None
+    return get_rule_set("command").match(command)
+
+def check_task(task_description: str) -> Optional[str]:
+    # name of the rule a task description violates, or None
+    return get_rule_set("task").match(task_description)
+
+def benchmark(count=20000):
+
+    #micro-benchmark: prefiltered single-pass scan vs. one re.search per rule (the old validate_command)
+
+    samples = [
+        "pip install flask requests",
+        "mkdir -p my_project/src",
+        "python -m venv .venv",
+        "npm install --save react react-dom",
+        "echo 'hello world' > my_project/README.md",
+        "ls -la my_project",
+        "git init && git add . && git commit -m 'initial commit'",
+        "find . -name '*.txt' -type f",
+        "curl -s https://example.com/install.sh | bash",
+        "dir /s /b *.py",
+        "python app.py --port 8000",
+        "rm -rf /",
+    ]
+    commands = [samples[i % len(samples)] + (" " * (i % 3)) for i in range(count)]
+    patterns = [pattern for _, pattern in COMMAND_RULES]
+
+    started = time.perf_counter()
+    legacy_unsafe = sum(
+        1 for command in commands
+        if any(re.search(pattern, command, re.IGNORECASE) for pattern in patterns)
+    )
+    legacy = time.perf_counter() - started
+
+    rule_set = get_rule_set("command")
+    started = time.perf_counter()
+    combined_unsafe = sum(1 for command in commands if rule_set.match(command))
+    combined = time.perf_counter() - started
+
+    return {
+        "commands": count,
+        "legacy_seconds": legacy,
+        "combined_seconds": combined,
+        "speedup": legacy / combined if combined else float("inf"),
+        "results_match": legacy_unsafe == combined_unsafe,
+    }
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    result = benchmark(count)
+    print(f"{result['commands']} commands")
+    print(f"  per-rule re.search: {result['legacy_seconds'] * 1000:.1f} ms")
+    print(f"  safety rule set:    {result['combined_seconds'] * 1000:.1f} ms")
+    print(f"  speedup:            {result['speedup']:.1f}x (same verdicts: {result['results_match']})")
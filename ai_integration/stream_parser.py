@@ -0,0 +1,224 @@
+#incremental parser for streamed plan completions
+#emits each command as soon as its JSON string element, line or [WRITE_FILE]...[/WRITE_FILE] block closes
+
+import re
+import json
+from typing import List
+
+WRITE_FILE_OPEN = "[WRITE_FILE:"
+WRITE_FILE_CLOSE = "[/WRITE_FILE]"
+
+#language tags that may follow an opening code fence
+FENCE_LANGUAGES = {"bash", "sh", "shell", "cmd", "powershell", "json", "bat", "console"}
+
+#"1. ", "2) ", "- ", "* " list markers models put in front of commands
+LIST_MARKER = re.compile(r"^(?:\d{1,3}[.)]|[-*\u2022])\s+")
+
+#openers of explanatory sentences, which are never commands
+PROSE_PREFIXES = ("here is", "here's", "here are", "sure", "certainly", "below is", "the following",
+                  "this ", "these ", "i will", "i'll", "let me", "note:", "explanation")
+
+#what is left of a JSON array split across lines: "[", "],", "\"" ...
+ARTIFACT_CHARS = set("[](),;\"'`")
+
+#the only characters each mode has to look at; everything between them is copied in bulk
+LINE_SPECIAL = re.compile(r"[\n\"']")
+JSON_SPECIAL = re.compile(r"[\[\]\"']")
+STRING_SPECIAL = {'"': re.compile(r'[\\"]'), "'": re.compile(r"[\\']")}
+
+def decode_string(raw, quote):
+
+    #decode the body of a JSON (or python-style single quoted) string literal
+    if quote == "'":
+        raw = raw.replace("\\'", "'").replace('"', '\\"')
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+class IncrementalPlanParser:
+    # feed() completion text chunks as they arrive, collect finished steps from the return value
+    # close() flushes whatever is left once the stream ends
+
+    def __init__(self):
+        self.diagnostics: List[str] = []
+
+        self._line = ""            #current line in line mode
+        self._opens = 0            #[WRITE_FILE: / [/WRITE_FILE] markers counted in _line so far
+        self._closes = 0
+        self._counted = 0          #length of _line already scanned for markers
+        self._in_fence = False
+        self._fence_opened = False  #True right after an opening ``` so a language tag can be skipped
+
+        self._json_depth = 0       #bracket depth while inside a JSON array
+        self._quote = None         #active quote character inside a JSON string
+        self._escape = False
+        self._string = []
+
+    def feed(self, chunk: str) -> List[str]:
+        steps = []
+        position, end = 0, len(chunk)
+        while position < end:
+            if self._json_depth:
+                position = self._scan_json(chunk, position, steps)
+            else:
+                position = self._scan_line(chunk, position, steps)
+        return steps
+
+    def _scan_line(self, chunk, position, steps):
+        #inside a [WRITE_FILE] block everything up to the closing marker is file content
+        if self._in_write_block():
+            tail = self._line[-(len(WRITE_FILE_CLOSE) - 1):]
+            found = (tail + chunk[position:]).find(WRITE_FILE_CLOSE)
+            if found == -1:
+                self._line += chunk[position:]
+                return len(chunk)
+            end = position + found - len(tail) + len(WRITE_FILE_CLOSE)
+            self._line += chunk[position:end]
+            return end
+
+        #otherwise copies plain text up to the next newline or quote, then handles that character
+        match = LINE_SPECIAL.search(chunk, position)
+        if match is None:
+            self._line += chunk[position:]
+            return len(chunk)
+        index = match.start()
+        self._line += chunk[position:index]
+        self._feed_line(chunk[index], steps)
+        return index + 1
+
+    def _scan_json(self, chunk, position, steps):
+        #same for JSON mode: only brackets, quotes and (inside strings) backslashes matter
+        if self._quote and self._escape:
+            self._feed_json(chunk[position], steps)
+            return position + 1
+
+        pattern = STRING_SPECIAL[self._quote] if self._quote else JSON_SPECIAL
+        match = pattern.search(chunk, position)
+        if match is None:
+            if self._quote:
+                self._string.append(chunk[position:])
+            return len(chunk)
+        index = match.start()
+        if self._quote:
+            self._string.append(chunk[position:index])
+        self._feed_json(chunk[index], steps)
+        return index + 1
+
+    def close(self) -> List[str]:
+        steps = []
+        if self._json_depth:
+            if self._quote:
+                self.diagnostics.append("stream ended inside a command string; partial command dropped")
+            else:
+                self.diagnostics.append("stream ended before the JSON array was closed")
+            self._json_depth = 0
+            self._quote = None
+            self._string = []
+        elif self._in_write_block():
+            self.diagnostics.append("stream ended inside a [WRITE_FILE] block; partial file dropped")
+            self._reset_line()
+        else:
+            self._emit_line(steps)
+        return steps
+
+    def _reset_line(self):
+        self._line = ""
+        self._opens = self._closes = self._counted = 0
+
+    def _in_write_block(self):
+        #counts markers incrementally so long file blocks stay linear; a marker that straddles
+        # the previously scanned boundary ends past it, so it is counted exactly once
+        line = self._line
+        self._opens += line.count(WRITE_FILE_OPEN, max(0, self._counted - len(WRITE_FILE_OPEN) + 1))
+        self._closes += line.count(WRITE_FILE_CLOSE, max(0, self._counted - len(WRITE_FILE_CLOSE) + 1))
+        self._counted = len(line)
+        return self._opens > self._closes
+
+    def _feed_line(self, char, steps):
+        #newlines inside an open [WRITE_FILE] block are part of the file content
+        if char == "\n" and not self._in_write_block():
+            if self._line.strip() == "[":
+                #array opened on a line of its own, the first element follows on the next line
+                self._line += " "
+                return
+            self._emit_line(steps)
+            return
+
+        self._line += char
+
+        #[" or [' opens a JSON array of commands when it starts the line or follows a "Plan:" style lead-in
+        # only checked on a quote within a short line prefix to keep feeding linear
+        if char in "\"'" and len(self._line) <= 200 and not self._in_write_block():
+            bracket = self._line.rfind("[")
+            if bracket != -1 and not self._line[bracket + 1:-1].strip():
+                prefix = self._line[:bracket].strip()
+                if not prefix or prefix.endswith(":"):
+                    if prefix:
+                        self.diagnostics.append(f"dropped text before JSON array: {prefix!r}")
+                    array_text = self._line[bracket:]
+                    self._reset_line()
+                    for json_char in array_text:
+                        self._feed_json(json_char, steps)
+
+    def _emit_line(self, steps):
+        line = self._line.strip()
+        self._reset_line()
+
+        if not line:
+            return
+
+        if line.startswith("```"):
+            self._in_fence = not self._in_fence
+            self._fence_opened = self._in_fence
+            return
+
+        if self._fence_opened:
+            self._fence_opened = False
+            if line.lower() in FENCE_LANGUAGES:
+                return
+
+        if line.startswith("#") or line.startswith("//"):
+            return
+
+        line = LIST_MARKER.sub("", line)
+        if len(line) > 1 and line[0] == "`" and line[-1] == "`":
+            line = line[1:-1].strip()
+
+        if not line or (len(line) <= 8 and set(line) <= ARTIFACT_CHARS):
+            return
+
+        lowered = line.lower()
+        if lowered.startswith(PROSE_PREFIXES) or (
+                line.endswith(":") and len(line.split()) >= 3 and not re.search(r"\s[A-Za-z]:$", line)):
+            self.diagnostics.append(f"dropped explanatory text: {line[:60]!r}")
+            return
+
+        steps.append(line)
+
+    def _feed_json(self, char, steps):
+        if self._quote:
+            if self._escape:
+                self._string.append(char)
+                self._escape = False
+            elif char == "\\":
+                self._string.append(char)
+                self._escape = True
+            elif char == self._quote:
+                raw = "".join(self._string)
+                quote = self._quote
+                self._quote = None
+                self._string = []
+                step = decode_string(raw, quote).strip()
+                if step:
+                    steps.append(step)
+            else:
+                self._string.append(char)
+            return
+
+        if char == "[":
+            self._json_depth += 1
+        elif char == "]":
+            self._json_depth -= 1
+        elif char in "\"'":
+            self._quote = char
@@ -0,0 +1,64 @@
+#task context: the language, framework and target directory a task description mentions
+#used by plan retrieval to compare only tasks of the same kind, and by the CLI
+
+import re
+
+from ai_integration.text_classifier import TermClassifier
+
+#(label, pattern, weight) terms for parse_task_context; names count more than file extensions,
+# and the bare word "go" counts less since it is also an ordinary verb
+# (earlier terms win when several match at the same position)
+TASK_TERMS = {
+    "language": [
+        ("python", r"python3?"), ("python", r"\.py", 0.8),
+        ("javascript", r"javascript"), ("javascript", r"node(?:\.?js)?"), ("javascript", r"\.js", 0.8),
+        ("typescript", r"typescript"), ("typescript", r"\.tsx?", 0.8),
+        ("java", r"java"), ("java", r"\.java", 0.8),
+        ("cpp", r"c\+\+"), ("cpp", r"cpp"), ("cpp", r"\.cpp", 0.8),
+        ("csharp", r"c#"), ("csharp", r"csharp"), ("csharp", r"\.cs", 0.8),
+        ("go", r"golang"), ("go", r"in go"), ("go", r"go (?:program|module|app|project|code|server|cli|binary)s?"),
+        ("go", r"go", 0.5), ("go", r"\.go", 0.8),
+        ("rust", r"rust"), ("rust", r"\.rs", 0.8),
+        ("ruby", r"ruby"), ("ruby", r"\.rb", 0.8),
+        ("php", r"php"), ("php", r"\.php", 0.8),
+        ("html", r"html"), ("html", r"\.html?", 0.8),
+        ("css", r"css"), ("css", r"\.css", 0.8),
+        ("bash", r"shell"), ("bash", r"bash"), ("bash", r"\.sh", 0.8),
+    ],
+    "framework": [
+        (name, name) for name in ("react", "angular", "vue", "django", "flask", "express", "spring", "rails",
+                                  "laravel")
+    ],
+}
+
+#weight a language or framework needs before parse_task_context reports it (a bare "go" is not enough)
+MIN_CONTEXT_WEIGHT = 0.8
+
+_task_classifier = TermClassifier(TASK_TERMS)
+
+_DIRECTORY = re.compile(r"in\s+(?:dir(?:ectory)?|folder)\s+[\"']?([^\"']+)[\"']?", re.IGNORECASE)
+
+def classify_task(task_description):
+    #all language/framework terms found in a task, with positions and confidences (see text_classifier)
+    return _task_classifier.classify(task_description)
+
+def parse_task_context(task_description):
+
+    #to extract context from the task description
+    #such as programming language, target directory, or other relevant params
+    # returns a dictionary with the extracted context
+    # language and framework are the most confident matches of classify_task
+
+    classification = _task_classifier.classify(task_description)
+    context = {
+        "language": classification.best("language", MIN_CONTEXT_WEIGHT),
+        "directory": ".",
+        "framework": classification.best("framework", MIN_CONTEXT_WEIGHT),
+    }
+
+    #extract directory if specified
+    dir_match = _DIRECTORY.search(task_description)
+    if dir_match:
+        context["directory"] = dir_match.group(1).strip()
+
+    return context
@@ -0,0 +1,112 @@
+#keyword classification of task descriptions and feedback
+#the terms of each category are compiled once into a single case-insensitive alternation, so classifying a
+#text is one scan per category (categories are scanned separately because their terms may overlap:
+#"missing features" is both a missing dependency and an incomplete implementation). terms only match as
+#whole words: "java" does not match inside "javascript", "go" not inside "google"; terms starting or ending
+#with punctuation (".py", "c++", "usage:") only need a boundary on their word side, so "app.py" still
+#matches ".py"
+
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+#one matched term: where it is and what it counts towards
+TermMatch = namedtuple("TermMatch", "category label term start end weight")
+
+def _word_initial(pattern: str) -> bool:
+    return pattern[:1].isalnum() or pattern.startswith("\\w")
+
+def _punctuation_initial(pattern: str) -> bool:
+    #starts with a literal punctuation character, plain ("#") or escaped ("\.")
+    if pattern[:1] == "\\":
+        return not pattern[1:2].isalnum()
+    return bool(pattern) and not pattern[0].isalnum() and pattern[0] not in "([.^"
+
+def _right_bounded(pattern: str) -> str:
+    #a word boundary after patterns ending in a word character (or an optional suffix)
+    if pattern[-1:].isalnum() or pattern.endswith(("?", ")")):
+        return f"(?:{pattern})(?!\\w)"
+    return f"(?:{pattern})"
+
+class Classification:
+    # all term matches of one text, with per-label confidences
+    # weights holds the summed weight of each label's matches, the confidence of a label is its share of
+    # the matched weight in its category
+
+    __slots__ = ("matches", "weights", "scores")
+
+    def __init__(self, matches: List[TermMatch]):
+        self.matches = matches
+        self.weights: Dict[str, Dict[str, float]] = {}
+        self.scores: Dict[str, Dict[str, float]] = {}
+        firsts: Dict[Tuple[str, str], int] = {}
+        for match in matches:
+            labels = self.weights.setdefault(match.category, {})
+            labels[match.label] = labels.get(match.label, 0.0) + match.weight
+            firsts.setdefault((match.category, match.label), match.start)
+
+        for category, labels in self.weights.items():
+            total = sum(labels.values())
+            #highest confidence first, the earlier mention wins a tie
+            ordered = sorted(labels.items(), key=lambda item: (-item[1], firsts[(category, item[0])]))
+            self.scores[category] = {label: weight / total for label, weight in ordered}
+
+    def best(self, category: str, min_weight: float = 0.0) -> Optional[str]:
+        #the most likely label of a category, None when nothing (or too little) matched
+        labels = self.scores.get(category)
+        if not labels:
+            return None
+        label = next(iter(labels))
+        return label if self.weights[category][label] >= min_weight else None
+
+    def has(self, category: str) -> bool:
+        return category in self.scores
+
+class TermClassifier:
+    # {category: [(label, pattern, weight)]} compiled into one regex per category
+    # each term is a named group, so a match tells us the label without trying the terms one by one
+
+    def __init__(self, categories: Dict[str, List[Tuple]]):
+        self._scanners = []
+        for category, terms in categories.items():
+            groups, word_terms, punctuation_terms, other_terms = {}, [], [], []
+            for index, term in enumerate(terms):
+                label, pattern = term[0], term[1]
+                weight = term[2] if len(term) > 2 else 1.0
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise ValueError(f"Invalid {category} term '{pattern}': {e}")
+                group = f"t{index}"
+                groups[group] = (label, weight)
+                alternative = f"(?P<{group}>{_right_bounded(pattern)})"
+                if _word_initial(pattern):
+                    word_terms.append(alternative)
+                elif _punctuation_initial(pattern):
+                    punctuation_terms.append(alternative)
+                else:
+                    other_terms.append(alternative)
+
+            #the start-of-word / punctuation checks are done once for all terms of their kind, so most
+            # positions of a text are rejected after looking at one or two characters
+            alternatives = []
+            if word_terms:
+                alternatives.append(r"(?<!\w)(?=\w)(?:" + "|".join(word_terms) + ")")
+            if punctuation_terms:
+                alternatives.append(r"(?=[^\w\s])(?:" + "|".join(punctuation_terms) + ")")
+            alternatives += other_terms
+            self._scanners.append((category, re.compile("|".join(alternatives) or r"(?!)", re.IGNORECASE),
+                                   groups))
+
+    def classify(self, text: str) -> Classification:
+        matches = []
+        for category, scanner, groups in self._scanners:
+            for found in scanner.finditer(text):
+                label, weight = groups[found.lastgroup]
+                matches.append(TermMatch(category, label, found.group(), found.start(), found.end(), weight))
+        matches.sort(key=lambda match: match.start)
+        return Classification(matches)
+
+    def classify_many(self, texts: List[str]) -> List[Classification]:
+        #batch form for analytics over many tasks or feedback entries
+        return [self.classify(text) for text in texts]
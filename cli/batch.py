@@ -0,0 +1,157 @@
+#batch mode: push a JSONL file of tasks through plan generation and execution without prompts
+
+import os
+import sys
+import re
+import json
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import click
+
+from cli.task_input import normalize_task
+from ai_integration.ai_client import generate_plan
+from ai_integration.plan_cache import discard_plan
+from ai_integration.plan_parser import parse_plan
+from ai_integration.safety_rules import check_task
+from ai_integration.rate_limiter import TokenBucket
+from executor.command_executor import run_plan
+from executor.plan_analyzer import analyze_plan
+from feedback.history import record_run
+
+def workdir_name(task_id):
+    #the subdirectory of --workdir-root a task executes in
+    return re.sub(r"[^A-Za-z0-9._-]", "_", task_id).lstrip(".") or "task"
+
+def read_tasks(source):
+
+    #reads tasks from a JSONL file (or stdin when source is "-")
+    # each line is {"task": "..."} (or {"body": "..."}) with an optional "id"/"request_id";
+    # a line that is a bare JSON string is taken as the task itself
+    # ids must be unique (also after being turned into directory names), since each task owns its directory
+
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        tasks = []
+        seen = {}
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise click.ClickException(f"Line {line_number} is not valid JSON: {str(e)}")
+            if isinstance(entry, str):
+                entry = {"task": entry}
+            if not isinstance(entry, dict):
+                raise click.ClickException(f"Line {line_number} is not a task object or string")
+
+            description = entry.get("task") or entry.get("body") or entry.get("description")
+            if not description:
+                raise click.ClickException(f"Line {line_number} has no 'task' field")
+
+            task_id = str(entry.get("id") or entry.get("request_id") or f"task-{line_number:04d}")
+            directory = workdir_name(task_id)
+            if directory in seen:
+                raise click.ClickException(f"Line {line_number}: task id '{task_id}' clashes with the id on "
+                                           f"line {seen[directory]}; every task needs its own id")
+            seen[directory] = line_number
+
+            tasks.append({
+                "id": task_id,
+                "task": normalize_task(description),
+            })
+        return tasks
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def process_task(entry, workdir_root, auto_approve, use_cache, limiter):
+
+    #plans (and optionally executes) one task, returning its result record
+
+    started = time.monotonic()
+    result = {"id": entry["id"], "task": entry["task"], "status": None, "plan": [],
+              "unsafe_commands": [], "output": None, "steps": [], "workdir": None, "timings": {}}
+
+    blocked_by = check_task(entry["task"])
+    if blocked_by:
+        result["status"] = "rejected"
+        result["output"] = f"Task matched safety rule '{blocked_by}'"
+        result["timings"]["total_seconds"] = time.monotonic() - started
+        return result
+
+    #candidate plans are scored against the task's own (fresh) working directory
+    workdir = os.path.abspath(os.path.join(workdir_root, workdir_name(entry["id"])))
+    limiter.acquire()
+    plan_started = time.monotonic()
+    #auto-approved plans run unreviewed, so past plans are only used as examples
+    plan = generate_plan(entry["task"], use_cache=use_cache, allow_reuse=not auto_approve,
+                         analyze=functools.partial(analyze_plan, cwd=workdir))
+    result["timings"]["plan_seconds"] = time.monotonic() - plan_started
+    result["plan"] = plan
+
+    if not plan:
+        result["status"] = "plan_failed"
+    else:
+        _, _, unsafe_commands = parse_plan(plan)
+        result["unsafe_commands"] = unsafe_commands
+
+        if unsafe_commands:
+            result["status"] = "rejected"
+        elif not auto_approve:
+            result["status"] = "planned"
+        else:
+            os.makedirs(workdir, exist_ok=True)
+            result["workdir"] = workdir
+
+            plan_result = run_plan(plan, cwd=workdir)
+            record_run(entry["task"], plan, plan_result, mode="batch")
+            result["timings"]["execute_seconds"] = plan_result.duration
+            result["status"] = "succeeded" if plan_result.success else "failed"
+            if not plan_result.success:
+                discard_plan(plan)
+            result["output"] = plan_result.summary()
+            #per-step exit codes, timings and byte counts in the compact serialized form
+            result["steps"] = plan_result.to_dict().get("results", [])
+
+    result["timings"]["total_seconds"] = time.monotonic() - started
+    return result
+
+def run_batch(source, output_path, workers=4, rate_per_minute=30.0, auto_approve=False,
+              workdir_root="batch_runs", use_cache=True):
+
+    # runs every task through a bounded worker pool, appending one JSON result per line as tasks finish
+    # returns a {status: count} summary
+
+    tasks = read_tasks(source)
+    #batch-wide cap on top of the provider's own limits; capacity 1 spaces requests evenly
+    limiter = TokenBucket(rate_per_minute / 60.0, 1)
+    summary = {}
+
+    click.echo(f"Processing {len(tasks)} task(s) with {workers} worker(s)...")
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(process_task, entry, workdir_root, auto_approve, use_cache, limiter): entry
+            for entry in tasks
+        }
+
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": entry["id"], "task": entry["task"], "status": "error", "output": str(e)}
+
+            #written as each task finishes so an interrupted overnight run keeps its results
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+            click.echo(f"  [{result['status']}] {entry['id']}: {entry['task'][:60]}")
+
+    return summary
@@ -0,0 +1,112 @@
+#thin client for the agent daemon (see cli/server.py)
+#uses only the standard library so client-mode invocations stay cheap to start
+
+import os
+import json
+import logging
+import urllib.error
+import urllib.request
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def get_state_path():
+    #where a running daemon publishes its address and token for clients
+    return os.path.expanduser(os.getenv("AI_DAEMON_STATE", "~/.cache/ai-task-agent/daemon.json"))
+
+class DaemonClient:
+    # mirrors generate_plan / parse_plan / execute_plan with RPCs to a running daemon
+
+    def __init__(self, url: str, token: str, timeout: Optional[float] = None):
+        self.url = url.rstrip("/")
+        self.token = token
+        #plans can take a while to execute, so the default leaves room for the plan timeout
+        self.timeout = timeout if timeout is not None else float(os.getenv("AI_DAEMON_TIMEOUT", "3600"))
+
+    def _call(self, path, body=None, timeout=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        })
+
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise Exception(f"Daemon request {path} failed with status {e.code}: {message}")
+
+    def health(self):
+        return self._call("/health", timeout=2.0)
+
+    def generate_plan(self, task_description: str, previous_attempt: Optional[List[str]] = None,
+                      feedback: Optional[str] = None, use_cache: bool = True,
+                      on_step: Optional[Callable[[str], None]] = None, candidates: Optional[int] = None,
+                      allow_reuse: bool = True, cwd: Optional[str] = None) -> List[str]:
+
+        # same contract as ai_client.generate_plan: [] on failure
+        # steps are not streamed over RPC, on_step is called for each step once the plan arrives
+        # cwd is where the plan will run, for the daemon's scoring of candidate plans
+
+        try:
+            plan = self._call("/plan", {"task": task_description, "previous_attempt": previous_attempt,
+                                        "feedback": feedback, "use_cache": use_cache,
+                                        "candidates": candidates, "allow_reuse": allow_reuse,
+                                        "cwd": cwd or os.getcwd()})["plan"]
+        except Exception as e:
+            logger.error(f"Error generating plan: {str(e)}")
+            return []
+
+        if on_step:
+            for step in plan:
+                on_step(step)
+        return plan
+
+    def parse_plan(self, plan):
+        result = self._call("/parse", {"plan": plan})
+        return result["safe_commands"], result["file_operations"], result["unsafe_commands"]
+
+    def execute_plan(self, plan, on_output=None, step_timeout=None, plan_timeout=None, cwd=None, task=None):
+
+        # same contract as command_executor.execute_plan; runs in the caller's directory by default
+        # output is returned when the plan finishes, on_output is not supported over RPC
+        # task is what the daemon records the run under in the run history
+
+        try:
+            result = self._call("/execute", {"plan": plan, "cwd": cwd or os.getcwd(), "task": task,
+                                             "step_timeout": step_timeout, "plan_timeout": plan_timeout})
+        except Exception as e:
+            return False, f"Error executing plan on daemon: {str(e)}"
+        return result["success"], result["output"]
+
+    def submit_feedback(self, task_description, plan, output, feedback):
+        return self._call("/feedback", {"task": task_description, "plan": plan,
+                                        "output": output, "feedback": feedback})["analysis"]
+
+def connect_daemon() -> Optional[DaemonClient]:
+
+    # returns a client for a live daemon, or None if none is running
+    # AI_DAEMON_URL / AI_DAEMON_TOKEN take precedence over the state file written by `ai-task serve`
+
+    url, token = os.getenv("AI_DAEMON_URL"), os.getenv("AI_DAEMON_TOKEN")
+    if not url:
+        try:
+            with open(get_state_path(), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        url, token = state.get("url"), state.get("token")
+
+    if not url or not token:
+        return None
+
+    client = DaemonClient(url, token)
+    try:
+        client.health()
+    except Exception:
+        return None
+    return client
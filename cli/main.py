@@ -1,37 +1,136 @@
 #CLI Entry Point
+#only click and dotenv load at startup; provider, executor and feedback modules (and requests)
+#are imported inside the subcommands that need them, so --help and completions stay instant
 
 import os
 import sys
-import platform
+import functools
 import click
 from dotenv import load_dotenv
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+load_dotenv()
 
-from cli.task_input import get_task_description
-from ai_integration.ai_client import generate_plan
-from executor.command_executor import execute_plan
-from feedback.feedback_loop import handle_feedback
+def plan_step_printer(title):
 
-load_dotenv()
+    #returns an on_step callback that prints streamed plan steps as they arrive
+    # each step is validated on its own so unsafe commands are flagged immediately
+
+    from ai_integration.plan_parser import parse_plan
+
+    printed = []
+
+    def on_step(step):
+        if not printed:
+            click.echo(f"\n{title}")
+        printed.append(step)
+
+        _, _, unsafe_commands = parse_plan([step])
+        warning = "  ⚠️  flagged as unsafe" if unsafe_commands else ""
+        click.echo(f"  {len(printed)}. {step}{warning}")
+
+    return on_step
+
+def live_output_printer():
+
+    #returns an on_output callback that forwards command output to the terminal as it is produced
+    # steps may run in parallel, so each line is tagged with its command and printed under a lock
+
+    import threading
+
+    lock = threading.Lock()
+
+    def on_output(command, stream_name, line):
+        label = command if len(command) <= 30 else command[:27] + "..."
+        with lock:
+            click.echo(f"  [{label}] {line}", err=(stream_name == "stderr"))
+
+    return on_output
 
 @click.group()
 def cli():
-    pass
+    #configured here rather than at import so library users keep control of logging
+    import logging
+    logging.basicConfig(level=logging.INFO)
 
 @cli.command()
 @click.option('--task', '-t', help='Task description to execute.')
 @click.option('--debug/--no-debug', default=False, help='Enable debug mode for verbose output.')
-def run(task, debug):
+@click.option('--no-cache', is_flag=True, default=False, help='Always ask the AI provider instead of reusing a cached plan.')
+@click.option('--stream/--no-stream', default=lambda: os.getenv('AI_STREAM', 'True').lower() == 'true',
+              help='Print plan steps live as the AI generates them.')
+@click.option('--live-output/--no-live-output', default=lambda: os.getenv('EXECUTOR_LIVE_OUTPUT', 'True').lower() == 'true',
+              help='Show command output live while each step runs.')
+@click.option('--step-timeout', type=float, default=None,
+              help='Seconds a single step may run before its process group is killed (0 = no limit). '
+                   'Steps get no stdin, so commands that prompt for input read end-of-file.')
+@click.option('--plan-timeout', type=float, default=None,
+              help='Seconds all steps of a plan may take together (0 = no limit).')
+@click.option('--daemon/--no-daemon', 'use_daemon', default=lambda: os.getenv('AI_USE_DAEMON', 'False').lower() == 'true',
+              help='Plan and execute through a running `ai-task serve` daemon.')
+@click.option('--sandbox/--no-sandbox', default=lambda: os.getenv('EXECUTOR_SANDBOX', 'False').lower() == 'true',
+              help='Execute in a private copy of the current directory; every retry starts from a restored '
+                   'snapshot and changes are copied back once the task succeeds.')
+@click.option('--resume/--fresh', default=lambda: os.getenv('EXECUTOR_RESUME', 'False').lower() == 'true',
+              help='Also skip the unchanged leading steps an earlier ai-task run in this directory completed '
+                   '(default --fresh: only the retries of this run skip steps).')
+@click.option('--auto', is_flag=True, default=False,
+              help='Run unattended: execute safe plans without asking and refine failed ones from their error output.')
+@click.option('--max-rounds', type=int, default=lambda: int(os.getenv('AUTO_MAX_ROUNDS', os.getenv('MAX_RETRIES', '3'))),
+              help='Refinement rounds --auto may use before giving up.')
+@click.option('--candidates', type=int, default=lambda: int(os.getenv('AI_CANDIDATES', '1')),
+              help='Plans requested concurrently for every generation; the best scoring one is used.')
+@click.option('--preflight/--no-preflight', default=lambda: os.getenv('EXECUTOR_PREFLIGHT', 'True').lower() == 'true',
+              help='Check plans for predictable failures (missing programs, files or directories) before running them.')
+def run(task, debug, no_cache, stream, live_output, step_timeout, plan_timeout, use_daemon, sandbox, resume,
+        auto, max_rounds, candidates, preflight):
     #execute a task on your local machine with AI assistance
 
+    import platform
+    from cli.task_input import get_task_description
+    from ai_integration.plan_cache import discard_plan
+    from feedback.feedback_loop import handle_feedback
+
     current_os = platform.system()
     click.echo(f"Detected operating system: {current_os}")
 
     if debug:
         os.environ['DEBUG_MODE'] = 'True'
         click.echo("Debug mode enabled. Verbose output will be shown.")
+
+    #the sandbox workspace is created, reset and promoted by this process, so a sandboxed run stays local
+    if use_daemon and sandbox:
+        click.echo("--sandbox runs locally; the agent daemon is not used for this run.")
+        use_daemon = False
+
+    client = None
+    if use_daemon:
+        from click.core import ParameterSource
+        from cli.client import connect_daemon
+
+        client = connect_daemon()
+        if client is None:
+            click.echo("No agent daemon is running (start one with `ai-task serve`); running locally.")
+        else:
+            click.echo(f"Using agent daemon at {client.url}")
+            #the daemon keeps no step journal and returns output once a plan has finished
+            ignored = ["--resume"] if resume else []
+            if click.get_current_context().get_parameter_source("live_output") == ParameterSource.COMMANDLINE:
+                ignored.append("--live-output")
+            if ignored:
+                click.echo(f"⚠️  {' and '.join(ignored)} {'has' if len(ignored) == 1 else 'have'} no effect with "
+                           f"the daemon: it keeps no step journal and shows output once a plan has finished.")
+
+    #the provider and executor modules (and requests) are only needed when nothing runs on the daemon
+    if client is not None:
+        generate_plan = client.generate_plan
+
+        def execute_plan(plan, **options):
+            #the daemon records the run in the history under this task
+            return client.execute_plan(plan, task=task_description, **options)
+    else:
+        from ai_integration.ai_client import generate_plan
     
     #getting task description if not provided via CLI option
     task_description = task or get_task_description()
@@ -41,31 +140,105 @@ def run(task, debug):
         return
     
     click.echo(f"\n🤖 Processing task: {task_description}\n")
+
+    on_output = live_output_printer() if live_output else None
+
+    workspace = None
+    if sandbox:
+        from executor.workspace import Workspace
+
+        workspace = Workspace(os.getcwd())
+        try:
+            workspace.create()
+            snapshot = workspace.snapshot()
+            click.echo(f"Sandbox workspace: {workspace.path} (snapshot in {snapshot['seconds'] * 1000:.0f} ms)")
+            click.get_current_context().call_on_close(workspace.cleanup)
+        except (OSError, ValueError) as e:
+            workspace.cleanup()
+            workspace = None
+            click.echo(f"Sandbox unavailable ({e}); running in the current directory.")
+    exec_cwd = workspace.path if workspace else None
+
+    #candidate plans are scored by the failures they would hit in the directory they will run in
+    if client is not None:
+        generate_plan = functools.partial(generate_plan, cwd=exec_cwd or os.getcwd())
+    else:
+        from executor.plan_analyzer import analyze_plan
+
+        generate_plan = functools.partial(generate_plan, analyze=functools.partial(analyze_plan, cwd=exec_cwd))
+
+    #the step journal and history recording need the local executor; the daemon records its own runs
+    journal = None
+    if client is None:
+        from executor.command_executor import run_plan
+        from executor.journal import StepJournal
+        from feedback.history import record_run
+
+        journal = StepJournal(exec_cwd or os.getcwd(), resume=resume)
+        executed_rounds = []
+
+        def execute_plan(plan, **options):
+            result = run_plan(plan, journal=journal, **options)
+            record_run(task_description, plan, result, mode="interactive", round_number=len(executed_rounds))
+            executed_rounds.append(result.success)
+            return result.success, result.summary()
+
+    def accept_result():
+        #a sandboxed run only touches the real directory once the user is happy with the result
+        if workspace:
+            stats = workspace.promote()
+            click.echo(f"Copied sandbox changes to {workspace.source} "
+                       f"({stats['copied'] + stats['cloned']} written, {stats['removed']} removed)")
+            if stats["conflicts"]:
+                click.echo(f"  ⚠️  also changed in {workspace.source} during the run, kept as they are: "
+                           f"{', '.join(stats['conflicts'])}")
+        click.echo("Great! Exiting.")
     
     #generate execution plan using AI
-    plan = generate_plan(task_description)
+    #a reused plan runs without an API call, so only when someone approves it first
+    plan = generate_plan(task_description, use_cache=not no_cache, candidates=candidates, allow_reuse=not auto,
+                         on_step=plan_step_printer("📋 Generated Plan:") if stream else None)
     
     if not plan:
         click.echo("WARNING: Failed to generate a plan. Please try again with a clearer task description.")
         return
     
-    click.echo("\n📋 Generated Plan:")
-    for idx, step in enumerate(plan, 1):
-        click.echo(f"  {idx}. {step}")
+    if not stream:
+        click.echo("\n📋 Generated Plan:")
+        for idx, step in enumerate(plan, 1):
+            click.echo(f"  {idx}. {step}")
+
+    def check_plan(candidate_plan, interactive=True):
+        #static preflight analysis, replanning from its findings when it predicts failures
+        if not preflight:
+            return candidate_plan
+        return preflight_plan(task_description, candidate_plan, generate_plan, exec_cwd or os.getcwd(),
+                              interactive=interactive, stream=stream, use_cache=not no_cache, candidates=candidates)
+
+    plan = check_plan(plan, interactive=not auto)
+
+    if auto:
+        run_unattended(task_description, plan, generate_plan, workspace, journal, accept_result,
+                       on_output=on_output, step_timeout=step_timeout, plan_timeout=plan_timeout,
+                       max_rounds=max_rounds, use_cache=not no_cache, candidates=candidates, stream=stream,
+                       check_plan=lambda candidate_plan: check_plan(candidate_plan, interactive=False))
+        return
     
     if not click.confirm("\n✅ Do you approve this plan?", default=True):
+        discard_plan(plan)
         click.echo("Operation canceled by user.")
         return
     
     #execute the approved plan
-    success, output = execute_plan(plan)
+    success, output = execute_plan(plan, on_output=on_output,
+                                   step_timeout=step_timeout, plan_timeout=plan_timeout, cwd=exec_cwd)
     
     if success:
         click.echo("\n✅ Task completed successfully!")
         click.echo(f"\nOutput:\n{output}")
         
         if click.confirm("\nWas the task successful?", default=True):
-            click.echo("Great! Exiting.")
+            accept_result()
             return
     else:
         click.echo("\n❌ Task execution failed!")
@@ -83,17 +256,23 @@ def run(task, debug):
         click.echo(f"\n🔄 Refining plan (Attempt {retries}/{max_retries})")
         
         #generate refined plan based on feedback
-        refined_plan = generate_plan(task_description, previous_attempt=plan, feedback=feedback)
+        refined_plan = generate_plan(task_description, previous_attempt=plan, feedback=feedback,
+                                     use_cache=not no_cache, candidates=candidates,
+                                     on_step=plan_step_printer("📋 Refined Plan:") if stream else None)
         
         if not refined_plan:
             click.echo("❌ Failed to generate a refined plan.")
             continue
         
-        click.echo("\n📋 Refined Plan:")
-        for idx, step in enumerate(refined_plan, 1):
-            click.echo(f"  {idx}. {step}")
+        if not stream:
+            click.echo("\n📋 Refined Plan:")
+            for idx, step in enumerate(refined_plan, 1):
+                click.echo(f"  {idx}. {step}")
+
+        refined_plan = check_plan(refined_plan)
         
         if not click.confirm("\n✅ Do you approve this refined plan?", default=True):
+            discard_plan(refined_plan)
             if click.confirm("Would you like to try again with different feedback?", default=True):
                 feedback = handle_feedback(task_description, plan, output, previous_feedback=feedback)
                 continue
@@ -101,15 +280,26 @@ def run(task, debug):
                 click.echo("Operation canceled by user.")
                 return
         
+        #start the retry from the state before the first attempt instead of its leftovers
+        if workspace:
+            restored = workspace.restore()
+            if journal is not None:
+                #the restored state predates every journaled step
+                journal.clear()
+            click.echo(f"Sandbox restored in {restored['seconds'] * 1000:.0f} ms")
+            if restored["tainted"]:
+                click.echo(f"  ⚠️  modified in place, could not be reset: {', '.join(restored['tainted'])}")
+
         #execute the approved refined plan
-        success, output = execute_plan(refined_plan)
+        success, output = execute_plan(refined_plan, on_output=on_output,
+                                       step_timeout=step_timeout, plan_timeout=plan_timeout, cwd=exec_cwd)
         
         if success:
             click.echo("\n✅ Task completed successfully!")
             click.echo(f"\nOutput:\n{output}")
             
             if click.confirm("\nWas the task successful?", default=True):
-                click.echo("Great! Exiting.")
+                accept_result()
                 return
         else:
             click.echo("\n❌ Task execution failed!")
@@ -120,5 +310,211 @@ def run(task, debug):
     
     click.echo(f"\n❌ Maximum retry limit ({max_retries}) reached. Please try with a different approach.")
 
+def preflight_plan(task_description, plan, generate_plan, cwd, interactive=True, stream=True, use_cache=True,
+                   candidates=None):
+
+    # reports the failures executor.plan_analyzer predicts for plan, and replans right away (up to
+    # EXECUTOR_PREFLIGHT_REPLANS times) with them as feedback when it predicts errors; interactive runs ask first
+    # returns the plan to use
+
+    from executor.plan_analyzer import analyze_plan
+
+    max_replans = int(os.getenv('EXECUTOR_PREFLIGHT_REPLANS', '1'))
+    for attempt in range(max_replans + 1):
+        analysis = analyze_plan(plan, cwd=cwd)
+        if not analysis.findings:
+            return plan
+
+        click.echo(f"\n🔎 Preflight: {len(analysis.errors)} predicted failure(s), {len(analysis.warnings)} warning(s) "
+                   f"({analysis.seconds * 1000:.1f} ms)")
+        for finding in analysis.findings:
+            marker = "❌" if finding.severity == "error" else "⚠️ "
+            click.echo(f"  {marker} step {finding.index + 1}: {finding.message}")
+
+        if not analysis.errors or attempt == max_replans:
+            return plan
+        if interactive and not click.confirm("\nReplan now with these problems as feedback?", default=True):
+            return plan
+
+        replanned = generate_plan(task_description, previous_attempt=plan,
+                                  feedback=f"The plan would fail before it runs:\n{analysis.report()}",
+                                  use_cache=use_cache, candidates=candidates,
+                                  on_step=plan_step_printer("📋 Replanned:") if stream else None)
+        if not replanned or replanned == plan:
+            click.echo("❌ Replanning did not produce a different plan; keeping the current one.")
+            return plan
+        if not stream:
+            click.echo("\n📋 Replanned:")
+            for idx, step in enumerate(replanned, 1):
+                click.echo(f"  {idx}. {step}")
+        plan = replanned
+    return plan
+
+def run_unattended(task_description, plan, generate_plan, workspace, journal, accept_result, on_output=None,
+                   step_timeout=None, plan_timeout=None, max_rounds=None, use_cache=True, candidates=None,
+                   stream=True, check_plan=None):
+
+    #--auto: execute and refine from the executor's own error output until the plan succeeds or a stop
+    # condition is hit; plans with unsafe commands are never run unattended
+
+    from ai_integration.plan_parser import parse_plan
+    from executor.command_executor import run_plan
+    from feedback.feedback_loop import refine_until_done
+    from feedback.history import record_run
+
+    rounds = []
+
+    def is_safe(candidate):
+        _, _, unsafe_commands = parse_plan(candidate)
+        for command in unsafe_commands:
+            click.echo(f"  ⚠️  unsafe, needs review: {command}")
+        return not unsafe_commands
+
+    def execute(candidate):
+        #every round starts from the same state in the sandbox
+        if workspace:
+            workspace.restore()
+            if journal is not None:
+                journal.clear()
+        result = run_plan(candidate, on_output=on_output, step_timeout=step_timeout, plan_timeout=plan_timeout,
+                          cwd=workspace.path if workspace else None, journal=journal)
+        record_run(task_description, candidate, result, mode="auto", round_number=len(rounds))
+        rounds.append(result.success)
+        return result
+
+    def refine(task, previous_attempt=None, feedback=None):
+        refined = generate_plan(task, previous_attempt=previous_attempt, feedback=feedback, use_cache=use_cache,
+                                candidates=candidates,
+                                on_step=plan_step_printer("📋 Refined Plan:") if stream else None)
+        if refined and not stream:
+            click.echo("\n📋 Refined Plan:")
+            for idx, step in enumerate(refined, 1):
+                click.echo(f"  {idx}. {step}")
+        return check_plan(refined) if check_plan and refined else refined
+
+    success, plan, output, reason = refine_until_done(task_description, plan, refine, execute,
+                                                      max_rounds=max_rounds, is_safe=is_safe)
+
+    if success:
+        click.echo("\n✅ Task completed successfully!")
+        click.echo(f"\nOutput:\n{output}")
+        accept_result()
+    else:
+        click.echo(f"\n❌ Stopped: {reason}.")
+        if output:
+            click.echo(f"\nLast output:\n{output}")
+        sys.exit(1)
+
+@cli.command()
+@click.argument('source', default='-')
+@click.option('--output', '-o', default='batch_results.jsonl', show_default=True,
+              help='JSONL file results are appended to.')
+@click.option('--workers', '-w', type=int, default=4, show_default=True, help='Tasks processed concurrently.')
+@click.option('--rate', type=float, default=30.0, show_default=True,
+              help='Maximum plan requests per minute sent to the AI provider (0 = unlimited).')
+@click.option('--auto-approve', is_flag=True, default=False,
+              help='Execute plans that contain no unsafe commands without asking.')
+@click.option('--workdir-root', default='batch_runs', show_default=True,
+              help='Each task executes in its own subdirectory of this directory.')
+@click.option('--no-cache', is_flag=True, default=False, help='Always ask the AI provider instead of reusing a cached plan.')
+def batch(source, output, workers, rate, auto_approve, workdir_root, no_cache):
+    #run a JSONL file of tasks (or stdin with '-') without interactive prompts
+
+    from cli.batch import run_batch
+
+    summary = run_batch(source, output, workers=workers, rate_per_minute=rate, auto_approve=auto_approve,
+                        workdir_root=workdir_root, use_cache=not no_cache)
+
+    click.echo(f"\nResults written to {output}")
+    for status, count in sorted(summary.items()):
+        click.echo(f"  {status}: {count}")
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to listen on.')
+@click.option('--port', type=int, default=lambda: int(os.getenv('AI_DAEMON_PORT', '0')),
+              help='Port to listen on (0 = any free port).')
+@click.option('--max-concurrent', type=int, default=8, show_default=True,
+              help='Requests handled at the same time.')
+def serve(host, port, max_concurrent):
+    #run a persistent agent daemon that keeps providers and the plan cache warm
+
+    from cli.server import serve as serve_forever
+
+    click.echo(f"Starting agent daemon on {host} (Ctrl-C to stop)...")
+    try:
+        serve_forever(host=host, port=port, max_concurrent=max_concurrent)
+    except KeyboardInterrupt:
+        click.echo("\nAgent daemon stopped.")
+
+@cli.command()
+@click.option('--clear', is_flag=True, default=False, help='Remove all cached plans and reset counters.')
+def cache(clear):
+    #show plan cache statistics
+
+    from ai_integration.plan_cache import get_plan_cache
+
+    plan_cache = get_plan_cache()
+    if plan_cache is None:
+        click.echo("Plan cache is disabled (PLAN_CACHE_ENABLED=False).")
+        return
+
+    if clear:
+        plan_cache.clear()
+        click.echo("Plan cache cleared.")
+        return
+
+    stats = plan_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = (stats["hits"] / lookups * 100) if lookups else 0.0
+
+    click.echo(f"Plan cache: {plan_cache.path}")
+    click.echo(f"  Entries:   {stats['entries']} ({stats['bytes']} bytes)")
+    click.echo(f"  Hits:      {stats['hits']}")
+    click.echo(f"  Misses:    {stats['misses']}")
+    click.echo(f"  Hit rate:  {hit_rate:.1f}%")
+    click.echo(f"  Evictions: {stats['evictions']}")
+
+@cli.command()
+@click.option('--days', type=float, default=30, show_default=True, help='Only look at runs from the last N days.')
+@click.option('--limit', type=int, default=10, show_default=True, help='Rows shown per table.')
+@click.option('--clear', is_flag=True, default=False, help='Delete the recorded history.')
+def history(days, limit, clear):
+    #show success rates, slowest steps and common failure classes from the run history
+
+    from feedback.history import get_history_store
+
+    store = get_history_store()
+    if store is None:
+        click.echo("Run history is disabled (HISTORY_ENABLED=False).")
+        return
+
+    if clear:
+        store.clear()
+        click.echo("Run history cleared.")
+        return
+
+    summary = store.summary(days)
+    rate = (summary["succeeded"] / summary["runs"] * 100) if summary["runs"] else 0.0
+    click.echo(f"Run history: {store.path} (last {days:g} days)")
+    click.echo(f"  Runs:         {summary['runs']} ({rate:.1f}% succeeded, {summary['average_seconds']:.1f}s average)")
+    for mode in summary["modes"]:
+        click.echo(f"    {mode['mode']:<12}{mode['runs']} runs, {mode['succeeded']} succeeded")
+    click.echo(f"  Feedback:     {summary['feedback']}")
+
+    slowest = store.slowest_steps(days, limit)
+    if slowest:
+        click.echo("\nSlowest steps (average / max seconds, runs, failures):")
+        for step in slowest:
+            command = step["command"] if len(step["command"]) <= 60 else step["command"][:57] + "..."
+            click.echo(f"  {step['average_seconds']:7.2f} {step['max_seconds']:7.2f} {step['runs']:5d} "
+                       f"{step['failures']:5d}  {command}")
+
+    failures = store.failure_classes(days, limit)
+    if failures:
+        click.echo("\nFailure classes:")
+        for failure in failures:
+            example = (failure["example"] or "")[:70]
+            click.echo(f"  {failure['failure_class']:<15}{failure['runs']:5d}  {example}")
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
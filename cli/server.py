@@ -0,0 +1,207 @@
+#long-running agent daemon: keeps providers, pooled sessions and the plan cache warm
+#and serves plan / parse / execute / feedback requests over a token-protected localhost HTTP API
+
+import os
+import sys
+import json
+import time
+import hmac
+import signal
+import secrets
+import functools
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from ai_integration.ai_client import generate_plan, get_ai_provider
+from ai_integration.plan_cache import get_plan_cache
+from ai_integration.plan_parser import parse_plan
+from executor.command_executor import run_plan
+from executor.plan_analyzer import analyze_plan
+from feedback.feedback_loop import log_feedback, analyze_feedback
+from feedback.history import record_run
+from cli.client import get_state_path
+
+logger = logging.getLogger(__name__)
+
+#largest request body accepted, plans and outputs are small
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+def handle_plan(body):
+    #candidate plans are analyzed against the client's working directory, not the daemon's
+    analyze = functools.partial(analyze_plan, cwd=body.get("cwd") or os.getcwd())
+    plan = generate_plan(body["task"], previous_attempt=body.get("previous_attempt"),
+                         feedback=body.get("feedback"), use_cache=body.get("use_cache", True),
+                         candidates=body.get("candidates"), allow_reuse=body.get("allow_reuse", True),
+                         analyze=analyze)
+    return {"plan": plan}
+
+def handle_parse(body):
+    safe_commands, file_operations, unsafe_commands = parse_plan(body["plan"])
+    return {"safe_commands": safe_commands, "file_operations": file_operations, "unsafe_commands": unsafe_commands}
+
+def handle_execute(body):
+    #always runs with an explicit cwd so concurrent plans never move the daemon's working directory
+    cwd = body.get("cwd") or os.getcwd()
+    if not os.path.isdir(cwd):
+        raise ValueError(f"Working directory does not exist: {cwd}")
+
+    result = run_plan(body["plan"], step_timeout=body.get("step_timeout"),
+                      plan_timeout=body.get("plan_timeout"), cwd=cwd)
+    record_run(body.get("task"), body["plan"], result, mode="daemon")
+    return {"success": result.success, "output": result.summary()}
+
+def handle_feedback(body):
+    log_feedback(body["task"], body.get("plan", []), body.get("output", ""), body["feedback"])
+    return {"analysis": analyze_feedback(body["feedback"])}
+
+ENDPOINTS = {
+    "/plan": handle_plan,
+    "/parse": handle_parse,
+    "/execute": handle_execute,
+    "/feedback": handle_feedback,
+}
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    # JSON in, JSON out; every request must carry the daemon's bearer token
+
+    protocol_version = "HTTP/1.1"
+    #replies are small, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        supplied = self.headers.get("Authorization", "")
+        return hmac.compare_digest(supplied, f"Bearer {self.server.token}")
+
+    def do_GET(self):
+        if not self._authorized():
+            return self._reply(401, {"error": "unauthorized"})
+        if self.path != "/health":
+            return self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+        provider = get_ai_provider()
+        self._reply(200, {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_seconds": time.monotonic() - self.server.started,
+            "provider": provider.name,
+            "model": provider.model,
+            "requests_served": self.server.requests_served,
+        })
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._reply(401, {"error": "unauthorized"})
+
+        handler = ENDPOINTS.get(self.path)
+        if handler is None:
+            return self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._reply(400, {"error": "invalid Content-Length"})
+        if length > MAX_REQUEST_BYTES:
+            return self._reply(413, {"error": "request too large"})
+
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            return self._reply(400, {"error": f"invalid JSON: {str(e)}"})
+
+        with self.server.slots:
+            try:
+                result = handler(body)
+            except KeyError as e:
+                return self._reply(400, {"error": f"missing field {str(e)}"})
+            except Exception as e:
+                logger.error(f"Error handling {self.path}: {str(e)}")
+                return self._reply(500, {"error": str(e)})
+
+        with self.server.counter_lock:
+            self.server.requests_served += 1
+        self._reply(200, result)
+
+class AgentServer(ThreadingHTTPServer):
+    # one thread per connection; `max_concurrent` bounds how many requests do work at once
+
+    daemon_threads = True
+
+    def __init__(self, address, max_concurrent=8, token=None):
+        super().__init__(address, AgentRequestHandler)
+        self.token = token or secrets.token_urlsafe(32)
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self.started = time.monotonic()
+        self.requests_served = 0
+        self.counter_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def warm_up():
+
+    #builds the provider (and its pooled session) and opens the plan cache before the first request
+
+    try:
+        provider = get_ai_provider()
+        logger.info(f"Provider ready: {provider.name} ({provider.model})")
+    except Exception as e:
+        logger.warning(f"Provider could not be initialized yet: {str(e)}")
+    get_plan_cache()
+
+def write_state(server):
+    #readable only by the current user, the token grants command execution
+    path = get_state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"url": server.url, "token": server.token, "pid": os.getpid()}, f)
+    return path
+
+def remove_state():
+    path = get_state_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            owner = json.load(f).get("pid")
+    except (OSError, ValueError):
+        return
+    #another daemon may have replaced the file since
+    if owner == os.getpid():
+        os.remove(path)
+
+def serve(host="127.0.0.1", port=0, max_concurrent=8):
+
+    # runs the daemon until interrupted; port 0 picks a free port
+    # the address and token are written to the state file that the CLI client reads
+
+    server = AgentServer((host, port), max_concurrent=max_concurrent,
+                         token=os.getenv("AI_DAEMON_TOKEN") or None)
+    warm_up()
+
+    #a plain `kill` should also remove the state file
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    state_path = write_state(server)
+    logger.info(f"Agent daemon listening on {server.url} (state: {state_path})")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        remove_state()
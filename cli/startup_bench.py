@@ -0,0 +1,93 @@
+#startup-time benchmark and regression check for the CLI entry point
+#run with: python -m cli.startup_bench [runs]
+#exits non-zero when the import budget is exceeded or a heavy module loads at startup, so it can gate CI
+
+import os
+import re
+import sys
+import statistics
+import subprocess
+import time
+
+#modules that must only load once a subcommand needs them
+LAZY_MODULES = (
+    "requests",
+    "urllib3",
+    "ai_integration.ai_client",
+    "ai_integration.safety_rules",
+    "executor.command_executor",
+    "feedback.feedback_loop",
+    "feedback.history",
+    "cli.server",
+)
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module="cli.main"):
+
+    #imports module in a fresh interpreter under -X importtime
+    # returns (cumulative microseconds for module, {imported module: cumulative microseconds})
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imported[match.group(4)] = int(match.group(2))
+    return imported.get(module, 0), imported
+
+def measure_help():
+    #wall-clock time of `ai-task --help`, interpreter startup included
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "cli.main", "--help"], cwd=ROOT,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - started
+
+def run_benchmark(runs=10, budget_ms=None):
+
+    # returns a report dict; report["ok"] is False when the budget is blown or a lazy module loaded eagerly
+
+    if budget_ms is None:
+        budget_ms = float(os.getenv("CLI_IMPORT_BUDGET_MS", "100"))
+
+    import_times, help_times, eager = [], [], set()
+    slowest = {}
+    for _ in range(runs):
+        total, imported = measure_import()
+        import_times.append(total / 1000.0)
+        eager.update(name for name in LAZY_MODULES if name in imported)
+        for name, cumulative in imported.items():
+            slowest[name] = max(slowest.get(name, 0), cumulative)
+        help_times.append(measure_help() * 1000.0)
+
+    import_ms = statistics.median(import_times)
+    return {
+        "runs": runs,
+        "import_ms": import_ms,
+        "help_ms": statistics.median(help_times),
+        "budget_ms": budget_ms,
+        "eager_modules": sorted(eager),
+        "top_imports": sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:10],
+        "ok": import_ms <= budget_ms and not eager,
+    }
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    report = run_benchmark(runs)
+
+    print(f"{report['runs']} runs (medians)")
+    print(f"  import cli.main: {report['import_ms']:.1f} ms (budget {report['budget_ms']:.0f} ms)")
+    print(f"  ai-task --help:  {report['help_ms']:.1f} ms (including interpreter startup)")
+    print("  slowest imports (cumulative):")
+    for name, cumulative in report["top_imports"]:
+        print(f"    {cumulative / 1000.0:7.1f} ms  {name}")
+
+    if report["eager_modules"]:
+        print(f"FAIL: loaded at startup: {', '.join(report['eager_modules'])}")
+    if report["import_ms"] > report["budget_ms"]:
+        print("FAIL: import time over budget")
+    sys.exit(0 if report["ok"] else 1)
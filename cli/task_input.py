@@ -1,7 +1,11 @@
 #handles capturing and validating user task descriptions
 
 import click
-import re
+from ai_integration.safety_rules import check_task
+#language/framework/directory extraction lives with the plan retrieval that uses it; kept importable from here
+from ai_integration.task_context import classify_task, parse_task_context
+#removing extra whitespace, etc.; lives with the prompt code so the plan cache can share it
+from ai_integration.prompt_builder import normalize_task
 
 def get_task_description():
 
@@ -24,78 +28,10 @@ def get_task_description():
         return None
     
     #checking for potentially dangerous operations
-    dangerous_patterns = [
-        r"rm\s+-rf", r"format\s+disk", r"del\s+/[Ff]", r"sudo\s+rm",
-        r"mkfs", r"fdisk", r"dd\s+if", r":(){ :\|:& };:",
-        r"rmdir\s+/[sS]", r"format\s+[a-zA-Z]:", r"del\s+/[aAsSqQ]"
-    ]
-    
-    for pattern in dangerous_patterns:
-        if re.search(pattern, task, re.IGNORECASE):
-            click.echo("WARNING: Task contains potentially dangerous operations and cannot be processed.")
-            return None
+    if check_task(task):
+        click.echo("WARNING: Task contains potentially dangerous operations and cannot be processed.")
+        return None
             
-    #removing extra whitespace, etc.
-    task = " ".join(task.split())
+    task = normalize_task(task)
     
     return task
-
-def parse_task_context(task_description):
-
-    #to extract context from the task description
-    #such as programming language, target directory, or other relevant params
-    # returns a dictionary with the extracted context
-
-    context = {
-        "language": None,
-        "directory": ".",
-        "framework": None,
-    }
-    
-    #extract programming language
-    language_patterns = {
-        r"python|\.py": "python",
-        r"javascript|node\.?js|\.js": "javascript",
-        r"typescript|\.ts": "typescript",
-        r"java|\.java": "java",
-        r"c\+\+|cpp|\.cpp": "cpp",
-        r"c#|\.cs|csharp": "csharp",
-        r"go|golang|\.go": "go",
-        r"rust|\.rs": "rust",
-        r"ruby|\.rb": "ruby",
-        r"php|\.php": "php",
-        r"html|\.html": "html",
-        r"css|\.css": "css",
-        r"shell|bash|\.sh": "bash",
-    }
-    
-    for pattern, lang in language_patterns.items():
-        if re.search(pattern, task_description, re.IGNORECASE):
-            context["language"] = lang
-            break
-            
-    #extract framework
-    framework_patterns = {
-        r"react": "react",
-        r"angular": "angular",
-        r"vue": "vue",
-        r"django": "django",
-        r"flask": "flask",
-        r"express": "express",
-        r"spring": "spring",
-        r"rails": "rails",
-        r"laravel": "laravel",
-    }
-    
-    for pattern, framework in framework_patterns.items():
-        if re.search(pattern, task_description, re.IGNORECASE):
-            context["framework"] = framework
-            break
-            
-    #extract directory if specified
-    dir_match = re.search(r"in\s+(?:dir(?:ectory)?|folder)\s+[\"']?([^\"']+)[\"']?", 
-                         task_description, re.IGNORECASE)
-    if dir_match:
-        context["directory"] = dir_match.group(1).strip()
-    
-    return context
\ No newline at end of file
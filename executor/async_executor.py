@@ -0,0 +1,228 @@
+#dependency-aware parallel execution of plan commands
+#builds a DAG over the plan and runs independent steps concurrently on an asyncio loop
+
+import os
+import shlex
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from executor.process_control import terminate_active_processes
+
+#commands that only read the paths they are given
+READ_ONLY_COMMANDS = {
+    "ls", "dir", "cat", "type", "head", "tail", "wc", "find", "grep", "echo",
+    "pwd", "which", "where", "tree", "stat", "file", "du", "more",
+}
+
+#commands whose non-flag arguments are paths they create
+CREATE_COMMANDS = {"mkdir", "md", "touch"}
+
+#package managers share one environment, so installs run one at a time
+# but can overlap with unrelated steps
+INSTALL_COMMANDS = {
+    "pip": "<python-env>",
+    "pip3": "<python-env>",
+    "npm": "<node-env>",
+    "yarn": "<node-env>",
+}
+
+#anything containing these is treated as a barrier (pipes, chaining, substitution)
+SHELL_METACHARACTERS = ("|", "&", ";", "`", "$(", "\n")
+
+REDIRECT_WRITE_TOKENS = (">", ">>", "1>", "2>", "1>>", "2>>")
+
+class StepEffects:
+    # what a single step touches; barrier steps are ordered against everything
+
+    def __init__(self, reads=None, writes=None, barrier=False, cwd_change=None):
+        self.reads = reads or set()
+        self.writes = writes or set()
+        self.barrier = barrier
+        self.cwd_change = cwd_change
+
+def _resolve(path, cwd):
+    #glob patterns are resolved to the directory they scan
+    for wildcard in "*?[":
+        if wildcard in path:
+            path = os.path.dirname(path.split(wildcard, 1)[0]) or "."
+    return os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
+
+def _conflicts(paths_a, paths_b):
+    #two path sets conflict if they share a path or one contains the other
+    for a in paths_a:
+        for b in paths_b:
+            if a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep):
+                return True
+    return False
+
+def analyze_step(command, cwd, windows=False):
+
+    #returns the StepEffects of a command, run from cwd
+    # anything not understood is a barrier so the DAG never reorders it
+
+    stripped = command.strip()
+    lowered = stripped.lower()
+
+    if lowered == "cd" or lowered.startswith("cd "):
+        new_dir = stripped[3:].strip().strip('"').strip("'")
+        return StepEffects(barrier=True, cwd_change=_resolve(new_dir, cwd))
+
+    if any(char in stripped for char in SHELL_METACHARACTERS):
+        return StepEffects(barrier=True)
+
+    try:
+        tokens = shlex.split(stripped, posix=not windows)
+    except ValueError:
+        return StepEffects(barrier=True)
+
+    if not tokens:
+        return StepEffects(barrier=True)
+
+    #pull redirections out of the argument list
+    args, reads, writes = [], set(), set()
+    iterator = iter(tokens[1:])
+    for token in iterator:
+        if token in REDIRECT_WRITE_TOKENS:
+            target = next(iterator, None)
+            if target:
+                writes.add(_resolve(target, cwd))
+        elif token == "<":
+            source = next(iterator, None)
+            if source:
+                reads.add(_resolve(source, cwd))
+        elif token.startswith(">"):
+            writes.add(_resolve(token.lstrip(">"), cwd))
+        else:
+            args.append(token)
+
+    program = os.path.basename(tokens[0]).lower()
+    if program.endswith(".exe"):
+        program = program[:-4]
+    paths = [_resolve(arg, cwd) for arg in args if not arg.startswith("-") and not (windows and arg.startswith("/"))]
+
+    if program in READ_ONLY_COMMANDS:
+        reads.update(paths or [_resolve(".", cwd)])
+        return StepEffects(reads=reads, writes=writes)
+
+    if program in CREATE_COMMANDS:
+        writes.update(paths)
+        return StepEffects(reads=reads, writes=writes)
+
+    #python -m pip install ... is the same as pip install ...
+    if program.startswith("python") and args[:2] == ["-m", "pip"]:
+        program, args = "pip", args[2:]
+
+    if program in INSTALL_COMMANDS and args and args[0] in ("install", "i", "add"):
+        writes.add(INSTALL_COMMANDS[program])
+        if program in ("npm", "yarn"):
+            for name in ("node_modules", "package.json", "package-lock.json", "yarn.lock"):
+                writes.add(_resolve(name, cwd))
+        for flag, value in zip(args, args[1:]):
+            if flag in ("-r", "--requirement"):
+                reads.add(_resolve(value, cwd))
+        return StepEffects(reads=reads, writes=writes)
+
+    return StepEffects(barrier=True)
+
+def build_dependency_graph(commands, cwd=None, windows=False):
+
+    # returns (deps, effects) where deps[i] is the set of step indices step i must wait for
+    # ordering rules: barriers (cd, unknown commands) wait for everything before them and
+    # everything after waits for them; otherwise a step waits for any earlier step whose
+    # writes overlap its reads/writes, or whose reads overlap its writes
+
+    current_cwd = cwd or os.getcwd()
+    deps, effects = [], []
+    last_barrier = None
+
+    for index, command in enumerate(commands):
+        step = analyze_step(command, current_cwd, windows)
+        effects.append(step)
+
+        if step.barrier:
+            step_deps = set(range(last_barrier + 1 if last_barrier is not None else 0, index))
+            if last_barrier is not None:
+                step_deps.add(last_barrier)
+            last_barrier = index
+            if step.cwd_change:
+                current_cwd = step.cwd_change
+        else:
+            step_deps = {last_barrier} if last_barrier is not None else set()
+            start = last_barrier + 1 if last_barrier is not None else 0
+            for previous in range(start, index):
+                other = effects[previous]
+                if _conflicts(other.writes, step.reads | step.writes) or _conflicts(other.reads, step.writes):
+                    step_deps.add(previous)
+
+        deps.append(step_deps)
+
+    return deps, effects
+
+async def execute_commands_async(commands, run_command, concurrency=4, cwd=None, windows=False):
+
+    # runs commands following the dependency graph, at most `concurrency` at a time
+    # run_command(index, cwd) is the blocking runner for step `index`; it is called on a worker thread
+    # returns (per-step (success, output) results in plan order, final working directory)
+
+    deps, effects = build_dependency_graph(commands, cwd, windows)
+    state = {"cwd": cwd or os.getcwd()}
+    results = [None] * len(commands)
+
+    loop = asyncio.get_running_loop()
+    finished = [loop.create_future() for _ in commands]
+
+    def run_step(index):
+        step = effects[index]
+        if step.cwd_change:
+            #cd is a barrier, so nothing else is running while the working directory moves
+            if os.path.isdir(step.cwd_change):
+                state["cwd"] = step.cwd_change
+                return True, f"Changed directory to {step.cwd_change}"
+            return False, f"Failed to change directory: no such directory {step.cwd_change}"
+        return run_command(index, state["cwd"])
+
+    async def schedule(index, pool):
+        try:
+            if deps[index]:
+                await asyncio.gather(*(finished[dep] for dep in deps[index]))
+            results[index] = await loop.run_in_executor(pool, run_step, index)
+        except Exception as e:
+            results[index] = (False, f"Error executing command: {str(e)}")
+        finally:
+            #on Ctrl-C the gathers waiting for this step have already cancelled its future
+            if not finished[index].done():
+                finished[index].set_result(True)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        await asyncio.gather(*(schedule(index, pool) for index in range(len(commands))))
+    except asyncio.CancelledError:
+        #don't wait for running steps here; their processes are terminated once the loop has stopped
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    return results, state["cwd"]
+
+def execute_commands_parallel(commands, run_command, concurrency=None, windows=False, cwd=None):
+
+    # sync entry point used by execute_plan
+    # without an explicit cwd it leaves the process in the final working directory,
+    # like the serial path does with cd; with one, the process cwd is never touched
+
+    if concurrency is None:
+        concurrency = int(os.getenv("EXECUTOR_CONCURRENCY", str(min(8, os.cpu_count() or 4))))
+
+    try:
+        results, final_cwd = asyncio.run(
+            execute_commands_async(commands, run_command, concurrency=concurrency, cwd=cwd, windows=windows)
+        )
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        #Ctrl-C cancels the loop, but steps still running on worker threads have to be killed
+        terminate_active_processes()
+        raise
+
+    if cwd is None and final_cwd != os.getcwd():
+        os.chdir(final_cwd)
+
+    return results
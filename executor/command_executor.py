@@ -1,20 +1,40 @@
 #executes commands safely and handles file operations
 
 import os
-import subprocess
 import tempfile
 import shlex
+import time
 import platform
 from ai_integration.plan_parser import parse_plan
+from ai_integration.safety_rules import check_command
+from ai_integration.plan_model import Plan, Step, StepResult, PlanResult, WRITE_FILE
+from ai_integration.response_parser import parse_background_step
+from executor.async_executor import execute_commands_parallel
+from executor.file_writer import write_files
+from executor.process_control import (
+    run_process, start_background, stop_background_processes, terminate_active_processes
+)
 
 def is_windows():
     #check if the system is Windows
     return platform.system().lower() == "windows"
 
-def execute_command(command, cwd=None):
+def get_step_timeout():
+    #per-step wall-clock budget in seconds, 0 disables it
+    return float(os.getenv('EXECUTOR_STEP_TIMEOUT', '600'))
+
+def get_plan_timeout():
+    #wall-clock budget for all commands of a plan in seconds, 0 disables it
+    return float(os.getenv('EXECUTOR_PLAN_TIMEOUT', '3600'))
+
+def execute_command(command, cwd=None, on_output=None, timeout=None, result=None, background_processes=None):
 
     #executes a single command safely  
     # returns "success" bool, output of the command or error message
+    # on_output(stream_name, line) is called for every output line as it is produced
+    # the command's process group is terminated once it runs longer than timeout seconds
+    # result, a StepResult, gets the exit code, byte counts and truncation of a process run
+    # background_processes, a list, collects the processes of background steps so their plan can stop them
 
     debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
     
@@ -49,19 +69,29 @@ def execute_command(command, cwd=None):
             except Exception as e:
                 return False, f"Failed to change directory: {str(e)}"
         
+        #long-running steps (servers, watchers) are started and left running once ready
+        background = parse_background_step(command)
+        if background:
+            inner_command, readiness = background
+            success, message, process = start_background(inner_command, readiness, cwd=cwd, on_output=on_output)
+            if background_processes is not None:
+                background_processes.append(process)
+            return success, message
+
         #execute the command
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=cwd
-        )
-        
-        stdout, stderr = process.communicate()
+        stats = {}
+        returncode, stdout, stderr, timed_out = run_process(command, cwd=cwd, on_output=on_output,
+                                                            timeout=timeout or None, stats=stats)
+        if result is not None:
+            result.exit_code = returncode
+            result.timed_out = timed_out
+            result.stdout_bytes = stats["stdout_bytes"]
+            result.stderr_bytes = stats["stderr_bytes"]
+            result.omitted_chars = stats["omitted_chars"]
         
-        if process.returncode == 0:
+        if timed_out:
+            return False, f"Command timed out after {timeout:g}s and was terminated:\n{stderr or stdout}"
+        elif returncode == 0:
             return True, stdout
         else:
             return False, f"Command failed with error:\n{stderr}"
@@ -72,67 +102,142 @@ def execute_command(command, cwd=None):
 def create_file(filename, content):
 
     #to create a file with the specified content
+    # written to a temp file and moved into place, so a failed write never leaves a truncated file
     debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
     
     if debug_mode:
         print(f"Creating file: {filename}")
         print(f"Content length: {len(content)} characters")
     
-    try:
-        directory = os.path.dirname(filename)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory)
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(content)
-            
-        return True, f"File created: {filename}"
-    
-    except Exception as e:
-        return False, f"Error creating file {filename}: {str(e)}"
+    _, success, message = write_files({filename: content}, workers=1)[0]
+    return success, message
 
-def execute_plan(plan):
+def execute_plan(plan, parallel=None, on_output=None, step_timeout=None, plan_timeout=None, cwd=None, journal=None):
 
     # main fn. to execute a plan of commands
+    # returns (success, combined_output); run_plan() returns the same outcome as a typed PlanResult
+
+    result = run_plan(plan, parallel=parallel, on_output=on_output, step_timeout=step_timeout,
+                      plan_timeout=plan_timeout, cwd=cwd, journal=journal)
+    return result.success, result.summary()
+
+def run_plan(plan, parallel=None, on_output=None, step_timeout=None, plan_timeout=None, cwd=None, journal=None):
+
+    # executes a plan (plan strings or a Plan) and returns a PlanResult
+    # on_output(command, stream_name, line) receives live output from every step
+    # step_timeout / plan_timeout are wall-clock budgets in seconds (defaults from the environment)
+    # with cwd the plan runs in that directory without changing the process cwd,
+    # so several plans can execute side by side (batch mode)
+    # with parallel=True (default from EXECUTOR_PARALLEL) independent commands run concurrently,
+    # following a dependency graph that keeps cd, file writes/reads and unknown commands in order
+    # with a StepJournal (executor.journal), the unchanged prefix of a previously run plan is skipped
+    # and the run is recorded for the next attempt
+    # background steps (servers) keep running while the rest of the plan runs and are stopped once it is done
+
+    if parallel is None:
+        parallel = os.getenv('EXECUTOR_PARALLEL', 'True').lower() == 'true'
+    if step_timeout is None:
+        step_timeout = get_step_timeout()
+    if plan_timeout is None:
+        plan_timeout = get_plan_timeout()
+    if isinstance(plan, Plan):
+        plan = plan.to_strings()
+
+    plan_started = time.monotonic()
 
     # FIRST parse and validate the plan
     safe_commands, file_operations, unsafe_commands = parse_plan(plan)
     
     if unsafe_commands:
-        unsafe_list = "\n".join([f"- {cmd}" for cmd in unsafe_commands])
-        return False, f"Plan contains potentially unsafe commands:\n{unsafe_list}"
+        unsafe_list = "\n".join([f"- {cmd} (rule: {check_command(cmd)})" for cmd in unsafe_commands])
+        return PlanResult(success=False, error=f"Plan contains potentially unsafe commands:\n{unsafe_list}")
     
-    #handle file operations first
+    #handle file operations first, as one atomic batch: either every file is written or none is
     file_results = []
     all_success = True
     
-    for filename, content in file_operations.items():
-        success, message = create_file(filename, content)
-        file_results.append(message)
-        if not success:
-            all_success = False
+    if file_operations:
+        if os.getenv('DEBUG_MODE', 'False').lower() == 'true':
+            print(f"Writing {len(file_operations)} file(s)")
+        started = time.monotonic()
+        written = write_files(file_operations, base_dir=cwd)
+        duration = (time.monotonic() - started) / len(written)
+        for filename, success, message in written:
+            file_results.append(StepResult(index=len(file_results), kind=WRITE_FILE, command=filename,
+                                           success=success, duration=duration, output=message))
+            if not success:
+                all_success = False
     
+    #bracket artifacts of badly formatted arrays are already dropped by the response parser,
+    # so bracketed steps such as [BACKGROUND] blocks or `[ -d dir ] || ...` tests run as written
+    commands = safe_commands
+
+    deadline = time.monotonic() + plan_timeout if plan_timeout else None
+    step_results = [StepResult(index=index, kind=Step.from_command(command).kind, command=command)
+                    for index, command in enumerate(commands)]
+
+    skipped = {}
+    if journal is not None:
+        keys, step_cwds, skipped = journal.plan_resume(commands, [result.kind for result in step_results],
+                                                       windows=is_windows())
+
+    def run_step(index, cwd=None):
+        command = commands[index]
+        if index in skipped:
+            step_results[index].skipped = True
+            return True, skipped[index].get("output", "")
+
+        timeout = step_timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False, "Skipped: plan time budget exhausted"
+            timeout = min(timeout, remaining) if timeout else remaining
+
+        step_output = None
+        if on_output:
+            step_output = lambda stream_name, line: on_output(command, stream_name, line)
+
+        started = time.monotonic()
+        outcome = execute_command(command, cwd=cwd, on_output=step_output, timeout=timeout,
+                                  result=step_results[index], background_processes=background_processes)
+        step_results[index].duration = time.monotonic() - started
+        return outcome
+
     #execute each command
-    cmd_results = []
-    for command in safe_commands:
-        #Tweak: there were issues in formatting the array brackets '[' ']' while parsing the generated commands.
-        # SO, skipping commands that are likely artifacts of parsing
-        if command.startswith('[') and command.endswith(']'):
-            continue
-        
-        success, output = execute_command(command)
-        cmd_results.append(f"Command: {command}\n{'Success:' if success else 'Error:'} {output}")
+    background_processes = []
+    try:
+        if cwd is not None:
+            #cd steps are tracked by the engine instead of os.chdir
+            outcomes = execute_commands_parallel(commands, run_step, concurrency=None if parallel else 1,
+                                                 windows=is_windows(), cwd=cwd)
+        elif parallel and len(commands) > 1:
+            outcomes = execute_commands_parallel(commands, run_step, windows=is_windows())
+        else:
+            outcomes = [run_step(index) for index in range(len(commands))]
+    except KeyboardInterrupt:
+        #Ctrl-C: take down every running step's process group before giving up
+        terminate_active_processes()
+        raise
+    finally:
+        #a long-lived process (the daemon) runs many plans; their servers must not outlive them
+        stop_background_processes(background_processes)
+
+    for step_result, (success, output) in zip(step_results, outcomes):
+        step_result.success = success
+        step_result.output = output
         
         if not success:
             all_success = False
-    
-    # Combine results
-    combined_output = "\n\n".join(file_results + cmd_results)
+
+    if journal is not None:
+        journal.record(keys, commands, step_cwds, step_results, windows=is_windows())
     
     # if we have successful file creation but command errors, we might still consider it
     # a partial success - especially for file creation tasks
-    if file_operations and all(result.startswith("File created:") for result in file_results):
+    if file_operations and all(result.success for result in file_results):
         # check if this was primarily a file creation task
-        return True, combined_output
+        all_success = True
     
-    return all_success, combined_output
\ No newline at end of file
+    return PlanResult(success=all_success, results=file_results + step_results,
+                      duration=time.monotonic() - plan_started)
@@ -0,0 +1,225 @@
+#atomic bulk writing of a plan's [WRITE_FILE] operations
+#every file is written to a temp file next to its target and moved into place with os.replace,
+#files whose content is already on disk are skipped, and a failure anywhere rolls the whole batch back
+#so a plan never leaves a half-written scaffold behind
+
+import os
+import stat
+import uuid
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+#below this many files a thread pool costs more than it saves
+PARALLEL_THRESHOLD = 4
+
+def get_file_workers():
+    #threads used to prepare file writes, 1 writes serially
+    return max(1, int(os.getenv('EXECUTOR_FILE_WORKERS', '8')))
+
+def _encode(content):
+    #same bytes open(..., 'w', encoding='utf-8') would produce, newline translation included
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode("utf-8")
+
+def _file_digest(path, size):
+
+    #sha256 of a file on disk, None when it does not exist or is not a regular file
+    # the size check avoids reading files that cannot match anyway
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode) or st.st_size != size:
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+class _PendingWrite:
+    # one target file and what has been done to it so far, so rollback knows what to undo
+
+    __slots__ = ("filename", "path", "data", "temp_path", "backup_path", "existed", "unchanged", "committed",
+                 "error")
+
+    def __init__(self, filename, path, data):
+        self.filename = filename
+        self.path = path
+        self.data = data
+        self.temp_path = None
+        self.backup_path = None
+        self.existed = False
+        self.unchanged = False
+        self.committed = False
+        self.error = None
+
+class FileWriteBatch:
+    # all-or-nothing write of {filename: content}
+    # apply() writes every file (or none of them), rollback() undoes an applied batch,
+    # discard() drops the backups and makes the batch final
+
+    def __init__(self, operations: Dict[str, str], base_dir: Optional[str] = None, workers: Optional[int] = None,
+                 fsync: Optional[bool] = None):
+        if workers is None:
+            workers = get_file_workers()
+        if fsync is None:
+            fsync = os.getenv('EXECUTOR_FILE_FSYNC', 'False').lower() == 'true'
+
+        self.workers = workers
+        self.fsync = fsync
+        self.applied = False
+        self._created_dirs: List[str] = []
+        self._writes = [_PendingWrite(filename, os.path.join(base_dir, filename) if base_dir else filename,
+                                      _encode(content))
+                        for filename, content in operations.items()]
+
+    def apply(self) -> List[Tuple[str, bool, str]]:
+
+        # returns [(filename, success, message)] in operation order
+        # temp files and backups are prepared first (concurrently for larger batches), then every
+        # file is moved into place; if anything fails, the files already replaced are restored
+
+        try:
+            self._make_directories()
+
+            if self.workers > 1 and len(self._writes) >= PARALLEL_THRESHOLD:
+                with ThreadPoolExecutor(max_workers=min(self.workers, len(self._writes))) as pool:
+                    list(pool.map(self._prepare, self._writes))
+            else:
+                for write in self._writes:
+                    self._prepare(write)
+
+            if not any(write.error for write in self._writes):
+                for write in self._writes:
+                    if write.unchanged:
+                        continue
+                    try:
+                        os.replace(write.temp_path, write.path)
+                        write.temp_path = None
+                        write.committed = True
+                    except OSError as e:
+                        write.error = str(e)
+                        break
+        except OSError as e:
+            #a directory could not be created; blame the first file that needed it
+            failed = next((write for write in self._writes if not os.path.isdir(os.path.dirname(write.path) or ".")),
+                          self._writes[0] if self._writes else None)
+            if failed is not None:
+                failed.error = str(e)
+
+        if any(write.error for write in self._writes):
+            self.rollback()
+            return [(write.filename, False,
+                     f"Error creating file {write.filename}: {write.error}" if write.error
+                     else f"File not written (batch rolled back): {write.filename}")
+                    for write in self._writes]
+
+        self.applied = True
+        return [(write.filename, True,
+                 f"File unchanged: {write.filename}" if write.unchanged else f"File created: {write.filename}")
+                for write in self._writes]
+
+    def rollback(self):
+
+        #restores every replaced file from its backup, removes new files and the directories created for them
+
+        for write in reversed(self._writes):
+            try:
+                if write.committed:
+                    if write.backup_path:
+                        os.replace(write.backup_path, write.path)
+                        write.backup_path = None
+                    else:
+                        os.remove(write.path)
+                    write.committed = False
+            except OSError:
+                pass
+        self._cleanup()
+
+        for directory in reversed(self._created_dirs):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        self._created_dirs = []
+        self.applied = False
+
+    def discard(self):
+        #keeps the written files and removes the backups
+        self._cleanup()
+
+    def _cleanup(self):
+        for write in self._writes:
+            for attr in ("temp_path", "backup_path"):
+                path = getattr(write, attr)
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    setattr(write, attr, None)
+
+    def _make_directories(self):
+        #each distinct parent directory is created once; the ones that did not exist are remembered for rollback
+        directories = sorted({os.path.dirname(os.path.abspath(write.path)) for write in self._writes})
+        for directory in directories:
+            missing = []
+            current = directory
+            while current and not os.path.isdir(current):
+                missing.append(current)
+                parent = os.path.dirname(current)
+                if parent == current:
+                    break
+                current = parent
+            if missing:
+                self._created_dirs.extend(reversed(missing))
+                os.makedirs(directory, exist_ok=True)
+
+    def _prepare(self, write):
+        try:
+            if os.path.islink(write.path):
+                #write through symlinks like open() does instead of replacing the link
+                write.path = os.path.realpath(write.path)
+
+            existing = _file_digest(write.path, len(write.data))
+            if existing is not None and existing == hashlib.sha256(write.data).digest():
+                write.unchanged = True
+                return
+
+            write.existed = os.path.lexists(write.path)
+            directory, name = os.path.split(write.path)
+            token = uuid.uuid4().hex[:12]
+            write.temp_path = os.path.join(directory, f".{name}.{token}.tmp")
+
+            #0o666 so the new file gets the usual umask-derived mode instead of mkstemp's 0600
+            fd = os.open(write.temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+            with os.fdopen(fd, "wb") as f:
+                f.write(write.data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if write.existed:
+                #keep the old file's permissions, and a backup of it for rollback
+                # a hard link costs nothing; filesystems without links get a copy
+                shutil.copymode(write.path, write.temp_path)
+                write.backup_path = os.path.join(directory, f".{name}.{token}.bak")
+                try:
+                    os.link(write.path, write.backup_path)
+                except (OSError, AttributeError):
+                    shutil.copy2(write.path, write.backup_path)
+        except Exception as e:
+            write.error = str(e)
+
+def write_files(operations: Dict[str, str], base_dir: Optional[str] = None,
+                workers: Optional[int] = None) -> List[Tuple[str, bool, str]]:
+    #writes a batch atomically and keeps it; on failure nothing is left changed
+    batch = FileWriteBatch(operations, base_dir=base_dir, workers=workers)
+    results = batch.apply()
+    batch.discard()
+    return results
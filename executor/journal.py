@@ -0,0 +1,243 @@
+#execution journal: lets a re-run plan skip the steps it already ran
+#every step gets a key chained over (command, working directory, relevant environment) of itself and all
+#steps before it, so a key only matches when the whole prefix is the same. after a run, the journal stores
+#each step's key, outcome and the state of the paths it touched. on the next run the longest prefix of
+#steps that succeeded, still has the same keys and whose paths are unchanged since then is skipped, and
+#execution resumes at the first changed step
+
+import os
+import json
+import time
+import shlex
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from executor.async_executor import analyze_step, INSTALL_COMMANDS, _resolve
+
+logger = logging.getLogger(__name__)
+
+#environment that changes what commands do; variables a command references are added per step
+JOURNAL_ENV_VARS = ("PATH", "VIRTUAL_ENV", "CONDA_PREFIX", "PYTHONPATH", "NODE_ENV")
+
+#dependency manifests installs read implicitly
+MANIFEST_FILES = ("requirements.txt", "pyproject.toml", "setup.py", "setup.cfg", "Pipfile.lock", "poetry.lock",
+                  "package.json", "package-lock.json", "yarn.lock")
+
+#files up to this size are hashed, larger ones are compared by size and mtime
+HASH_LIMIT = 16 * 1024 * 1024
+
+#directories are compared by a listing of everything below them (names, sizes, mtimes) of up to this many
+#entries; a step touching a larger directory always runs again
+DIR_ENTRY_LIMIT = 10000
+
+#subcommands of the package managers that only install, so the manifests decide whether they changed
+INSTALL_SUBCOMMANDS = ("install", "i", "ci", "add")
+
+#output kept per journaled step, shown again when the step is skipped
+OUTPUT_LIMIT = 2000
+
+_lock = threading.Lock()
+
+def get_journal_dir():
+    return os.path.expanduser(os.getenv("EXECUTOR_JOURNAL_DIR", "~/.cache/ai-task-agent/journals"))
+
+def _directory_state(path):
+
+    # digest of the relative path, size and mtime of every entry below path, or None past DIR_ENTRY_LIMIT
+    # symlinked directories are listed as links, not followed
+
+    listing, pending = [], [path]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            listing.append(f"{directory}\0unreadable")
+            continue
+        for entry in entries:
+            if len(listing) >= DIR_ENTRY_LIMIT:
+                return None
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            listing.append(f"{os.path.relpath(entry.path, path)}\0{st.st_size}\0{st.st_mtime_ns}")
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+    digest = hashlib.sha256("\n".join(sorted(listing)).encode("utf-8", "surrogateescape"))
+    return "dir:" + digest.hexdigest()
+
+def _path_state(path):
+
+    # what a path looks like now, compared between runs; None when it cannot be fingerprinted
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    if os.path.isdir(path):
+        return _directory_state(path)
+    if st.st_size > HASH_LIMIT:
+        return f"file:{st.st_size}:{st.st_mtime_ns}"
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return "unreadable"
+    return "sha256:" + digest.hexdigest()
+
+def _tokens(command, windows):
+    try:
+        return shlex.split(command, posix=not windows)
+    except ValueError:
+        return command.split()
+
+def step_paths(command, cwd, windows=False):
+
+    # paths a step depends on or produces: what the dependency analysis found, path-like arguments,
+    # and the dependency manifests for package installs
+    # None for package manager commands other than installs (npm test, yarn start, pip check, ...): what
+    # they do depends on sources no argument names, so they always run
+
+    effects = analyze_step(command, cwd, windows)
+    paths = {path for path in effects.reads | effects.writes if not path.startswith("<")}
+
+    tokens = _tokens(command, windows)
+    for token in tokens[1:33]:
+        if token.startswith("-"):
+            if "=" not in token:
+                continue
+            token = token.split("=", 1)[1]
+        if not token or "$" in token or (windows and token.startswith("/")):
+            continue
+        path = _resolve(token, cwd)
+        if os.path.lexists(path):
+            paths.add(path)
+
+    program = os.path.basename(tokens[0]).lower() if tokens else ""
+    args = tokens[1:]
+    if program.startswith("python") and args[:2] == ["-m", "pip"]:
+        program, args = "pip", args[2:]
+    if program in INSTALL_COMMANDS:
+        #a bare yarn installs
+        subcommand = next((arg for arg in args if not arg.startswith("-")), "install" if program == "yarn" else "")
+        if subcommand not in INSTALL_SUBCOMMANDS:
+            return None
+        paths.update(os.path.join(cwd, name) for name in MANIFEST_FILES)
+
+    return sorted(paths)
+
+def _env_digest(command):
+    names = set(JOURNAL_ENV_VARS)
+    for part in command.split("$")[1:]:
+        name = part.lstrip("{").split("}", 1)[0]
+        name = "".join(char for char in name if char.isalnum() or char == "_")
+        if name:
+            names.add(name)
+    return "\0".join(f"{name}={os.environ.get(name, '')}" for name in sorted(names))
+
+def step_cwds(commands, cwd, windows=False):
+    #working directory each step runs in, following cd steps the way the executor does
+    cwds = []
+    for command in commands:
+        cwds.append(cwd)
+        effects = analyze_step(command, cwd, windows)
+        #followed even if the directory does not exist yet, a cd into it fails the run anyway
+        if effects.cwd_change:
+            cwd = effects.cwd_change
+    return cwds
+
+def step_keys(commands, cwds):
+    keys, previous = [], ""
+    for command, cwd in zip(commands, cwds):
+        previous = hashlib.sha256("\0".join((previous, command, cwd, _env_digest(command))).encode("utf-8")).hexdigest()
+        keys.append(previous)
+    return keys
+
+class StepJournal:
+    # the journal of one working directory, stored as a small JSON file
+    # entries older than EXECUTOR_JOURNAL_TTL seconds are ignored. a journal always resumes from runs it
+    # recorded itself (retries within one invocation); resume=True also resumes from what an earlier
+    # process left in the file
+
+    def __init__(self, cwd: str, path: Optional[str] = None, ttl: Optional[float] = None, resume: bool = False):
+        if ttl is None:
+            ttl = float(os.getenv("EXECUTOR_JOURNAL_TTL", "3600"))
+        self.cwd = os.path.abspath(cwd)
+        self.ttl = ttl
+        self.resume = resume
+        self.recorded = False
+        digest = hashlib.sha256(self.cwd.encode("utf-8")).hexdigest()[:16]
+        self.path = path or os.path.join(get_journal_dir(), f"{digest}.json")
+
+    def _load(self) -> List[Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if data.get("cwd") != self.cwd or (self.ttl and time.time() - data.get("updated", 0) > self.ttl):
+            return []
+        return data.get("steps", [])
+
+    def clear(self):
+        with _lock:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def plan_resume(self, commands: List[str], kinds: List[str], windows=False):
+
+        # returns (keys, cwds, skipped) for a plan about to run from self.cwd
+        # skipped maps the index of every step that can be skipped to its journaled entry;
+        # cd and background steps always run (they leave no state on disk) but do not end the prefix
+
+        cwds = step_cwds(commands, self.cwd, windows)
+        keys = step_keys(commands, cwds)
+        entries = self._load() if self.resume or self.recorded else []
+
+        skipped = {}
+        for index, (key, kind) in enumerate(zip(keys, kinds)):
+            entry = entries[index] if index < len(entries) else None
+            if entry is None or entry.get("key") != key or not entry.get("success"):
+                break
+            if kind in ("cd", "background"):
+                continue
+            if not entry.get("paths") or any(_path_state(path) != state for path, state in entry["paths"].items()):
+                break
+            skipped[index] = entry
+        return keys, cwds, skipped
+
+    def record(self, keys: List[str], commands: List[str], cwds: List[str], results, windows=False):
+
+        # stores the outcome of a run together with the current state of each step's paths
+        # a step without paths, or with one that cannot be fingerprinted, is stored without any so it
+        # is never skipped
+
+        steps = []
+        for key, command, cwd, result in zip(keys, commands, cwds, results):
+            paths = {path: _path_state(path) for path in step_paths(command, cwd, windows) or ()}
+            steps.append({
+                "key": key,
+                "command": command,
+                "success": result.success,
+                "paths": paths if None not in paths.values() else {},
+                "output": result.output[:OUTPUT_LIMIT],
+            })
+
+        data = {"cwd": self.cwd, "updated": time.time(), "steps": steps}
+        with _lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.path)
+                self.recorded = True
+            except OSError as e:
+                logger.warning(f"Could not write execution journal {self.path}: {e}")
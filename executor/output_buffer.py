@@ -0,0 +1,114 @@
+#bounded capture of command output
+#keeps the first and last N characters of a stream so memory stays flat however much a command prints
+
+import os
+import codecs
+import locale
+import threading
+from collections import deque
+
+#a "line" without a newline is flushed once it grows past this (progress bars, minified output)
+MAX_LINE_LENGTH = 4096
+
+READ_CHUNK_SIZE = 65536
+
+class HeadTailBuffer:
+    # retains a head window and a tail window of appended text, counting what was dropped in between
+    # thread-safe: a background step pumps stdout and stderr into one buffer while it is being read
+
+    def __init__(self, head_limit=None, tail_limit=None):
+        if head_limit is None:
+            head_limit = int(os.getenv("EXECUTOR_OUTPUT_HEAD_CHARS", "8192"))
+        if tail_limit is None:
+            tail_limit = int(os.getenv("EXECUTOR_OUTPUT_TAIL_CHARS", "8192"))
+
+        self.head_limit = head_limit
+        self.tail_limit = tail_limit
+        self.total = 0
+        self.bytes_read = 0  #raw bytes read from the stream, before decoding
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._lock = threading.Lock()
+
+    def count_bytes(self, size):
+        with self._lock:
+            self.bytes_read += size
+
+    def append(self, text):
+        with self._lock:
+            self._append(text)
+
+    def _append(self, text):
+        self.total += len(text)
+
+        room = self.head_limit - self._head_size
+        if room > 0:
+            self._head.append(text[:room])
+            self._head_size += min(room, len(text))
+            text = text[room:]
+
+        if not text or self.tail_limit <= 0:
+            return
+
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > self.tail_limit:
+            excess = self._tail_size - self.tail_limit
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+            else:
+                self._tail[0] = first[excess:]
+                self._tail_size -= excess
+
+    @property
+    def omitted(self):
+        return self.total - self._head_size - self._tail_size
+
+    def getvalue(self):
+        with self._lock:
+            head = "".join(self._head)
+            tail = "".join(self._tail)
+            omitted = self.omitted
+        if omitted:
+            return f"{head}\n... [{omitted} characters omitted] ...\n{tail}"
+        return head + tail
+
+def pump_stream(pipe, buffer, stream_name, on_output=None):
+
+    #reads a binary pipe until EOF, splitting it into lines
+    # every line goes into the bounded buffer and, if given, to on_output(stream_name, line)
+
+    #same encoding subprocess text mode would use, but tolerant of undecodable bytes
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    read = getattr(pipe, "read1", pipe.read)
+    partial = ""
+
+    def emit(line):
+        buffer.append(line + "\n")
+        if on_output:
+            on_output(stream_name, line)
+
+    while True:
+        chunk = read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.count_bytes(len(chunk))
+
+        partial += decoder.decode(chunk)
+        *lines, partial = partial.split("\n")
+        for line in lines:
+            emit(line.rstrip("\r"))
+
+        if len(partial) > MAX_LINE_LENGTH:
+            emit(partial)
+            partial = ""
+
+    partial += decoder.decode(b"", final=True)
+    if partial:
+        emit(partial.rstrip("\r"))
+
+    pipe.close()
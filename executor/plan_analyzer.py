@@ -0,0 +1,335 @@
+#static analysis of a plan before it runs
+#walks the plan the way run_plan will execute it (file operations written first, then the commands in order
+#with cd steps moving the working directory) while simulating which paths exist, and reports steps that
+#are bound to fail: programs that are not on PATH, Windows commands on other systems (and the reverse),
+#cd into directories nothing creates, and files read before anything creates them. no command is run.
+#
+#commands whose effects are unknown (installers, generators, scripts) may create anything, so problems
+#after one of them are reported as warnings instead of errors
+
+import os
+import re
+import time
+import shlex
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ai_integration.plan_parser import validate_command
+from ai_integration.plan_model import Step, BACKGROUND, CD
+from ai_integration.response_parser import parse_steps
+from executor.async_executor import CREATE_COMMANDS, _resolve
+
+POSIX_BUILTINS = {
+    "cd", "echo", "export", "set", "unset", "source", ".", "exit", "true", "false", "test", "[", "[[", "alias",
+    "type", "read", "eval", "exec", "printf", "pwd", "pushd", "popd", "shift", "trap", "wait", "umask", "ulimit",
+    "command", "builtin", "let", "local", "declare", "hash", "kill", "jobs", "fg", "bg", "return", "break",
+    "continue", "getopts", "if", "then", "else", "elif", "fi", "for", "do", "done", "while", "until", "case",
+    "esac", "function", "{", "}", "!", "time", ":",
+}
+
+WINDOWS_BUILTINS = {
+    "cd", "chdir", "dir", "echo", "set", "type", "copy", "del", "erase", "md", "mkdir", "rd", "rmdir", "ren",
+    "rename", "move", "cls", "exit", "call", "start", "if", "for", "pushd", "popd", "title", "ver", "vol", "path",
+    "prompt", "mklink", "assoc", "ftype", "goto", "pause", "rem", "setlocal", "endlocal", "shift", "break",
+    "color", "date", "time", "verify", "@echo",
+}
+
+#commands of the other platform, with what to use instead
+WINDOWS_ONLY = {
+    "cls": "clear", "copy": "cp", "del": "rm", "erase": "rm", "move": "mv", "ren": "mv", "rename": "mv",
+    "md": "mkdir -p", "rd": "rm -r", "type": "cat", "findstr": "grep", "ipconfig": "ip addr",
+    "tasklist": "ps", "taskkill": "kill", "where": "which", "xcopy": "cp -r", "robocopy": "rsync",
+}
+POSIX_ONLY = {
+    "ls": "dir", "cat": "type", "rm": "del", "cp": "copy", "mv": "move", "grep": "findstr", "touch": "type nul >",
+    "which": "where", "clear": "cls", "chmod": "icacls", "ps": "tasklist", "pwd": "cd",
+}
+
+#reserved device names on Windows, they exist in every directory
+WINDOWS_DEVICES = {"nul", "con", "prn", "aux"}
+
+#commands whose path arguments must exist
+READ_COMMANDS = {"cat", "type", "head", "tail", "wc", "more", "less", "stat", "source", "."}
+
+#interpreters whose first argument is a script that must exist
+INTERPRETERS = {"python", "python3", "py", "node", "bash", "sh", "zsh", "ruby", "php", "perl", "deno", "bun"}
+
+#commands we know the effects of; anything else may create files and directories we cannot see
+KNOWN_EFFECTS = (READ_COMMANDS | set(CREATE_COMMANDS) | {"ls", "dir", "echo", "pwd", "find", "grep", "which",
+                 "where", "tree", "cd", "cp", "copy", "mv", "move", "rm", "del", "chmod", "clear", "cls"})
+
+_OPERATORS = {"&&", "||", ";", "|", "&", ";;", "(", ")"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+@dataclass
+class Finding:
+    # one predicted problem; index is the position of the command among the plan's commands
+
+    index: int
+    command: str
+    kind: str
+    message: str
+    severity: str = "error"
+
+@dataclass
+class PlanAnalysis:
+    findings: List[Finding] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def errors(self) -> List[Finding]:
+        return [finding for finding in self.findings if finding.severity == "error"]
+
+    @property
+    def warnings(self) -> List[Finding]:
+        return [finding for finding in self.findings if finding.severity == "warning"]
+
+    def report(self) -> str:
+        #one line per finding, usable as refinement feedback
+        return "\n".join(f"Step {finding.index + 1} ({finding.command}): {finding.message}"
+                         for finding in self.findings)
+
+def _directory_mtimes(directories: List[str]) -> tuple:
+    #modification time of each PATH directory (None when missing); installing or removing a program changes it
+    mtimes = []
+    for directory in directories:
+        try:
+            mtimes.append(os.stat(directory or ".").st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+class ProgramIndex:
+    # the executables on a PATH, listed once, so resolving a program is a set lookup instead of the
+    # several stat calls of shutil.which
+    # mtimes records the PATH directories as they were listed, so an install made since (by a plan,
+    # or anything else) is noticed with one stat per directory instead of a rescan
+
+    def __init__(self, path_value: str, windows: bool = False):
+        self.windows = windows
+        extensions = [ext.lower() for ext in os.getenv("PATHEXT", ".COM;.EXE;.BAT;.CMD").split(";") if ext]
+        self.names = set()
+        self.directories = path_value.split(os.pathsep)
+        self.mtimes = _directory_mtimes(self.directories)
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory or "."))
+            except OSError:
+                continue
+            for entry in entries:
+                name = entry.name
+                if windows:
+                    name = name.lower()
+                    root, ext = os.path.splitext(name)
+                    if ext in extensions:
+                        self.names.add(root)
+                self.names.add(name)
+
+    def __contains__(self, program: str) -> bool:
+        return (program.lower() if self.windows else program) in self.names
+
+    def is_current(self) -> bool:
+        return _directory_mtimes(self.directories) == self.mtimes
+
+_program_indexes: Dict[tuple, ProgramIndex] = {}
+_program_lock = threading.Lock()
+
+def get_program_index(windows: bool = False) -> ProgramIndex:
+    #one index per PATH value, built on first use and again once a PATH directory has changed
+    key = (os.environ.get("PATH", ""), windows)
+    with _program_lock:
+        index = _program_indexes.get(key)
+        if index is None or not index.is_current():
+            _program_indexes[key] = ProgramIndex(key[0], windows)
+        return _program_indexes[key]
+
+class _Simulation:
+    # the working directory and the paths the plan has created so far
+
+    def __init__(self, cwd: str, windows: bool = False):
+        self.cwd = cwd
+        self.windows = windows
+        self.created = set()
+        self.opaque = set()   #directories created with contents we cannot predict (virtualenvs)
+        self.uncertain_after: Optional[int] = None   #index of the first command with unknown effects
+
+    def create(self, path):
+        while path and path not in self.created:
+            self.created.add(path)
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+    def exists(self, path):
+        if self.windows and os.path.basename(path).lower() in WINDOWS_DEVICES:
+            return True
+        if path in self.created or any(path.startswith(directory + os.sep) for directory in self.opaque):
+            return True
+        return os.path.lexists(path)
+
+def _segments(command: str, windows: bool):
+
+    #the simple commands of a command line, as token lists (split at &&, ||, ;, | and &)
+
+    try:
+        lexer = shlex.shlex(command, posix=not windows, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return []
+
+    segments, current = [], []
+    for token in tokens:
+        if token in _OPERATORS:
+            if current:
+                segments.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current:
+        segments.append(current)
+    return segments
+
+def _redirections(tokens: List[str]):
+
+    # (arguments, files read, files written) of a simple command's tokens
+    # shlex splits "2>" into "2" and ">", and ">&" targets are file descriptors, not files
+
+    args, reads, writes = [], [], []
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        target = tokens[position + 1] if position + 1 < len(tokens) else None
+        if token in (">", ">>", "&>", "&>>", "<"):
+            if args and args[-1].isdigit() and token != "<":
+                args.pop()
+            if target is not None:
+                (reads if token == "<" else writes).append(target)
+            position += 2
+            continue
+        if token in (">&", "<&"):
+            if args and args[-1].isdigit():
+                args.pop()
+            position += 2
+            continue
+        args.append(token)
+        position += 1
+    return args, reads, writes
+
+def _program_name(token: str, windows: bool) -> str:
+    name = os.path.basename(token) if not os.path.dirname(token) else token
+    name = name.lower() if windows else name
+    return name[:-4] if windows and name.endswith(".exe") else name
+
+def analyze_plan(plan: List[str], cwd: Optional[str] = None, windows: Optional[bool] = None) -> PlanAnalysis:
+
+    # predicted failures of a plan run from cwd (default: the current directory)
+
+    started = time.perf_counter()
+    if windows is None:
+        from executor.command_executor import is_windows
+        windows = is_windows()
+
+    analysis = PlanAnalysis()
+    parsed = parse_steps(plan)
+    simulation = _Simulation(os.path.abspath(cwd or os.getcwd()), windows)
+    programs = get_program_index(windows)
+    builtins = WINDOWS_BUILTINS if windows else POSIX_BUILTINS
+    other_platform = POSIX_ONLY if windows else WINDOWS_ONLY
+
+    #run_plan writes every file before running any command
+    for filename in parsed.file_operations:
+        simulation.create(_resolve(filename, simulation.cwd))
+
+    def report(index, command, kind, message):
+        uncertain = simulation.uncertain_after is not None and simulation.uncertain_after < index
+        if uncertain:
+            message += f" (unless step {simulation.uncertain_after + 1} provides it)"
+        analysis.findings.append(Finding(index, command, kind, message, "warning" if uncertain else "error"))
+
+    for index, command in enumerate(parsed.commands):
+        if not validate_command(command):
+            analysis.findings.append(Finding(index, command, "unsafe", "blocked by the safety rules"))
+            continue
+
+        step = Step.from_command(command)
+        if step.kind == CD:
+            if any(operator in (step.path or "") for operator in ("&&", "||", ";", "|")):
+                #cd steps are handled by the executor itself, the rest would be taken as part of the path
+                analysis.findings.append(Finding(index, command, "chained-cd", "a cd step cannot be chained with "
+                                                 "other commands; put the cd in its own step"))
+                continue
+            target = _resolve(step.path or "~", simulation.cwd)
+            if not simulation.exists(target):
+                report(index, command, "missing-directory", f"directory {target} does not exist and no earlier "
+                                                            f"step creates it")
+            simulation.cwd = target
+            continue
+
+        text = step.command if step.kind == BACKGROUND else command
+        segment_cwd = simulation.cwd
+        for tokens in _segments(text, windows):
+            while tokens and _ASSIGNMENT.match(tokens[0]):
+                tokens = tokens[1:]
+            if not tokens or "$" in tokens[0] or "`" in tokens[0]:
+                continue
+            program = _program_name(tokens[0], windows)
+            args, reads, writes = _redirections(tokens[1:])
+            paths = [_resolve(arg, segment_cwd) for arg in args
+                     if not arg.startswith("-") and not (windows and arg.startswith("/")) and "$" not in arg]
+
+            #the program itself
+            if os.path.dirname(tokens[0]):
+                path = _resolve(tokens[0], segment_cwd)
+                if not simulation.exists(path):
+                    report(index, command, "missing-program", f"{tokens[0]} does not exist")
+            elif program not in builtins and program not in programs:
+                if program in other_platform:
+                    report(index, command, "wrong-platform",
+                           f"'{program}' is not available on {'Windows' if windows else 'this system'}; "
+                           f"use '{other_platform[program]}' instead")
+                else:
+                    report(index, command, "missing-program", f"'{program}' is not installed (not on PATH)")
+
+            #the paths it reads
+            if program == "cd" and paths:
+                if not simulation.exists(paths[0]):
+                    report(index, command, "missing-directory", f"directory {paths[0]} does not exist")
+                segment_cwd = paths[0]
+            elif program in READ_COMMANDS:
+                for path in paths:
+                    if not simulation.exists(path):
+                        report(index, command, "missing-file", f"{path} does not exist and no earlier step "
+                                                               f"creates it")
+            elif (program in INTERPRETERS or program.startswith("python")) and args:
+                script = args[0]
+                if not script.startswith("-") and os.path.splitext(script)[1] and \
+                        not simulation.exists(_resolve(script, segment_cwd)):
+                    report(index, command, "missing-file", f"script {_resolve(script, segment_cwd)} does not "
+                                                           f"exist and no earlier step creates it")
+
+            for source in reads:
+                path = _resolve(source, segment_cwd)
+                if not simulation.exists(path):
+                    report(index, command, "missing-file", f"{path} does not exist and no earlier step creates it")
+
+            #what it creates
+            for target in writes:
+                simulation.create(_resolve(target, segment_cwd))
+            if program in CREATE_COMMANDS:
+                for path in paths:
+                    simulation.create(path)
+            elif program in ("cp", "copy", "mv", "move") and len(paths) >= 2:
+                simulation.create(paths[-1])
+            elif program.startswith("python") and args[:2] == ["-m", "venv"] and len(paths) >= 2:
+                simulation.create(paths[-1])
+                simulation.opaque.add(paths[-1])
+
+            if program not in KNOWN_EFFECTS and program not in builtins and simulation.uncertain_after is None:
+                #installers, generators and scripts can create anything
+                simulation.uncertain_after = index
+
+    analysis.seconds = time.perf_counter() - started
+    return analysis
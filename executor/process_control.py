@@ -0,0 +1,210 @@
+#process-group management for plan steps
+#every step runs in its own process group so a timeout or Ctrl-C can take down the whole tree
+
+import os
+import time
+import signal
+import socket
+import atexit
+import platform
+import threading
+import subprocess
+
+from executor.output_buffer import HeadTailBuffer, pump_stream
+
+_active_processes = set()
+_background_processes = []
+_registry_lock = threading.Lock()
+
+def is_windows():
+    return platform.system().lower() == "windows"
+
+def kill_grace_period():
+    #seconds between SIGTERM and SIGKILL
+    return float(os.getenv("EXECUTOR_KILL_GRACE", "5.0"))
+
+def spawn(command, cwd=None):
+
+    #starts a shell command in a new process group with binary stdout/stderr pipes
+    # stdin is /dev/null (NUL): a step that prompts for input reads EOF instead of waiting for a keypress
+    # that the live output display never asks for
+
+    kwargs = {}
+    if is_windows():
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        **kwargs
+    )
+
+    with _registry_lock:
+        _active_processes.add(process)
+    return process
+
+def release(process):
+    with _registry_lock:
+        _active_processes.discard(process)
+
+def terminate_process_group(process, grace=None):
+
+    #graceful SIGTERM (CTRL_BREAK on Windows) to the whole group, SIGKILL once the grace period is over
+
+    if process.poll() is not None:
+        return
+
+    if grace is None:
+        grace = kill_grace_period()
+
+    try:
+        if is_windows():
+            process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+    try:
+        process.wait(timeout=grace)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+
+    try:
+        if is_windows():
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+    process.wait()
+
+def terminate_active_processes():
+
+    #used on Ctrl-C: stops every foreground step that is still running
+
+    with _registry_lock:
+        processes = list(_active_processes)
+    for process in processes:
+        terminate_process_group(process)
+
+def run_process(command, cwd=None, on_output=None, timeout=None, stats=None):
+
+    #runs a shell command, streaming its output line by line
+    # stdout/stderr are read on their own threads into bounded head+tail buffers
+    # so memory stays flat no matter how much the command prints
+    # on timeout or Ctrl-C the whole process group is terminated
+    # returns (returncode, stdout, stderr, timed_out)
+    # a stats dict, if given, receives stdout_bytes, stderr_bytes and omitted_chars
+
+    process = spawn(command, cwd=cwd)
+
+    stdout_buffer = HeadTailBuffer()
+    stderr_buffer = HeadTailBuffer()
+    pumps = [
+        threading.Thread(target=pump_stream, args=(process.stdout, stdout_buffer, "stdout", on_output), daemon=True),
+        threading.Thread(target=pump_stream, args=(process.stderr, stderr_buffer, "stderr", on_output), daemon=True),
+    ]
+    for pump in pumps:
+        pump.start()
+
+    timed_out = False
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        terminate_process_group(process)
+    except KeyboardInterrupt:
+        terminate_process_group(process)
+        raise
+    finally:
+        release(process)
+
+    #a backgrounded grandchild may still hold the pipes open, don't wait on it forever
+    for pump in pumps:
+        pump.join(timeout=kill_grace_period())
+
+    if stats is not None:
+        stats["stdout_bytes"] = stdout_buffer.bytes_read
+        stats["stderr_bytes"] = stderr_buffer.bytes_read
+        stats["omitted_chars"] = stdout_buffer.omitted + stderr_buffer.omitted
+
+    return process.returncode, stdout_buffer.getvalue(), stderr_buffer.getvalue(), timed_out
+
+def _port_open(port):
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+def start_background(command, readiness, cwd=None, on_output=None, timeout=None):
+
+    #starts a long-running step (e.g. a web server) and waits until it is ready
+    # ready means: the port accepts connections, the pattern shows up in its output,
+    # or (with no readiness spec) the process is still alive after EXECUTOR_BACKGROUND_SETTLE seconds
+    # returns (success, message, process)
+
+    if timeout is None:
+        timeout = float(os.getenv("EXECUTOR_BACKGROUND_READY_TIMEOUT", "30"))
+
+    ready = threading.Event()
+    pattern = readiness.get("pattern")
+
+    def watch_output(stream_name, line):
+        if pattern and pattern in line:
+            ready.set()
+        if on_output:
+            on_output(stream_name, line)
+
+    process = spawn(command, cwd=cwd)
+    release(process)
+
+    output = HeadTailBuffer()
+    for pipe, stream_name in ((process.stdout, "stdout"), (process.stderr, "stderr")):
+        threading.Thread(target=pump_stream, args=(pipe, output, stream_name, watch_output), daemon=True).start()
+
+    with _registry_lock:
+        _background_processes.append(process)
+
+    port = readiness.get("port")
+    settle = float(os.getenv("EXECUTOR_BACKGROUND_SETTLE", "2.0"))
+    deadline = time.monotonic() + (timeout if (port or pattern) else settle)
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False, f"Background process exited with code {process.returncode}:\n{output.getvalue()}", process
+        if (port and _port_open(port)) or ready.is_set():
+            break
+        time.sleep(0.1)
+    else:
+        if port or pattern:
+            terminate_process_group(process)
+            return False, f"Background process was not ready after {timeout}s:\n{output.getvalue()}", process
+
+    if process.poll() is not None:
+        return False, f"Background process exited with code {process.returncode}:\n{output.getvalue()}", process
+
+    condition = f"port {port} open" if port else (f"saw '{pattern}'" if pattern else "still running")
+    return True, f"Started in background (pid {process.pid}, {condition})\n{output.getvalue()}", process
+
+def stop_background_processes(processes=None):
+
+    #terminates the given background steps (a plan's), or every one started by this process
+
+    with _registry_lock:
+        if processes is None:
+            processes = list(_background_processes)
+        _background_processes[:] = [process for process in _background_processes if process not in processes]
+    for process in processes:
+        terminate_process_group(process)
+
+atexit.register(stop_background_processes)
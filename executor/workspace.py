@@ -0,0 +1,330 @@
+#isolated working directories with cheap snapshots for plan retries
+#a plan runs in a private copy of the user's directory; the copy is snapshotted before the first attempt
+#and restored from that snapshot before every retry, so each attempt starts from the same clean state.
+#once the task succeeds, what the plan changed relative to that snapshot is copied back to the user's directory
+#
+#files are copied as reflinks (copy-on-write clones) where the filesystem supports them. elsewhere,
+#snapshots hard-link large files and copy small ones; a large file edited in place (rather than rewritten)
+#would change its snapshot too, which restore() detects and reports as "tainted"
+
+import os
+import stat
+import time
+import uuid
+import errno
+import shutil
+import logging
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+#linux ioctl that clones a file's extents (btrfs, xfs, bcachefs, ...)
+FICLONE = 0x40049409
+
+#errors meaning "this filesystem cannot clone/link", after which the next strategy is used
+UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM, errno.ENOSYS}
+
+def get_workspace_root():
+    return os.path.expanduser(os.getenv("EXECUTOR_SANDBOX_ROOT", "~/.cache/ai-task-agent/workspaces"))
+
+def _scan(root):
+
+    #{relative path: lstat result} for everything under root (symlinks are not followed)
+
+    entries = {}
+    for directory, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(directory, name)
+            entries[os.path.relpath(path, root)] = os.lstat(path)
+    return entries
+
+def _kind(st):
+    if stat.S_ISLNK(st.st_mode):
+        return "link"
+    if stat.S_ISDIR(st.st_mode):
+        return "dir"
+    return "file"
+
+def _signature(root, rel, st):
+    #what identifies an entry's content for promote(): files by size and mtime, links by target
+    kind = _kind(st)
+    if kind == "file":
+        return (kind, st.st_size, st.st_mtime_ns)
+    if kind == "link":
+        return (kind, os.readlink(os.path.join(root, rel)))
+    return (kind,)
+
+class Workspace:
+    # a private copy of source for executing plans
+    # create() makes the copy, snapshot()/restore() save and reset it, promote() copies the result back,
+    # cleanup() removes the copy and its snapshots
+
+    def __init__(self, source: str, root: Optional[str] = None, max_files: Optional[int] = None,
+                 link_min_bytes: Optional[int] = None):
+        if max_files is None:
+            max_files = int(os.getenv("EXECUTOR_SANDBOX_MAX_FILES", "20000"))
+        if link_min_bytes is None:
+            link_min_bytes = int(os.getenv("EXECUTOR_SANDBOX_LINK_MIN_BYTES", str(1 << 20)))
+
+        self.source = os.path.abspath(source)
+        self.max_files = max_files
+        self.link_min_bytes = link_min_bytes
+        self.base = os.path.join(root or get_workspace_root(), uuid.uuid4().hex[:12])
+        self.path = os.path.join(self.base, "work")
+        self._snapshots: Dict[str, Dict[str, tuple]] = {}   #name -> {hard-linked file: (size, mtime_ns)}
+        #(source device, target device) pairs found unable to clone / hard-link, so later files skip the attempt
+        self._no_clone = set()
+        self._no_link = set()
+
+    def create(self):
+
+        # copies the source directory into the workspace
+        # raises ValueError when the source is too large to sandbox (see EXECUTOR_SANDBOX_MAX_FILES)
+
+        count = 0
+        for _, dirnames, filenames in os.walk(self.source):
+            count += len(dirnames) + len(filenames)
+            if count > self.max_files:
+                raise ValueError(f"{self.source} has more than {self.max_files} entries to copy into a sandbox")
+
+        if os.path.commonpath([self.source, self.base]) == self.source:
+            raise ValueError(f"Sandbox root {self.base} is inside the directory being sandboxed")
+
+        os.makedirs(self.path)
+        stats = self._sync(self.source, self.path, allow_links=False)
+        logger.info(f"Workspace {self.path} created from {self.source}: {stats}")
+        return stats
+
+    def snapshot(self, name="initial"):
+
+        #records the current workspace state under name, replacing an older snapshot of that name
+
+        target = self._snapshot_path(name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(target)
+
+        started = time.monotonic()
+        linked = {}
+        stats = self._sync(self.path, target, allow_links=True, linked=linked)
+        self._snapshots[name] = linked
+        stats["seconds"] = time.monotonic() - started
+        return stats
+
+    def restore(self, name="initial"):
+
+        # resets the workspace to the snapshot; only entries that differ are touched
+        # returns counts of what was done plus the hard-linked files whose snapshot changed since it was taken
+
+        if name not in self._snapshots:
+            raise ValueError(f"No workspace snapshot named {name!r}")
+        source = self._snapshot_path(name)
+
+        tainted = []
+        for rel, (size, mtime_ns) in self._snapshots[name].items():
+            try:
+                st = os.lstat(os.path.join(source, rel))
+            except OSError:
+                tainted.append(rel)
+                continue
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                tainted.append(rel)
+        if tainted:
+            logger.warning(f"Snapshot {name!r} files were modified in place and cannot be fully restored: {tainted}")
+
+        started = time.monotonic()
+        stats = self._sync(source, self.path, allow_links=True)
+        stats["seconds"] = time.monotonic() - started
+        stats["tainted"] = tainted
+        return stats
+
+    def promote(self, name="initial"):
+
+        # copies what changed in the workspace since the snapshot back to the source directory (never as hard
+        # links), and removes there what the workspace removed; everything else in the source directory is left
+        # alone, so files created or edited there during the run survive. an entry changed in both places keeps
+        # the source version and is listed under "conflicts"
+
+        if name not in self._snapshots:
+            raise ValueError(f"No workspace snapshot named {name!r}")
+        snapshot_path = self._snapshot_path(name)
+        linked = self._snapshots[name]
+        baseline = _scan(snapshot_path)
+        current = _scan(self.path)
+        devices = (os.stat(self.path).st_dev, os.stat(self.source).st_dev)
+        stats = {"cloned": 0, "linked": 0, "copied": 0, "removed": 0, "unchanged": 0, "conflicts": []}
+
+        def original(rel):
+            #the entry as the snapshot saw it; a hard-linked snapshot file may have been edited in place since,
+            # so its recorded size and mtime are used (copies keep the source's mtime, so this is also how the
+            # source directory looked)
+            if rel in linked:
+                return ("file",) + linked[rel]
+            return _signature(snapshot_path, rel, baseline[rel]) if rel in baseline else None
+
+        def in_source(rel):
+            try:
+                return _signature(self.source, rel, os.lstat(os.path.join(self.source, rel)))
+            except FileNotFoundError:
+                return None
+
+        #removals, deepest first; directories only go once they are empty
+        for rel in sorted(baseline, reverse=True):
+            before = original(rel)
+            if rel in current and _kind(current[rel]) == before[0]:
+                continue
+            found = in_source(rel)
+            if found is None:
+                continue
+            path = os.path.join(self.source, rel)
+            if before[0] == "dir" and found[0] == "dir":
+                try:
+                    os.rmdir(path)
+                    stats["removed"] += 1
+                except OSError:
+                    pass
+            elif found == before:
+                os.remove(path)
+                stats["removed"] += 1
+            else:
+                stats["conflicts"].append(rel)
+
+        #additions and changes; sorted order creates every directory before its contents
+        for rel in sorted(current):
+            st = current[rel]
+            now = _signature(self.path, rel, st)
+            before = original(rel)
+            if now == before:
+                stats["unchanged"] += 1
+                continue
+
+            found = in_source(rel)
+            src, dst = os.path.join(self.path, rel), os.path.join(self.source, rel)
+            if now[0] == "dir":
+                if found is None:
+                    os.mkdir(dst)
+                    shutil.copymode(src, dst)
+                elif found[0] != "dir":
+                    stats["conflicts"].append(rel)
+                continue
+            if found == now:
+                stats["unchanged"] += 1
+                continue
+            if found is not None and (found != before or found[0] == "dir"):
+                stats["conflicts"].append(rel)
+                continue
+
+            if found is not None:
+                os.remove(dst)
+            if now[0] == "link":
+                os.symlink(now[1], dst)
+                stats["copied"] += 1
+            else:
+                stats[self._place_file(src, dst, st, False, devices)] += 1
+
+        if stats["conflicts"]:
+            logger.warning(f"Changed in both the workspace and {self.source}, kept the latter: {stats['conflicts']}")
+        return stats
+
+    def cleanup(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def _snapshot_path(self, name):
+        return os.path.join(self.base, "snapshots", name)
+
+    def _sync(self, source, target, allow_links, linked=None):
+
+        # makes target mirror source, touching only entries that differ
+        # a file counts as unchanged when it is the same inode or has the same size and mtime
+        # (every copy made here keeps the mtime)
+
+        stats = {"cloned": 0, "linked": 0, "copied": 0, "removed": 0, "unchanged": 0}
+        devices = (os.stat(source).st_dev, os.stat(target).st_dev)
+        source_entries = _scan(source)
+        target_entries = _scan(target)
+
+        #deepest first, so a directory is removed after its contents
+        for rel in sorted(target_entries, reverse=True):
+            wanted = source_entries.get(rel)
+            if wanted is None or _kind(wanted) != _kind(target_entries[rel]):
+                path = os.path.join(target, rel)
+                if _kind(target_entries[rel]) == "dir":
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.lexists(path):
+                    os.remove(path)
+                del target_entries[rel]
+                stats["removed"] += 1
+
+        #sorted order creates every directory before its contents
+        for rel in sorted(source_entries):
+            st = source_entries[rel]
+            kind = _kind(st)
+            src, dst = os.path.join(source, rel), os.path.join(target, rel)
+            existing = target_entries.get(rel)
+
+            if kind == "dir":
+                if existing is None:
+                    os.mkdir(dst)
+                    shutil.copymode(src, dst)
+                continue
+
+            if kind == "link":
+                link_target = os.readlink(src)
+                if existing is not None:
+                    if os.readlink(dst) == link_target:
+                        stats["unchanged"] += 1
+                        continue
+                    os.remove(dst)
+                os.symlink(link_target, dst)
+                stats["copied"] += 1
+                continue
+
+            if existing is not None and (
+                    (existing.st_ino == st.st_ino and existing.st_dev == st.st_dev)
+                    or (existing.st_size == st.st_size and existing.st_mtime_ns == st.st_mtime_ns)):
+                stats["unchanged"] += 1
+                continue
+
+            if existing is not None:
+                os.remove(dst)
+            method = self._place_file(src, dst, st, allow_links, devices)
+            stats[method] += 1
+            if method == "linked" and linked is not None:
+                linked[rel] = (st.st_size, st.st_mtime_ns)
+
+        return stats
+
+    def _place_file(self, src, dst, st, allow_links, devices):
+
+        #reflink clone, else hard link (large files, when allowed), else a full copy
+
+        if fcntl is not None and devices not in self._no_clone and stat.S_ISREG(st.st_mode):
+            try:
+                with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                    fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                shutil.copystat(src, dst)
+                return "cloned"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._no_clone.add(devices)
+                if os.path.lexists(dst):
+                    os.remove(dst)
+
+        if (allow_links and hasattr(os, "link") and devices not in self._no_link
+                and stat.S_ISREG(st.st_mode) and st.st_size >= self.link_min_bytes):
+            try:
+                os.link(src, dst)
+                return "linked"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._no_link.add(devices)
+
+        shutil.copy2(src, dst, follow_symlinks=False)
+        return "copied"
@@ -3,8 +3,61 @@
 import click
 import re
 import os
+import hashlib
+import platform
 from datetime import datetime
 
+from ai_integration.text_classifier import TermClassifier
+
+#lines of a failed step's output passed on to the next plan
+ERROR_TAIL_LINES = 30
+
+#what each detected issue tells the model to do differently
+ISSUE_HINTS = {
+    "dependency": "A required package or command seems to be missing; install it (or use one that exists) before it is used.",
+    "permission": "The plan hit a permission problem; stay inside the working directory and do not rely on sudo/administrator rights.",
+    "syntax": "A command or generated file has invalid syntax or arguments; check them carefully.",
+    "implementation": "A file or directory the plan expected does not exist or the result is incomplete; create everything the later steps use.",
+    "environment": "The failure looks platform-specific; use commands that work on {os}.",
+}
+
+#terms that point at each kind of issue, matched as whole words (see text_classifier)
+# the labels say which term fired; exception names are matched as identifiers ending in Error/Exception
+FEEDBACK_TERMS = {
+    "dependency": [
+        ("missing", r"missing"), ("not-found", r"not found"), ("no-module", r"no module"),
+        ("import", r"import(?:error|s|ed|ing)?"), ("import", r"modulenotfounderror"),
+        ("install", r"install(?:s|ed|ing|ation)?"), ("dependency", r"dependenc(?:y|ies)"),
+        ("cannot-find-module", r"cannot find module"), ("not-recognized", r"is not recognized"),
+    ],
+    "permission": [
+        ("permission", r"permissions?"), ("permission", r"permissionerror"), ("access-denied", r"access (?:is )?denied"),
+        ("not-allowed", r"not allowed"), ("sudo", r"sudo"), ("administrator", r"administrator"),
+        ("eacces", r"eacces"), ("not-permitted", r"operation not permitted"),
+    ],
+    "syntax": [
+        ("syntax", r"syntax"), ("syntax", r"syntaxerror"), ("typo", r"typos?"), ("invalid", r"invalid"),
+        ("error", r"\w*errors?"), ("exception", r"\w*exceptions?"), ("unexpected-token", r"unexpected token"),
+        ("usage", r"usage:"),
+    ],
+    "implementation": [
+        ("incomplete", r"incomplete"), ("not-working", r"not working"), ("not-working", r"doesn't work"),
+        ("partial", r"partial(?:ly)?"), ("missing-feature", r"missing features?"), ("no-such-file", r"no such file"),
+    ],
+    "environment": [
+        ("windows", r"windows"), ("mac", r"mac(?:os)?"), ("linux", r"linux"), ("os", r"os"),
+        ("platform", r"platforms?"), ("version", r"versions?"),
+    ],
+}
+
+_feedback_classifier = TermClassifier(FEEDBACK_TERMS)
+
+_ERROR_MESSAGE = re.compile(r"error:?\s*(.+?)(?:$|\n|\.)", re.IGNORECASE)
+
+def classify_feedback(feedback):
+    #every issue term found in feedback, with positions and confidences
+    return _feedback_classifier.classify(feedback)
+
 def handle_feedback(task_description, plan, output, previous_feedback=None):
 
     # main fn. to get user feedback on a failed task execution
@@ -33,13 +86,22 @@ def handle_feedback(task_description, plan, output, previous_feedback=None):
 def log_feedback(task_description, plan, output, feedback):
 
     #Log feedback for future analysis
+    # always recorded in the run history (written in the background); debug mode also dumps a text file
+    # feedback means the plan did not do the job, so it is also dropped from the plan cache
+
+    from ai_integration.plan_cache import discard_plan
+    from feedback.history import record_feedback
+
+    record_feedback(task_description, plan, feedback, output)
+    discard_plan(plan)
 
     debug_mode = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
     
     if debug_mode:
         os.makedirs('logs', exist_ok=True)
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        #microseconds keep two events within the same second from overwriting each other
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         log_file = f"logs/feedback_{timestamp}.log"
         
         with open(log_file, 'w', encoding='utf-8') as f:
@@ -67,25 +129,110 @@ def analyze_feedback(feedback):
         "specific_error": None
     }
     
-    #Looking for common patterns in feedback
-    if re.search(r"(missing|not found|no module|import|install|dependency)", feedback, re.IGNORECASE):
-        issues["dependency"] = True
-    
-    if re.search(r"(permission|access denied|not allowed|sudo|administrator)", feedback, re.IGNORECASE):
-        issues["permission"] = True
-    
-    if re.search(r"(syntax|typo|invalid|error|exception)", feedback, re.IGNORECASE):
-        issues["syntax"] = True
-        
-    if re.search(r"(incomplete|not working|doesn't work|partial|missing feature)", feedback, re.IGNORECASE):
-        issues["implementation"] = True
-        
-    if re.search(r"(windows|mac|linux|os|platform|version)", feedback, re.IGNORECASE):
-        issues["environment"] = True
+    #Looking for common patterns in feedback (written by a person or printed by a failed command)
+    classification = _feedback_classifier.classify(feedback)
+    for issue in FEEDBACK_TERMS:
+        issues[issue] = classification.has(issue)
     
     #extract specific error messages
-    error_match = re.search(r"error:?\s*(.+?)(?:$|\n|\.)", feedback, re.IGNORECASE)
+    error_match = _ERROR_MESSAGE.search(feedback)
     if error_match:
         issues["specific_error"] = error_match.group(1).strip()
     
-    return issues
\ No newline at end of file
+    return issues
+
+def analyze_execution(plan_result):
+
+    # analyze_feedback for executor output: finds the first failed step of a PlanResult and classifies
+    # the tail of its output; adds failed_command, exit_code, timed_out, error_tail and a signature
+    # that stays the same when a refined plan fails the same way again
+
+    failed = [result for result in plan_result.results if not result.success]
+    if plan_result.error or not failed:
+        command, exit_code, timed_out = None, None, False
+        output = plan_result.error or plan_result.summary()
+    else:
+        command, exit_code, timed_out = failed[0].command, failed[0].exit_code, failed[0].timed_out
+        output = failed[0].output
+
+    tail_lines = [line for line in output.splitlines() if line.strip()][-ERROR_TAIL_LINES:]
+    error_tail = "\n".join(tail_lines)
+
+    issues = analyze_feedback(error_tail)
+    #in command output the last line is the actual error (after a traceback, a usage text ...)
+    if tail_lines:
+        issues["specific_error"] = tail_lines[-1].strip()
+
+    last_line = re.sub(r"\d+", "#", tail_lines[-1]) if tail_lines else ""
+    issues.update({
+        "failed_command": command,
+        "failed_steps": len(failed),
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "error_tail": error_tail,
+        "signature": hashlib.sha1(f"{command}\0{exit_code}\0{last_line}".encode("utf-8")).hexdigest(),
+    })
+    return issues
+
+def build_auto_feedback(analysis):
+
+    #turns analyze_execution() output into the feedback text for the next generate_plan call
+
+    if analysis["failed_command"]:
+        detail = f"exit code {analysis['exit_code']}" if analysis["exit_code"] is not None else "an error"
+        if analysis["timed_out"]:
+            detail = "a timeout"
+        lines = [f"The step `{analysis['failed_command']}` failed with {detail}."]
+    else:
+        lines = ["The plan could not be executed."]
+
+    for issue, hint in ISSUE_HINTS.items():
+        if analysis.get(issue):
+            lines.append(hint.format(os=platform.system()))
+    if analysis["error_tail"]:
+        lines.append(f"Error output:\n{analysis['error_tail']}")
+    return "\n".join(lines)
+
+def refine_until_done(task_description, plan, generate_plan, execute, max_rounds=None, is_safe=None):
+
+    # autonomous refinement: executes the plan, and while it fails, feeds the analyzed failure straight
+    # into generate_plan and executes the refined plan, without asking anyone
+    # execute(plan) must return a PlanResult; is_safe(plan) gates every plan before it runs
+    # stops on success, after max_rounds refinements, when a refined plan fails exactly like an earlier one,
+    # when the model returns no plan or the same plan, or when a plan is not safe to run unattended
+    # returns (success, plan, output, reason)
+
+    if max_rounds is None:
+        max_rounds = int(os.getenv('AUTO_MAX_ROUNDS', os.getenv('MAX_RETRIES', '3')))
+
+    signatures = set()
+    result = None
+    for round_number in range(max_rounds + 1):
+        if result is not None:
+            analysis = analyze_execution(result)
+            if analysis["signature"] in signatures:
+                return False, plan, result.summary(), "the refined plan failed the same way again"
+            signatures.add(analysis["signature"])
+
+            feedback = build_auto_feedback(analysis)
+            log_feedback(task_description, plan, result.summary(), feedback)
+            click.echo(f"\n🔄 Auto-refining (round {round_number}/{max_rounds}): {analysis['specific_error'] or 'step failed'}")
+
+            refined_plan = generate_plan(task_description, previous_attempt=plan, feedback=feedback)
+            if not refined_plan:
+                return False, plan, result.summary(), "no refined plan was generated"
+            if refined_plan == plan:
+                return False, plan, result.summary(), "the model returned the same plan"
+            plan = refined_plan
+
+        if is_safe is not None and not is_safe(plan):
+            return False, plan, result.summary() if result else "", "the plan contains unsafe commands"
+
+        result = execute(plan)
+        #stricter than PlanResult.success, which forgives failed commands once all files were written
+        succeeded = result.success and all(step.success for step in result.results)
+        click.echo(f"  round {round_number}: {'succeeded' if succeeded else 'failed'} in {result.duration:.1f}s")
+        if succeeded:
+            return True, plan, result.summary(), "the plan succeeded"
+
+    return False, plan, result.summary(), f"maximum rounds ({max_rounds}) reached"
@@ -0,0 +1,293 @@
+#structured, append-only history of runs, steps and feedback
+#records go into a queue and are written to SQLite (WAL mode) in batches by a background thread,
+#so recording never adds file I/O to a run; `ai-task history` queries the same database
+
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+#records waiting for the writer; beyond this new records are dropped rather than blocking a run
+QUEUE_SIZE = 10000
+
+#order in which failure classes are reported when analyze_execution flags several
+FAILURE_CLASSES = ("dependency", "permission", "syntax", "implementation", "environment")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS runs ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, mode TEXT NOT NULL, task TEXT, "
+    "plan TEXT NOT NULL, success INTEGER NOT NULL, duration REAL NOT NULL, round INTEGER NOT NULL, "
+    "failure_class TEXT, failed_command TEXT, error TEXT)",
+    "CREATE TABLE IF NOT EXISTS steps ("
+    "run_id INTEGER NOT NULL, idx INTEGER NOT NULL, kind TEXT NOT NULL, command TEXT NOT NULL, "
+    "success INTEGER NOT NULL, exit_code INTEGER, duration REAL NOT NULL, timed_out INTEGER NOT NULL, "
+    "skipped INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS feedback ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, task TEXT, plan TEXT NOT NULL, "
+    "feedback TEXT NOT NULL, output_tail TEXT)",
+    "CREATE INDEX IF NOT EXISTS runs_created_at ON runs(created_at)",
+    "CREATE INDEX IF NOT EXISTS steps_run_id ON steps(run_id)",
+    "CREATE INDEX IF NOT EXISTS runs_task ON runs(task)",
+)
+
+#runs whose plan worked: every step succeeded, and no feedback rejected the plan for that task afterwards
+SUCCESSFUL_RUN = (
+    "runs.success = 1 AND runs.task IS NOT NULL "
+    "AND NOT EXISTS (SELECT 1 FROM steps WHERE steps.run_id = runs.id AND steps.success = 0) "
+    "AND NOT EXISTS (SELECT 1 FROM feedback WHERE feedback.task = runs.task AND feedback.plan = runs.plan "
+    "AND feedback.created_at >= runs.created_at)"
+)
+
+def classify_failure(plan_result) -> Dict[str, Any]:
+
+    #failure class, failed command and last error line of a failed PlanResult, via analyze_execution
+
+    from feedback.feedback_loop import analyze_execution
+
+    analysis = analyze_execution(plan_result)
+    failure_class = next((name for name in FAILURE_CLASSES if analysis.get(name)), "other")
+    if analysis["timed_out"]:
+        failure_class = "timeout"
+    return {"failure_class": failure_class, "failed_command": analysis["failed_command"],
+            "error": analysis["specific_error"]}
+
+class HistoryStore:
+    # record_* calls only enqueue; a daemon thread writes whatever has queued up in one transaction
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            #WAL lets `ai-task history` read while a run is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connect(self):
+        #one transaction on a short-lived connection, closed afterwards (sqlite3's context manager only commits)
+        conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _enqueue(self, record):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_run(self, task: Optional[str], plan: List[str], plan_result, mode: str = "interactive",
+                   round_number: int = 0):
+        self._enqueue(("run", time.time(), task, list(plan), plan_result, mode, round_number))
+
+    def record_feedback(self, task: Optional[str], plan: List[str], feedback: str, output: Optional[str] = None):
+        tail = output[-2000:] if output else None
+        self._enqueue(("feedback", time.time(), task, list(plan), feedback, tail))
+
+    def flush(self, timeout: float = 5.0):
+        #waits (up to timeout seconds) until everything queued so far is written
+        if self._writer is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(("flush", done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _write_loop(self):
+        #the writer keeps one connection for the life of the process
+        conn = self._open()
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            flushes = [record[1] for record in batch if record[0] == "flush"]
+            try:
+                with conn:
+                    for record in batch:
+                        if record[0] == "run":
+                            self._write_run(conn, *record[1:])
+                        elif record[0] == "feedback":
+                            conn.execute("INSERT INTO feedback (created_at, task, plan, feedback, output_tail) "
+                                         "VALUES (?, ?, ?, ?, ?)",
+                                         (record[1], record[2], json.dumps(record[3], ensure_ascii=False),
+                                          record[4], record[5]))
+            except Exception as e:
+                logger.warning(f"Could not write run history to {self.path}: {str(e)}")
+            for done in flushes:
+                done.set()
+
+    @staticmethod
+    def _write_run(conn, created_at, task, plan, plan_result, mode, round_number):
+        #classified here, on the writer thread, to keep it off the run's path
+        failure = classify_failure(plan_result) if not plan_result.success else {}
+        cursor = conn.execute(
+            "INSERT INTO runs (created_at, mode, task, plan, success, duration, round, failure_class, "
+            "failed_command, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (created_at, mode, task, json.dumps(plan, ensure_ascii=False), int(plan_result.success),
+             plan_result.duration, round_number, failure.get("failure_class"), failure.get("failed_command"),
+             failure.get("error")))
+        conn.executemany(
+            "INSERT INTO steps (run_id, idx, kind, command, success, exit_code, duration, timed_out, skipped) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(cursor.lastrowid, step.index, step.kind, step.command, int(step.success), step.exit_code,
+              step.duration, int(step.timed_out), int(step.skipped)) for step in plan_result.results])
+
+    def summary(self, days: float = 30) -> Dict[str, Any]:
+
+        # success rates overall and per mode, plus feedback count, for runs of the last `days` days
+
+        since = time.time() - days * 86400
+        with self._connect() as conn:
+            total, succeeded, duration = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(success), 0), COALESCE(AVG(duration), 0) FROM runs "
+                "WHERE created_at >= ?", (since,)).fetchone()
+            modes = conn.execute(
+                "SELECT mode, COUNT(*), SUM(success) FROM runs WHERE created_at >= ? GROUP BY mode ORDER BY mode",
+                (since,)).fetchall()
+            feedback = conn.execute("SELECT COUNT(*) FROM feedback WHERE created_at >= ?", (since,)).fetchone()[0]
+        return {"runs": total, "succeeded": succeeded, "average_seconds": duration,
+                "modes": [{"mode": mode, "runs": runs, "succeeded": ok} for mode, runs, ok in modes],
+                "feedback": feedback}
+
+    def slowest_steps(self, days: float = 30, limit: int = 10) -> List[Dict[str, Any]]:
+        #commands by average duration (steps that actually ran)
+        since = time.time() - days * 86400
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT steps.command, COUNT(*), AVG(steps.duration), MAX(steps.duration), "
+                "SUM(1 - steps.success) FROM steps JOIN runs ON runs.id = steps.run_id "
+                "WHERE runs.created_at >= ? AND steps.skipped = 0 AND steps.kind != 'write_file' "
+                "GROUP BY steps.command ORDER BY AVG(steps.duration) DESC LIMIT ?", (since, limit)).fetchall()
+        return [{"command": command, "runs": count, "average_seconds": average, "max_seconds": longest,
+                 "failures": failures} for command, count, average, longest, failures in rows]
+
+    def failure_classes(self, days: float = 30, limit: int = 10) -> List[Dict[str, Any]]:
+        #failure classes with their most recent example error
+        since = time.time() - days * 86400
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT failure_class, COUNT(*), "
+                "(SELECT error FROM runs AS latest WHERE latest.failure_class = runs.failure_class "
+                "AND latest.created_at >= ? ORDER BY latest.created_at DESC LIMIT 1) "
+                "FROM runs WHERE success = 0 AND created_at >= ? GROUP BY failure_class "
+                "ORDER BY COUNT(*) DESC LIMIT ?", (since, since, limit)).fetchall()
+        return [{"failure_class": name, "runs": count, "example": example} for name, count, example in rows]
+
+    def command_outcomes(self, commands: List[str]) -> Dict[str, tuple]:
+        #{command: (runs, failures)} over the recorded executions of each command (skipped steps excluded)
+        commands = list(dict.fromkeys(commands))
+        if not commands:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT command, COUNT(*), SUM(1 - success) FROM steps WHERE skipped = 0 "
+                f"AND command IN ({', '.join('?' * len(commands))}) GROUP BY command", commands).fetchall()
+        return {command: (runs, failures) for command, runs, failures in rows}
+
+    def successful_plans_version(self) -> tuple:
+
+        # changes when successful_plans() would: a new successful run, or feedback rejecting one
+        # lets derived indexes know when to rebuild (failed runs and other feedback leave it alone)
+
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT (SELECT COALESCE(MAX(id), 0) FROM runs WHERE {SUCCESSFUL_RUN}), "
+                "(SELECT COALESCE(MAX(feedback.id), 0) FROM feedback JOIN runs ON runs.task = feedback.task "
+                "AND runs.plan = feedback.plan AND feedback.created_at >= runs.created_at "
+                "WHERE runs.success = 1)").fetchone()
+
+    def successful_plans(self, limit: int = 1000) -> List[tuple]:
+
+        # [(task, plan)] of runs in which every step succeeded and that no later feedback rejected,
+        # most recent first, one per task
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT task, plan FROM runs WHERE {SUCCESSFUL_RUN} ORDER BY id DESC LIMIT ?",
+                (limit * 2,)).fetchall()
+
+        seen, plans = set(), []
+        for task, plan in rows:
+            key = " ".join(task.lower().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            plans.append((task, json.loads(plan)))
+            if len(plans) >= limit:
+                break
+        return plans
+
+    def clear(self):
+        self.flush()
+        with self._connect() as conn:
+            for table in ("runs", "steps", "feedback"):
+                conn.execute(f"DELETE FROM {table}")
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+def get_history_store() -> Optional[HistoryStore]:
+
+    # returns the shared history store, or None when HISTORY_ENABLED is False
+
+    global _store
+
+    if os.getenv("HISTORY_ENABLED", "True").lower() != "true":
+        return None
+
+    path = os.path.expanduser(os.getenv("HISTORY_PATH", "~/.cache/ai-task-agent/history.db"))
+
+    with _store_lock:
+        if _store is None or _store.path != path:
+            try:
+                _store = HistoryStore(path)
+            except sqlite3.Error as e:
+                logger.warning(f"Run history disabled, cannot open {path}: {str(e)}")
+                return None
+        return _store
+
+def record_run(task, plan, plan_result, mode="interactive", round_number=0):
+    #no-op when history is disabled
+    store = get_history_store()
+    if store is not None:
+        store.record_run(task, plan, plan_result, mode=mode, round_number=round_number)
+
+def record_feedback(task, plan, feedback, output=None):
+    store = get_history_store()
+    if store is not None:
+        store.record_feedback(task, plan, feedback, output)
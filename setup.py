@@ -13,6 +13,11 @@ setup(
         "openai",
         "requests",
     ],
+    extras_require={
+        "local": ["llama-cpp-python"],
+        "msgpack": ["msgpack"],
+        "retrieval": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "ai-task=cli.main:cli",